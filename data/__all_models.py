@@ -1 +1 @@
-from . import users, articles, comments, likes, images
\ No newline at end of file
+from . import users, articles, comments, likes, images, article_scores
\ No newline at end of file
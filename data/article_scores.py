@@ -0,0 +1,67 @@
+"""Материализованная оценка "горячести" статей для ленты sorted_by=hot. Оценка зависит
+от лайков, комментариев и возраста статьи и хранится в отдельной таблице с индексами
+(hot_score, article_id) и (author, hot_score, article_id), поэтому страница ленты
+читается по индексу без вычисления оценок. Оценка статьи пересчитывается в транзакции,
+изменяющей её счётчики, а оценки всех статей со временем уменьшаются командой
+manage.py decay_hot_scores, которую нужно выполнять периодически (например, из cron)"""
+
+from datetime import datetime
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+from .articles import Article
+from tools.constants import HOT_COMMENT_WEIGHT, HOT_GRAVITY, HOT_WINDOW_DAYS
+
+
+class ArticleScore(SqlAlchemyBase):
+    __tablename__ = "article_scores"
+    __table_args__ = (  # Индексы ленты sorted_by=hot и страницы пользователя
+        sqlalchemy.Index("ix_article_scores_hot_score", "hot_score", "article_id"),
+        sqlalchemy.Index("ix_article_scores_author_hot_score", "author", "hot_score", "article_id")
+    )
+    # Атрибут называется id, как и у Article: ключ сортировки (hot_score, id) читается
+    # курсором и из строк запроса, и из объектов Article
+    id = sqlalchemy.Column("article_id", sqlalchemy.Integer,
+                           sqlalchemy.ForeignKey("articles.id", ondelete="CASCADE"),
+                           primary_key=True, autoincrement=False)
+    author = sqlalchemy.Column(sqlalchemy.Integer)  # Копия Article.author
+    hot_score = sqlalchemy.Column(sqlalchemy.Float, nullable=False, default=0)
+
+
+def hot_score(likes_count, comments_count, age_days):
+    """Оценка статьи (функция SQLite hot_score, регистрируется при подключении к базе)"""
+    if age_days is None or age_days > HOT_WINDOW_DAYS:
+        return 0.0
+    points = (likes_count or 0) + HOT_COMMENT_WEIGHT * (comments_count or 0) + 1
+    return points / (max(age_days, 0) * 24 + 2) ** HOT_GRAVITY
+
+
+def _score_expression(now):
+    age_days = sqlalchemy.func.julianday(now) - sqlalchemy.func.julianday(Article.create_date)
+    return sqlalchemy.func.hot_score(Article.likes_count, Article.comments_count, age_days,
+                                     type_=sqlalchemy.Float)
+
+
+def refresh_scores(db_sess, article_ids):
+    """Пересчёт оценок статей (article_ids - список или подзапрос с id) по их текущим
+    счётчикам. Вызывается в транзакции, изменяющей счётчики, после их изменения"""
+    db_sess.flush()
+    db_sess.execute(sqlalchemy.insert(ArticleScore).prefix_with("OR REPLACE").from_select(
+        ("article_id", "author", "hot_score"),
+        sqlalchemy.select(Article.id, Article.author, _score_expression(datetime.now())).where(
+            Article.id.in_(article_ids)
+        )
+    ))
+
+
+def decay_scores(db_sess):
+    """Пересчёт оценок всех статей с ненулевой оценкой на текущий момент (статьи старше
+    HOT_WINDOW_DAYS получают оценку 0 и больше не пересчитываются). Возвращает число
+    пересчитанных статей. Коммит выполняет вызывающий код"""
+    score = sqlalchemy.select(_score_expression(datetime.now())).where(
+        Article.id == ArticleScore.id
+    ).scalar_subquery()
+    return db_sess.execute(
+        sqlalchemy.update(ArticleScore).where(ArticleScore.hot_score > 0).values(
+            hot_score=sqlalchemy.func.coalesce(score, 0)
+        ).execution_options(synchronize_session=False)
+    ).rowcount
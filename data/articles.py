@@ -7,6 +7,13 @@ from .db_session import SqlAlchemyBase
 
 class Article(SqlAlchemyBase, SerializerMixin):
     __tablename__ = "articles"
+    __table_args__ = (  # Индексы ленты (сортировки sorted_by) и страницы пользователя
+        sqlalchemy.Index("ix_articles_create_date", "create_date"),
+        sqlalchemy.Index("ix_articles_likes_count_create_date", "likes_count", "create_date"),
+        sqlalchemy.Index("ix_articles_author_create_date", "author", "create_date"),
+        sqlalchemy.Index("ix_articles_author_likes_count_create_date",
+                         "author", "likes_count", "create_date")
+    )
     serialize_rules = ("-comments", "-likes", "-user")
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     author = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id",
@@ -16,9 +23,15 @@ class Article(SqlAlchemyBase, SerializerMixin):
     create_date = sqlalchemy.Column(sqlalchemy.DateTime, default=datetime.now)
     image = sqlalchemy.Column(sqlalchemy.String(256))
     likes_count = sqlalchemy.Column(sqlalchemy.Integer, default=0)
+    comments_count = sqlalchemy.Column(sqlalchemy.Integer, default=0, server_default="0",
+                                       nullable=False)  # Поддерживается CommentModelWorker
     user = orm.relation("User")
     comments = orm.relation("Comment", back_populates="article", cascade="all,delete-orphan")
     likes = orm.relation("ArticleLike", back_populates="article", cascade="all,delete-orphan")
+    # Вычисляемые поля, заполняются только запросом ленты (ArticleModelWorker.get_feed)
+    is_liked = orm.query_expression()
+    content_preview = orm.query_expression()  # Начало content, достаточное для article_card
+    hot_score = orm.query_expression()  # Оценка из article_scores (лента sorted_by=hot)
 
     def user_can_delete(self, user):
         if self.user == user:
@@ -7,6 +7,11 @@ from .db_session import SqlAlchemyBase
 
 class Comment(SqlAlchemyBase, SerializerMixin):
     __tablename__ = "comments"
+    __table_args__ = (
+        sqlalchemy.Index("ix_comments_article_id_create_date", "article_id", "create_date"),
+        sqlalchemy.Index("ix_comments_author", "author"),
+        sqlalchemy.Index("ix_comments_create_date", "create_date")
+    )
     serialize_rules = ("-user", "-article")
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True, unique=True)
     author = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id",
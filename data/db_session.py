@@ -1,27 +1,146 @@
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
 import sqlalchemy.ext.declarative as dec
+from flask import g, has_app_context
+from tools.constants import WRITE_BATCH_MAX_SIZE, WRITE_BATCH_MAX_DELAY, DB_POOL_SIZE, \
+    DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+from .write_coordinator import WriteCoordinator
 
 SqlAlchemyBase = dec.declarative_base()
 
 __factory = None
+__engine = None
+__coordinator = None
 
+SQLITE_PRAGMAS = {  # Выполняются при открытии каждого соединения с базой данных
+    "journal_mode": "WAL",  # Чтение не блокируется записью
+    "synchronous": "NORMAL",  # В режиме WAL fsync выполняется только при checkpoint
+    "busy_timeout": 5000,  # Ожидание блокировки записи (в мс) вместо ошибки "database is locked"
+    "mmap_size": 256 * 1024 * 1024
+}
 
-def global_init(db_file):
-    global __factory
+
+def global_init(db_file, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE, pragmas=None,
+                write_coordinator=False):
+    """Подключение к базе данных. При write_coordinator=True операции записи (write)
+    выполняются одним потоком с групповыми коммитами (см. data.write_coordinator)"""
+    global __factory, __engine, __coordinator
     if __factory:
         return
     if not db_file or not db_file.strip():
         raise Exception("Необходимо указать файл базы данных.")
     conn_str = f'sqlite:///{db_file.strip()}?check_same_thread=False'
     print(f"Подключение к базе данных по адресу {conn_str}")
-    engine = sa.create_engine(conn_str, echo=False)
+    engine = sa.create_engine(conn_str, echo=False, poolclass=QueuePool,
+                              pool_size=pool_size, max_overflow=max_overflow,
+                              pool_timeout=pool_timeout, pool_recycle=pool_recycle)
+    connection_pragmas = {**SQLITE_PRAGMAS, **(pragmas or {})}
+    from .article_scores import hot_score
+
+    @sa.event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in connection_pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+        dbapi_connection.create_function("hot_score", 3, hot_score, deterministic=True)
+
+    __engine = engine
     __factory = orm.sessionmaker(bind=engine)
+    sa.event.listen(__factory, "after_commit", _run_after_commit)
+    sa.event.listen(__factory, "after_rollback", _run_after_rollback)
+    if write_coordinator:
+        __coordinator = WriteCoordinator(__factory, WRITE_BATCH_MAX_SIZE, WRITE_BATCH_MAX_DELAY)
     from . import __all_models
+    from . import migrations, search
+    is_new_database = not sa.inspect(engine).has_table("users")
     SqlAlchemyBase.metadata.create_all(engine)
+    if is_new_database:  # Новая база создаётся сразу в актуальной схеме
+        with engine.begin() as connection:
+            search.create_search_tables(connection)
+        migrations.set_version(engine, migrations.LATEST_VERSION)
+    elif migrations.get_version(engine) < migrations.LATEST_VERSION:
+        print("Схема базы данных устарела, выполните python manage.py migrate")
+
+
+def get_engine():
+    global __engine
+    return __engine
 
 
 def create_session() -> Session:
+    """Сессия текущего запроса (общая для всех ModelWorker и закрываемая в remove_session).
+    Вне контекста приложения (например, в manage.py) создаётся новая сессия"""
     global __factory
-    return __factory()
+    if not has_app_context():
+        return __factory()
+    if "db_session" not in g:
+        g.db_session = __factory()
+    return g.db_session
+
+
+def remove_session(exception=None):
+    """Закрытие сессии текущего запроса (регистрируется через app.teardown_appcontext)"""
+    db_sess = g.pop("db_session", None)
+    if db_sess is not None:
+        db_sess.close()
+
+
+def write(operation):
+    """Выполнение операции записи operation(db_sess) и коммит. Операция не вызывает
+    commit и rollback сама (ошибка сообщается исключением, изменения отменяются)
+    и возвращает значения, не связанные с сессией. В режиме координатора записи
+    операция выполняется потоком записи в общей транзакции с другими операциями"""
+    if __coordinator is None:
+        db_sess = create_session()
+        try:
+            result = operation(db_sess)
+            db_sess.commit()
+        except BaseException:
+            db_sess.rollback()
+            raise
+        return result
+    result = __coordinator.submit(operation).result()
+    if has_app_context() and "db_session" in g:
+        g.db_session.expire_all()  # Загруженные сессией запроса объекты могли измениться
+    return result
+
+
+def write_stats():
+    """Статистика координатора записи (None, если он не используется)"""
+    return __coordinator.stats() if __coordinator is not None else None
+
+
+def after_commit(db_sess, callback):
+    """Регистрация действия (например, удаления файлов), которое выполнится
+    только после успешного коммита текущей транзакции сессии"""
+    db_sess.info.setdefault("after_commit", []).append(callback)
+
+
+def after_rollback(db_sess, callback):
+    """Регистрация действия (например, удаления временных файлов), которое выполнится,
+    если текущая транзакция сессии будет отменена"""
+    db_sess.info.setdefault("after_rollback", []).append(callback)
+
+
+def _run_after_commit(db_sess):
+    # События after_commit и after_rollback возникают и для точек сохранения
+    # (begin_nested, см. data.write_coordinator): действия выполняются только
+    # после коммита всей транзакции, а действия отменённой операции координатор
+    # записи выполняет или убирает сам
+    if db_sess.in_nested_transaction():
+        return
+    db_sess.info.pop("after_rollback", None)
+    for callback in db_sess.info.pop("after_commit", []):
+        callback()
+
+
+def _run_after_rollback(db_sess):
+    if db_sess.in_nested_transaction():
+        return
+    db_sess.info.pop("after_commit", None)
+    for callback in db_sess.info.pop("after_rollback", []):
+        callback()
@@ -6,25 +6,42 @@ image_to_user = sqlalchemy.Table(
     "image_to_user",
     SqlAlchemyBase.metadata,
     sqlalchemy.Column("user", sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id")),
-    sqlalchemy.Column("image", sqlalchemy.Integer, sqlalchemy.ForeignKey("images.id"))
+    sqlalchemy.Column("image", sqlalchemy.Integer, sqlalchemy.ForeignKey("images.id")),
+    sqlalchemy.Index("ix_image_to_user_user", "user"),
+    sqlalchemy.Index("ix_image_to_user_image", "image")
 )
 
 image_to_article = sqlalchemy.Table(
     "image_to_article",
     SqlAlchemyBase.metadata,
     sqlalchemy.Column("article", sqlalchemy.Integer, sqlalchemy.ForeignKey("articles.id")),
-    sqlalchemy.Column("image", sqlalchemy.Integer, sqlalchemy.ForeignKey("images.id"))
+    sqlalchemy.Column("image", sqlalchemy.Integer, sqlalchemy.ForeignKey("images.id")),
+    sqlalchemy.Index("ix_image_to_article_article", "article"),
+    sqlalchemy.Index("ix_image_to_article_image", "image")
 )
 
 image_to_comment = sqlalchemy.Table(
     "image_to_comment",
     SqlAlchemyBase.metadata,
     sqlalchemy.Column("comment", sqlalchemy.Integer, sqlalchemy.ForeignKey("comments.id")),
-    sqlalchemy.Column("image", sqlalchemy.Integer, sqlalchemy.ForeignKey("images.id"))
+    sqlalchemy.Column("image", sqlalchemy.Integer, sqlalchemy.ForeignKey("images.id")),
+    sqlalchemy.Index("ix_image_to_comment_comment", "comment"),
+    sqlalchemy.Index("ix_image_to_comment_image", "image")
 )
 
 
 class Image(SqlAlchemyBase):
     __tablename__ = "images"
+    __table_args__ = (
+        sqlalchemy.Index("ix_images_kind_filename", "kind", "filename", unique=True),
+        sqlalchemy.Index("ix_images_kind_hash", "kind", "hash", unique=True),
+    )
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    filename = sqlalchemy.Column(sqlalchemy.String(256), nullable=False)
+    filename = sqlalchemy.Column(sqlalchemy.String(256), nullable=False)  # Путь основного
+    # файла относительно каталога раздела (ab/cd/<hash>.webp, у старых изображений - имя файла)
+    kind = sqlalchemy.Column(sqlalchemy.String(16), nullable=True)  # Раздел (IMAGES_DIRS)
+    status = sqlalchemy.Column(sqlalchemy.String(16), default="ready", server_default="ready",
+                               nullable=False)  # pending, ready или failed
+    hash = sqlalchemy.Column(sqlalchemy.String(64), nullable=True)  # sha256 загруженного файла
+    ref_count = sqlalchemy.Column(sqlalchemy.Integer, default=0, server_default="0",
+                                  nullable=False)  # Количество ссылок из image_to_* таблиц
@@ -6,6 +6,11 @@ from .db_session import SqlAlchemyBase
 
 class ArticleLike(SqlAlchemyBase, SerializerMixin):
     __tablename__ = "articles_likes"
+    __table_args__ = (
+        # Один лайк от пользователя на статью, используется при INSERT OR IGNORE
+        sqlalchemy.Index("ix_articles_likes_user_article", "user_id", "article_id", unique=True),
+        sqlalchemy.Index("ix_articles_likes_article_id", "article_id")
+    )
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True, unique=True)
     user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey(
         "users.id", ondelete="CASCADE"
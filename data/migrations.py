@@ -0,0 +1,144 @@
+"""Версионные миграции существующей базы данных (python manage.py migrate).
+Версия хранится в PRAGMA user_version. Каждый запрос выполняется в отдельной
+короткой транзакции, а в режиме WAL чтение не блокируется на время построения
+индексов, поэтому миграции можно применять к работающему сайту"""
+
+import sqlalchemy as sa
+from .search import ARTICLES_FTS, COMMENTS_FTS, USERS_NICKNAME_FTS
+
+MIGRATIONS = [
+    (1, "Индексы ленты, страницы пользователя, комментариев и лайков", [
+        # Дубликаты лайков мешают построить уникальный индекс: сначала убираем их из
+        # счётчиков likes_count, затем удаляем сами записи
+        """UPDATE articles SET likes_count = likes_count - (
+               SELECT COUNT(*) - COUNT(DISTINCT user_id) FROM articles_likes
+               WHERE articles_likes.article_id = articles.id
+           ) WHERE id IN (
+               SELECT article_id FROM articles_likes
+               GROUP BY user_id, article_id HAVING COUNT(*) > 1
+           )""",
+        """DELETE FROM articles_likes WHERE id NOT IN (
+               SELECT MIN(id) FROM articles_likes GROUP BY user_id, article_id
+           )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_articles_likes_user_article "
+        "ON articles_likes (user_id, article_id)",
+        "CREATE INDEX IF NOT EXISTS ix_articles_likes_article_id ON articles_likes (article_id)",
+        "CREATE INDEX IF NOT EXISTS ix_articles_create_date ON articles (create_date)",
+        "CREATE INDEX IF NOT EXISTS ix_articles_likes_count_create_date "
+        "ON articles (likes_count, create_date)",
+        "CREATE INDEX IF NOT EXISTS ix_articles_author_create_date "
+        "ON articles (author, create_date)",
+        "CREATE INDEX IF NOT EXISTS ix_articles_author_likes_count_create_date "
+        "ON articles (author, likes_count, create_date)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_article_id_create_date "
+        "ON comments (article_id, create_date)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_author ON comments (author)",
+        # Статистика для планировщика запросов (по выборке, чтобы не сканировать таблицы)
+        "PRAGMA analysis_limit = 1000",
+        "ANALYZE"
+    ]),
+    (2, "Индекс комментариев по дате создания", [
+        "CREATE INDEX IF NOT EXISTS ix_comments_create_date ON comments (create_date)"
+    ]),
+    (3, "Счётчики comments_count статей и articles_count пользователей", [
+        "ALTER TABLE articles ADD COLUMN comments_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN articles_count INTEGER NOT NULL DEFAULT 0",
+        """UPDATE articles SET comments_count = (
+               SELECT COUNT(*) FROM comments WHERE comments.article_id = articles.id
+           ) WHERE id IN (SELECT article_id FROM comments)""",
+        """UPDATE users SET articles_count = (
+               SELECT COUNT(*) FROM articles WHERE articles.author = users.id
+           ) WHERE id IN (SELECT author FROM articles)"""
+    ]),
+    (4, "Состояние обработки загруженных изображений", [
+        "ALTER TABLE images ADD COLUMN kind VARCHAR(16)",
+        "ALTER TABLE images ADD COLUMN status VARCHAR(16) NOT NULL DEFAULT 'ready'",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_images_filename ON images (filename)"
+    ]),
+    (5, "Хранилище изображений с адресацией по хэшу и счётчиками ссылок", [
+        "ALTER TABLE images ADD COLUMN hash VARCHAR(64)",
+        "ALTER TABLE images ADD COLUMN ref_count INTEGER NOT NULL DEFAULT 0",
+        "DROP INDEX IF EXISTS ix_images_filename",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_images_kind_filename ON images (kind, filename)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_images_kind_hash ON images (kind, hash)",
+        "CREATE INDEX IF NOT EXISTS ix_image_to_article_article ON image_to_article (article)",
+        "CREATE INDEX IF NOT EXISTS ix_image_to_article_image ON image_to_article (image)",
+        "CREATE INDEX IF NOT EXISTS ix_image_to_comment_comment ON image_to_comment (comment)",
+        "CREATE INDEX IF NOT EXISTS ix_image_to_comment_image ON image_to_comment (image)",
+        "CREATE INDEX IF NOT EXISTS ix_image_to_user_user ON image_to_user (user)",
+        "CREATE INDEX IF NOT EXISTS ix_image_to_user_image ON image_to_user (image)",
+        # Записи для изображений, загруженных до появления хранилища
+        """INSERT INTO images (filename, kind, status) SELECT DISTINCT image, 'articles', 'ready'
+           FROM articles WHERE image IS NOT NULL AND NOT EXISTS (
+               SELECT 1 FROM images WHERE kind = 'articles' AND filename = articles.image
+           )""",
+        """INSERT INTO images (filename, kind, status) SELECT DISTINCT image, 'comments', 'ready'
+           FROM comments WHERE image IS NOT NULL AND NOT EXISTS (
+               SELECT 1 FROM images WHERE kind = 'comments' AND filename = comments.image
+           )""",
+        """INSERT INTO images (filename, kind, status) SELECT DISTINCT avatar, 'avatars', 'ready'
+           FROM users WHERE avatar IS NOT NULL AND NOT EXISTS (
+               SELECT 1 FROM images WHERE kind = 'avatars' AND filename = users.avatar
+           )""",
+        """INSERT INTO image_to_article (article, image) SELECT articles.id, images.id
+           FROM articles JOIN images ON images.kind = 'articles' AND images.filename = articles.image""",
+        """INSERT INTO image_to_comment (comment, image) SELECT comments.id, images.id
+           FROM comments JOIN images ON images.kind = 'comments' AND images.filename = comments.image""",
+        """INSERT INTO image_to_user (user, image) SELECT users.id, images.id
+           FROM users JOIN images ON images.kind = 'avatars' AND images.filename = users.avatar""",
+        """UPDATE images SET ref_count =
+               (SELECT COUNT(*) FROM image_to_article WHERE image_to_article.image = images.id)
+               + (SELECT COUNT(*) FROM image_to_comment WHERE image_to_comment.image = images.id)
+               + (SELECT COUNT(*) FROM image_to_user WHERE image_to_user.image = images.id)"""
+    ]),
+    (6, "Полнотекстовый поиск по статьям и комментариям", [
+        ARTICLES_FTS,
+        COMMENTS_FTS,
+        "INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')",
+        "INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')"
+    ]),
+    (7, "Индексы поиска пользователей по никнейму", [
+        "CREATE INDEX IF NOT EXISTS ix_users_nickname_nocase ON users (nickname COLLATE NOCASE)",
+        USERS_NICKNAME_FTS,
+        "INSERT INTO users_nickname_fts (users_nickname_fts) VALUES ('rebuild')"
+    ]),
+    # Таблица article_scores и её индексы создаются при подключении к базе (create_all),
+    # функция hot_score регистрируется для каждого соединения (см. data.article_scores)
+    (8, "Оценки статей для ленты sorted_by=hot", [
+        """INSERT OR REPLACE INTO article_scores (article_id, author, hot_score)
+           SELECT id, author, hot_score(likes_count, comments_count,
+                                        julianday('now', 'localtime') - julianday(create_date))
+           FROM articles"""
+    ])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(engine):
+    """Текущая версия схемы базы данных"""
+    with engine.connect() as connection:
+        return connection.execute(sa.text("PRAGMA user_version")).scalar()
+
+
+def set_version(engine, version):
+    """Запись версии схемы базы данных"""
+    with engine.begin() as connection:
+        connection.execute(sa.text(f"PRAGMA user_version = {int(version)}"))
+
+
+def migrate(engine, log=print):
+    """Применение всех миграций новее текущей версии базы данных.
+    Возвращает список применённых версий"""
+    applied = []
+    version = get_version(engine)
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        log(f"Миграция {migration_version}: {description}")
+        for statement in statements:
+            with engine.begin() as connection:
+                connection.execute(sa.text(statement))
+        set_version(engine, migration_version)
+        applied.append(migration_version)
+    return applied
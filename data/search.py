@@ -0,0 +1,40 @@
+"""Полнотекстовые индексы статей, комментариев и никнеймов (виртуальные таблицы SQLite FTS5).
+Индексы хранят только токены, сам текст читается из таблиц articles и comments
+(external content), поэтому при изменении записи её старый текст нужно удалить
+из индекса до изменения, а новый - добавить после"""
+
+import sqlalchemy as sa
+
+# unicode61 приводит к нижнему регистру и кириллицу, remove_diacritics 2 убирает диакритику
+# латиницы. Префиксные индексы ускоряют поиск по началу слова из 2-3 символов
+_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+ARTICLES_FTS = "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(" \
+    f"title, content, content = 'articles', content_rowid = 'id', {_OPTIONS})"
+COMMENTS_FTS = "CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(" \
+    f"text, content = 'comments', content_rowid = 'id', {_OPTIONS})"
+# Индекс триграмм никнеймов: поиск подстроки (от 3 символов) без учёта регистра
+USERS_NICKNAME_FTS = "CREATE VIRTUAL TABLE IF NOT EXISTS users_nickname_fts USING fts5(" \
+    "nickname, content = 'users', content_rowid = 'id', tokenize = 'trigram')"
+
+SEARCH_TABLES = [ARTICLES_FTS, COMMENTS_FTS, USERS_NICKNAME_FTS]
+
+# Столбец с именем таблицы служит для служебных команд FTS5 ('delete', 'rebuild')
+articles_fts = sa.table(
+    "articles_fts",
+    sa.column("articles_fts"), sa.column("rowid"), sa.column("title"), sa.column("content")
+)
+comments_fts = sa.table(
+    "comments_fts",
+    sa.column("comments_fts"), sa.column("rowid"), sa.column("text")
+)
+users_nickname_fts = sa.table(
+    "users_nickname_fts",
+    sa.column("users_nickname_fts"), sa.column("rowid"), sa.column("nickname")
+)
+
+
+def create_search_tables(connection):
+    """Создание полнотекстовых индексов (новая база создаётся без миграций)"""
+    for statement in SEARCH_TABLES:
+        connection.execute(sa.text(statement))
@@ -2,13 +2,16 @@ from datetime import datetime
 import sqlalchemy
 from sqlalchemy import orm
 from sqlalchemy_serializer import SerializerMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from tools import password_hashing
 from .db_session import SqlAlchemyBase
 
 
 class User(SqlAlchemyBase, UserMixin, SerializerMixin):
     __tablename__ = "users"
+    __table_args__ = (  # Поиск по никнейму без учёта регистра (равенство и начало)
+        sqlalchemy.Index("ix_users_nickname_nocase", sqlalchemy.text("nickname COLLATE NOCASE")),
+    )
     serialize_rules = ("-articles", "-comments", "-likes")
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     surname = sqlalchemy.Column(sqlalchemy.String(64))
@@ -22,15 +25,17 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
     is_moderator = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
     is_admin = sqlalchemy.Column(sqlalchemy.Boolean, default=False)  # Администратор наделён
     # правами модератора независимо от значения поля is_moderator
+    articles_count = sqlalchemy.Column(sqlalchemy.Integer, default=0, server_default="0",
+                                       nullable=False)  # Поддерживается ArticleModelWorker
     articles = orm.relation("Article", back_populates="user", cascade="all,delete-orphan")
     comments = orm.relation("Comment", back_populates="user", cascade="all,delete-orphan")
     likes = orm.relation("ArticleLike", back_populates="user", cascade="all,delete-orphan")
 
     def set_password(self, password):
-        self.hashed_password = generate_password_hash(password)
+        self.hashed_password = password_hashing.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.hashed_password, password)
+        return password_hashing.verify_password(self.hashed_password, password)
 
     def __repr__(self):
         return f"<User #{self.id}> {self.name} {self.surname} @{self.nickname} {self.email}"
@@ -0,0 +1,118 @@
+"""Координатор записи: операции записи выполняются одним потоком, который объединяет
+операции из очереди в групповые коммиты. SQLite допускает только одну пишущую
+транзакцию, поэтому при одновременной записи из потоков запросов они ждут блокировку
+(или получают "database is locked"), а каждая транзакция завершается отдельной
+записью в журнал. Поток записи выполняет каждую операцию в своей точке сохранения
+(SAVEPOINT): ошибка одной операции не отменяет остальные операции группы"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteCoordinator:
+    """Очередь операций записи и поток, выполняющий их группами не более max_batch_size
+    операций. Группа собирается не дольше max_delay секунд с момента получения первой
+    операции. Поток создаётся при первой операции (заново после fork)"""
+    def __init__(self, session_factory, max_batch_size, max_delay):
+        self.session_factory = session_factory
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._metrics = [0, 0, 0, 0]  # batches, operations, failed, max_batch
+
+    def submit(self, operation):
+        """Постановка операции operation(db_sess) в очередь. Возвращает Future
+        с результатом операции (или её исключением) после коммита группы"""
+        future = Future()
+        self._get_queue().put((operation, future))
+        return future
+
+    def _get_queue(self):
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name="db_writer",
+                                 daemon=True).start()
+            return self._queue
+
+    def _run(self, operations):
+        while True:
+            batch = [operations.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(operations.get(timeout=timeout) if timeout > 0
+                                 else operations.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        """Выполнение группы операций в одной транзакции. Результаты передаются
+        в Future только после коммита, при ошибке коммита - ошибка всем операциям"""
+        db_sess = self.session_factory()
+        done = []
+        failed = 0
+        try:
+            # Блокировка записи берётся сразу: операции группы не ждут её по отдельности
+            db_sess.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                callbacks = db_sess.info.setdefault("after_commit", [])
+                rollback_callbacks = db_sess.info.setdefault("after_rollback", [])
+                callbacks_count, rollback_callbacks_count = len(callbacks), len(rollback_callbacks)
+                savepoint = db_sess.begin_nested()
+                try:
+                    result = operation(db_sess)
+                    savepoint.commit()
+                except BaseException as error:
+                    if savepoint.is_active:
+                        savepoint.rollback()
+                    # Действия отменённой операции: после коммита - отменяются,
+                    # после отмены - выполняются сразу
+                    del callbacks[callbacks_count:]
+                    for callback in rollback_callbacks[rollback_callbacks_count:]:
+                        callback()
+                    del rollback_callbacks[rollback_callbacks_count:]
+                    future.set_exception(error)
+                    failed += 1
+                else:
+                    done.append((future, result))
+            db_sess.commit()
+        except BaseException as error:
+            db_sess.rollback()
+            for operation, future in batch:  # В том числе выполненные и не начатые
+                if not future.done():
+                    future.set_exception(error)
+                    failed += 1
+        else:
+            for future, result in done:
+                future.set_result(result)
+        finally:
+            db_sess.close()
+            with self._lock:
+                self._metrics[0] += 1
+                self._metrics[1] += len(batch)
+                self._metrics[2] += failed
+                self._metrics[3] = max(self._metrics[3], len(batch))
+
+    def stats(self):
+        """Количество групп и операций, неудавшиеся операции, средний и наибольший
+        размер группы"""
+        with self._lock:
+            batches, operations, failed, max_batch = self._metrics
+        return {
+            "batches": batches,
+            "operations": operations,
+            "failed": failed,
+            "avg_batch": round(operations / batches, 2) if batches else None,
+            "max_batch": max_batch
+        }
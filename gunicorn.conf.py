@@ -0,0 +1,34 @@
+"""Настройки gunicorn для одного сервера: воркеры по числу ядер процессора, в каждом
+несколько потоков (gthread). Параметры можно изменить переменными окружения"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+# Потоки обслуживают запросы, ожидающие ввода-вывода и блокировки записи SQLite
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+# Приложение загружается в главном процессе до fork: воркеры запускаются быстрее
+# и разделяют память с загруженным кодом. Подключение к базе данных - в post_fork
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_fork(server, worker):
+    """Подключение к базе данных в воркере: пул соединений и потоки записи
+    (координатор записи, tools.likes_buffer) у каждого процесса свои. Кэши процессов
+    тоже свои, поэтому при нескольких воркерах время жизни записей в кэшах объектов
+    и пользователей сокращается (MULTIPROCESS_CACHE_TTL)"""
+    from main import init_process
+    app = server.app.wsgi()  # Загруженное до fork (preload_app) или сейчас приложение
+    app.config["PROCESSES"] = server.cfg.workers
+    init_process(app)
+
+
+def worker_exit(server, worker):
+    """Запись изменений счётчиков лайков, накопленных воркером"""
+    from tools.likes_buffer import likes_buffer
+    likes_buffer.flush()
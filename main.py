@@ -1,4 +1,6 @@
-from flask import Flask, render_template, redirect, request, make_response, abort, session
+from urllib.parse import urlencode
+from flask import Blueprint, Flask, render_template, redirect, request, make_response, abort, \
+    session
 from flask_login import LoginManager, logout_user, login_required, current_user
 from flask_restful import Api
 
@@ -13,40 +15,69 @@ from model_workers.article import ArticleModelWorker
 from model_workers.article_like import ArticleLikeModelWorker
 from model_workers.comment import CommentModelWorker
 from model_workers.user import UserModelWorker
+from parsers import search_parser
+from parsers.cursor import parser as cursor_parser
 from parsers.redirect_url import parser as redirect_url_parser
 from parsers.sorted_by import parser as sorted_by_parser
-from resources.article_likes import ArticleLikeResource
-from resources.articles import ArticleResource, ArticlesListResource
-from resources.comments import CommentResource, CommentsListResource
+from resources.article_likes import ArticleLikeResource, ArticleLikeToggleResource, \
+    ArticleLikesBatchResource
+from resources.articles import ArticleResource, ArticlesListResource, ArticlesBatchResource, \
+    ArticleImageResource
+from resources.cache_stats import CacheStatsResource
+from resources.comments import CommentResource, CommentsListResource, CommentsBatchResource, \
+    CommentImageResource
+from resources.images import ImageResource
+from resources.search import SearchResource
 from resources.users import LoginResource, UserResource, UsersListResource, \
-    LogoutResource, ModeratorResource
+    LogoutResource, ModeratorResource, UsersBatchResource, UserAvatarResource
+from tools.constants import FIND_USERS_PAGE_SIZE, SEARCH_PAGE_SIZE, \
+    PASSWORD_HASHING_RETRY_AFTER, REQUEST_MAX_SIZE, WRITE_COORDINATOR, MULTIPROCESS_CACHE_TTL, \
+    IMAGES_MAX_UPLOAD_SIZE, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+from tools.image_url import image_static_url
+from tools.likes_buffer import likes_buffer
+from tools.object_cache import object_cache
+from tools.page_cache import cached_page
+from tools.principal import principal_cache
 from tools.errors import PasswordMismatchError, EmailAlreadyUseError, \
-    UserAlreadyExistError, IncorrectPasswordError, ArticleNotFoundError, LikeAlreadyThereError, \
+    UserAlreadyExistError, IncorrectPasswordError, ArticleNotFoundError, \
     UserNotFoundError, ForbiddenToUserError, IncorrectNicknameLengthError, \
     NicknameContainsInvalidCharactersError, IncorrectPasswordLengthError, \
-    NotSecurePasswordError, CommentNotFoundError, IncorrectImageError, IncorrectEmailFormatError
-
-app = Flask(__name__)
-api = Api(app)
-app.config["SECRET_KEY"] = "cyberjournal"
+    NotSecurePasswordError, CommentNotFoundError, IncorrectImageError, IncorrectEmailFormatError, \
+    IncorrectCursorError, PasswordHashingBusyError, ImageTooLargeError
+
+IMAGE_TOO_LARGE_MESSAGE = "Размер изображения не должен превышать " \
+    f"{IMAGES_MAX_UPLOAD_SIZE // (1024 * 1024)} МБ"
+
+DEFAULT_CONFIG = {
+    "SECRET_KEY": "cyberjournal",
+    "MAX_CONTENT_LENGTH": REQUEST_MAX_SIZE,  # Больший запрос отклоняется со статусом 413
+    "DATABASE": "db/articles.db",
+    "DATABASE_POOL_SIZE": DB_POOL_SIZE,
+    "DATABASE_MAX_OVERFLOW": DB_MAX_OVERFLOW,
+    "DATABASE_POOL_TIMEOUT": DB_POOL_TIMEOUT,
+    "DATABASE_POOL_RECYCLE": DB_POOL_RECYCLE,
+    "DATABASE_PRAGMAS": None,  # Словарь, дополняющий db_session.SQLITE_PRAGMAS
+    "WRITE_COORDINATOR": WRITE_COORDINATOR,
+    "PROCESSES": 1  # Количество процессов сервера (см. gunicorn.conf.py)
+}
+
+bp = Blueprint("main", __name__)  # Страницы сайта (регистрируются в create_app)
 login_manager = LoginManager()
-login_manager.init_app(app)
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    db_sess = db_session.create_session()
-    return db_sess.query(User).get(user_id)
+    return UserModelWorker.get_principal(int(user_id))
 
 
-@app.route("/logout")
+@bp.route("/logout")
 @login_required
 def logout():
     logout_user()
     return redirect(f"/?sorted_by={session.get('sorted_by', 'create_date')}")
 
 
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     template_name = "register.html"
     title = "Регистрация"
@@ -64,6 +95,8 @@ def register():
                 "description": form.description.data,
                 "avatar": form.avatar.data
             })
+        except PasswordHashingBusyError:  # Очередь хэширования паролей заполнена
+            abort(503)
         except PasswordMismatchError:
             return render_template(template_name,
                                    title=title,
@@ -114,6 +147,13 @@ def register():
                                    message="Пароль должен содержать минимум 1 непробельный символ",
                                    message_class="alert-danger",
                                    sorted_by=sorted_by)
+        except ImageTooLargeError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message=IMAGE_TOO_LARGE_MESSAGE,
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
         except IncorrectImageError:
             return render_template(template_name,
                                    title=title,
@@ -132,7 +172,7 @@ def register():
     return render_template(template_name, title=title, form=form, sorted_by=sorted_by)
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     template_name = "login.html"
     title = "Авторизация"
@@ -145,6 +185,8 @@ def login():
                 "password": form.password.data,
                 "remember_me": form.remember_me.data
             })
+        except PasswordHashingBusyError:  # Очередь хэширования паролей заполнена
+            abort(503)
         except UserNotFoundError:
             return render_template(template_name,
                                    form=form,
@@ -162,7 +204,7 @@ def login():
     return render_template(template_name, title=title, form=form, sorted_by=sorted_by)
 
 
-@app.route("/edit_user", methods=["GET", "POST"])
+@bp.route("/edit_user", methods=["GET", "POST"])
 @login_required
 def edit_user():
     template_name = "edit_user.html"
@@ -190,6 +232,8 @@ def edit_user():
                 "new_password": form.new_password.data,
                 "new_password_again": form.new_password_again.data
             })
+        except PasswordHashingBusyError:  # Очередь хэширования паролей заполнена
+            abort(503)
         except IncorrectPasswordError:
             return render_template(template_name,
                                    title=title,
@@ -247,6 +291,13 @@ def edit_user():
                                    message="Пароль должен содержать минимум 1 непробельный символ",
                                    message_class="alert-danger",
                                    sorted_by=sorted_by)
+        except ImageTooLargeError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message=IMAGE_TOO_LARGE_MESSAGE,
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
         except IncorrectImageError:
             return render_template(template_name,
                                    title=title,
@@ -265,7 +316,7 @@ def edit_user():
     return render_template(template_name, title=title, form=form, sorted_by=sorted_by)
 
 
-@app.route("/delete_user", methods=["GET", "POST"])
+@bp.route("/delete_user", methods=["GET", "POST"])
 @login_required
 def delete_user():
     template_name = "delete_user.html"
@@ -275,6 +326,8 @@ def delete_user():
     if form.validate_on_submit():
         try:
             UserModelWorker.delete_user(current_user.id, form.password.data)
+        except PasswordHashingBusyError:  # Очередь хэширования паролей заполнена
+            abort(503)
         except UserNotFoundError:
             abort(404)
         except IncorrectPasswordError:
@@ -290,7 +343,7 @@ def delete_user():
                            form=form, sorted_by=sorted_by)
 
 
-@app.route("/make_simple_user/<int:user_id>")
+@bp.route("/make_simple_user/<int:user_id>")
 @login_required
 def make_simple_user(user_id):
     try:
@@ -302,7 +355,7 @@ def make_simple_user(user_id):
     return redirect(f"/user_page/{user_id}")
 
 
-@app.route("/make_moderator/<int:user_id>")
+@bp.route("/make_moderator/<int:user_id>")
 @login_required
 def make_moderator(user_id):
     try:
@@ -314,36 +367,46 @@ def make_moderator(user_id):
     return redirect(f"/user_page/{user_id}")
 
 
-@app.route("/user_page/<int:user_id>")
-@app.route("/user_page/<int:user_id>/page<int:page_index>")
+@bp.route("/user_page/<int:user_id>")
+@bp.route("/user_page/<int:user_id>/page<int:page_index>")
+@cached_page(lambda user_id, page_index=1: ("feed", "users"))
 def user_page(user_id, page_index=1):
     args = sorted_by_parser.parse_args()
+    cursor = cursor_parser.parse_args()["cursor"]
     session["sorted_by"] = args["sorted_by"]
     db_sess = db_session.create_session()
     user = db_sess.query(User).get(user_id)
     if not user:
         abort(404)
     articles_count = 10
-    user_articles_count = len(user.articles)
-    max_page_index = max((user_articles_count // articles_count +
-                          (0 if user_articles_count % articles_count == 0 else 1)), 1)
-    if page_index > max_page_index:
+    url = f"/user_page/{user_id}"
+    if cursor is None:  # Номер страницы
+        user_articles_count = user.articles_count
+        max_page_index = max((user_articles_count // articles_count +
+                              (0 if user_articles_count % articles_count == 0 else 1)), 1)
+        if page_index > max_page_index:
+            abort(404)
+        page_url = f"{url}/page{page_index}?sorted_by={args['sorted_by']}"
+    else:  # Курсор: статьи не подсчитываются, OFFSET не используется
+        max_page_index = None
+        page_url = f"{url}?sorted_by={args['sorted_by']}&cursor={cursor}"
+    try:
+        articles, next_cursor = ArticleModelWorker.get_feed(
+            current_user.id if current_user.is_authenticated else None,
+            user_id, args["sorted_by"], articles_count,
+            None if cursor else (page_index - 1) * articles_count, cursor
+        )
+    except IncorrectCursorError:
         abort(404)
-    articles = sorted(
-        user.articles,
-        key=(lambda x: x.create_date)
-        if args["sorted_by"] == "create_date"
-        else (lambda x: (x.likes_count, x.create_date)),
-        reverse=True
-    )[
-               (page_index - 1) * articles_count:page_index * articles_count
-               ]
+    next_page_url = f"{url}?sorted_by={args['sorted_by']}&cursor={next_cursor}" \
+        if next_cursor else None
     return render_template("user_page.html", title=f"@{user.nickname}", user=user,
                            articles_list=articles, page_index=page_index,
-                           max_page_index=max_page_index, sorted_by=session["sorted_by"])
+                           max_page_index=max_page_index, page_url=page_url,
+                           next_page_url=next_page_url, sorted_by=session["sorted_by"])
 
 
-@app.route("/article", methods=["GET", "POST"])
+@bp.route("/article", methods=["GET", "POST"])
 @login_required
 def add_article():
     template_name = "add_article.html"
@@ -351,23 +414,39 @@ def add_article():
     form = ArticleForm()
     sorted_by = session.get("sorted_by", "create_date")
     if form.validate_on_submit():
-        ArticleModelWorker.new_article({
-            "title": form.title.data,
-            "content": form.content.data,
-            "author": current_user.id,
-            "image": form.image.data
-        })
+        try:
+            ArticleModelWorker.new_article({
+                "title": form.title.data,
+                "content": form.content.data,
+                "author": current_user.id,
+                "image": form.image.data
+            })
+        except ImageTooLargeError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message=IMAGE_TOO_LARGE_MESSAGE,
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
+        except IncorrectImageError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message="Не удалось обработать изображение",
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
         return redirect(f"/user_page/{current_user.id}?sorted_by="
                         f"{sorted_by}")
     return render_template(template_name, title=title, form=form, sorted_by=sorted_by)
 
 
-@app.route("/edit_article/<int:article_id>", methods=["GET", "POST"])
+@bp.route("/edit_article/<int:article_id>", methods=["GET", "POST"])
 @login_required
 def edit_article(article_id):
     template_name = "add_article.html"
     title = "Редактировать статью"
     form = ArticleForm()
+    sorted_by = session.get("sorted_by", "create_date")
     try:
         article = ArticleModelWorker.get_article(article_id, ("id", "author", "title", "content"))
     except ArticleNotFoundError:
@@ -388,12 +467,25 @@ def edit_article(article_id):
             abort(404)
         except ForbiddenToUserError:
             abort(403)
+        except ImageTooLargeError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message=IMAGE_TOO_LARGE_MESSAGE,
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
+        except IncorrectImageError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message="Не удалось обработать изображение",
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
         return redirect(f"/article/{article['id']}")
-    sorted_by = session.get("sorted_by", "create_date")
     return render_template(template_name, title=title, form=form, sorted_by=sorted_by)
 
 
-@app.route("/delete_article/<int:article_id>", methods=["GET", "POST"])
+@bp.route("/delete_article/<int:article_id>", methods=["GET", "POST"])
 @login_required
 def delete_article(article_id):
     try:
@@ -406,23 +498,26 @@ def delete_article(article_id):
     return redirect(f"/?sorted_by={sorted_by}")
 
 
-@app.route("/article/<int:article_id>")
+@bp.route("/article/<int:article_id>")
+@cached_page(lambda article_id: (f"article:{article_id}", "users"), session_keys=("sorted_by",))
 def article_page(article_id):
     db_sess = db_session.create_session()
     article = db_sess.query(Article).get(article_id)
     if not article:
         abort(404)
+    likes_buffer.merge(article)
     sorted_by = session.get("sorted_by", "create_date")
     return render_template("article_page.html", title=article.title, article=article,
                            sorted_by=sorted_by)
 
 
-@app.route("/add_comment/<int:article_id>", methods=["GET", "POST"])
+@bp.route("/add_comment/<int:article_id>", methods=["GET", "POST"])
 @login_required
 def add_comment(article_id):
     template_name = "add_comment.html"
     title = "Добавить комментарий"
     form = CommentForm()
+    sorted_by = session.get("sorted_by", "create_date")
     if form.validate_on_submit():
         try:
             CommentModelWorker.new_comment({
@@ -433,12 +528,25 @@ def add_comment(article_id):
                 })
         except ArticleNotFoundError:
             abort(404)
+        except ImageTooLargeError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message=IMAGE_TOO_LARGE_MESSAGE,
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
+        except IncorrectImageError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message="Не удалось обработать изображение",
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
         return redirect(f"/article/{article_id}")
-    sorted_by = session.get("sorted_by", "create_date")
     return render_template(template_name, title=title, form=form, sorted_by=sorted_by)
 
 
-@app.route("/edit_comment/<int:comment_id>", methods=["GET", "POST"])
+@bp.route("/edit_comment/<int:comment_id>", methods=["GET", "POST"])
 @login_required
 def edit_comment(comment_id):
     template_name = "add_comment.html"
@@ -463,16 +571,29 @@ def edit_comment(comment_id):
             abort(404)
         except ForbiddenToUserError:
             abort(403)
+        except ImageTooLargeError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message=IMAGE_TOO_LARGE_MESSAGE,
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
+        except IncorrectImageError:
+            return render_template(template_name,
+                                   title=title,
+                                   form=form,
+                                   message="Не удалось обработать изображение",
+                                   message_class="alert-danger",
+                                   sorted_by=sorted_by)
         return redirect(f"/article/{comment.article_id}#commentCard{comment_id}")
     return render_template(template_name, title=title, form=form, sorted_by=sorted_by)
 
 
-@app.route("/delete_comment/<int:comment_id>")
+@bp.route("/delete_comment/<int:comment_id>")
 @login_required
 def delete_comment(comment_id):
     try:
-        article_id = CommentModelWorker.get_comment(comment_id, ("article_id",))["article_id"]
-        CommentModelWorker.delete_comment(comment_id, current_user.id)
+        article_id = CommentModelWorker.delete_comment(comment_id, current_user.id)
     except CommentNotFoundError:
         abort(404)
     except UserNotFoundError:
@@ -483,29 +604,23 @@ def delete_comment(comment_id):
         return redirect(f"/article/{article_id}")
 
 
-@app.route("/like/<int:article_id>")
+@bp.route("/like/<int:article_id>")
 @login_required
 def new_like(article_id):
     args = redirect_url_parser.parse_args()
     try:
-        ArticleLikeModelWorker.new_like({
+        ArticleLikeModelWorker.toggle_like({
             "article_id": article_id,
             "user_id": current_user.id
         })
     except ArticleNotFoundError:
         abort(404)
-    except LikeAlreadyThereError:
-        ArticleLikeModelWorker.delete_like({
-            "article_id": article_id,
-            "user_id": current_user.id
-        })
     return redirect(args["redirect_url"])
 
 
-@app.route("/find_users", methods=["GET", "POST"])
+@bp.route("/find_users", methods=["GET", "POST"])
 def find_users():
     form = FindUserByNicknameForm()
-    db_sess = db_session.create_session()
     if form.validate_on_submit():
         search_string = form.nickname_search_string.data
         session["nickname_search_string"] = search_string
@@ -514,46 +629,71 @@ def find_users():
     form.nickname_search_string.data = search_string
     users_list = []
     if len(search_string) >= 3:
-        users = UserModelWorker.get_all_users(("id", "nickname"), 20, 0, search_string,
-                                              "starts", "nickname")
-        equal_nickname = UserModelWorker.get_all_users(("id", "nickname"), 1, 0,
-                                                       search_string, "equals")
-        if equal_nickname:
-            if equal_nickname[0] in users:
-                users.insert(0, users.pop(users.index(equal_nickname[0])))
-            else:
-                users.pop(-1)
-                users.insert(0, equal_nickname[0])
-        users_list = [db_sess.query(User).get(user["id"]) for user in users]
+        users_list = UserModelWorker.find_users(search_string, FIND_USERS_PAGE_SIZE)
     sorted_by = session.get("sorted_by", "create_date")
     return render_template("find_users.html", title="Найти пользователя",
                            form=form, users_list=users_list, sorted_by=sorted_by)
 
 
-@app.route("/")
-@app.route("/page<int:page_index>")
+@bp.route("/search")
+def search():
+    args = search_parser.page_parser.parse_args()
+    articles_list, comments_list, next_offset = [], [], None
+    offset = max(args["offset"], 0)
+    if args["type"] == "articles":
+        articles_list, next_offset = ArticleModelWorker.search_feed(
+            args["q"], current_user.id if current_user.is_authenticated else None,
+            SEARCH_PAGE_SIZE, offset
+        )
+    else:
+        comments_list, next_offset = CommentModelWorker.search_feed(
+            args["q"], SEARCH_PAGE_SIZE, offset
+        )
+    url_format = f"/search?{urlencode({'q': args['q'], 'type': args['type']})}&offset={{}}"
+    page_url = url_format.format(offset)
+    next_page_url = url_format.format(next_offset) if next_offset else None
+    sorted_by = session.get("sorted_by", "create_date")
+    return render_template("search.html", title="Поиск", search_string=args["q"],
+                           search_type=args["type"], articles_list=articles_list,
+                           comments_list=comments_list, page_url=page_url,
+                           next_page_url=next_page_url, sorted_by=sorted_by)
+
+
+@bp.route("/")
+@bp.route("/page<int:page_index>")
+@cached_page(lambda page_index=1: ("feed", "users"))
 def index(page_index=1):
     args = sorted_by_parser.parse_args()
+    cursor = cursor_parser.parse_args()["cursor"]
     session["sorted_by"] = args["sorted_by"]
-    db_sess = db_session.create_session()
-    response = db_sess.query(Article)
-    if args["sorted_by"] == "create_date":
-        response = response.order_by(Article.create_date.desc())
-    else:
-        response = response.order_by(Article.likes_count.desc()).order_by(Article.create_date.desc())
-    all_articles_count = response.count()
     articles_count = 10
-    max_page_index = max((all_articles_count // articles_count +
-                          (0 if all_articles_count % articles_count == 0 else 1)), 1)
-    if page_index > max_page_index:
+    if cursor is None:  # Номер страницы
+        all_articles_count = ArticleModelWorker.get_articles_count()
+        max_page_index = max((all_articles_count // articles_count +
+                              (0 if all_articles_count % articles_count == 0 else 1)), 1)
+        if page_index > max_page_index:
+            abort(404)
+        page_url = f"/page{page_index}?sorted_by={args['sorted_by']}"
+    else:  # Курсор: статьи не подсчитываются, OFFSET не используется
+        max_page_index = None
+        page_url = f"/?sorted_by={args['sorted_by']}&cursor={cursor}"
+    try:
+        articles, next_cursor = ArticleModelWorker.get_feed(
+            current_user.id if current_user.is_authenticated else None,
+            sorted_by=args["sorted_by"], limit=articles_count,
+            offset=None if cursor else (page_index - 1) * articles_count, cursor=cursor
+        )
+    except IncorrectCursorError:
         abort(404)
-    articles = response.slice((page_index - 1) * articles_count, page_index * articles_count)
+    next_page_url = f"/?sorted_by={args['sorted_by']}&cursor={next_cursor}" \
+        if next_cursor else None
     return render_template("index.html", title="Главная", articles_list=articles,
                            page_index=page_index, max_page_index=max_page_index,
+                           page_url=page_url, next_page_url=next_page_url,
                            sorted_by=session["sorted_by"])
 
 
-@app.errorhandler(401)
+@bp.app_errorhandler(401)
 def unauthorized(error):
     sorted_by = session.get("sorted_by", "create_date")
     return make_response(
@@ -564,7 +704,7 @@ def unauthorized(error):
     )
 
 
-@app.errorhandler(403)
+@bp.app_errorhandler(403)
 def forbidden(error):
     sorted_by = session.get("sorted_by", "create_date")
     return make_response(
@@ -573,7 +713,20 @@ def forbidden(error):
     )
 
 
-@app.errorhandler(404)
+@bp.app_errorhandler(503)
+def service_unavailable(error):
+    sorted_by = session.get("sorted_by", "create_date")
+    response = make_response(
+        render_template("service_unavailable.html",
+                        title="Сервис временно недоступен",
+                        sorted_by=sorted_by),
+        503
+    )
+    response.headers["Retry-After"] = str(PASSWORD_HASHING_RETRY_AFTER)
+    return response
+
+
+@bp.app_errorhandler(404)
 def page_not_found(error):
     sorted_by = session.get("sorted_by", "create_date")
     return make_response(
@@ -584,16 +737,65 @@ def page_not_found(error):
     )
 
 
-if __name__ == '__main__':
-    db_session.global_init("db/articles.db")
+def register_resources(api):
+    """Регистрация ресурсов REST API"""
     api.add_resource(ArticleResource, "/api/article/<int:article_id>")
     api.add_resource(ArticlesListResource, "/api/articles")
+    api.add_resource(ArticleImageResource, "/api/article/<int:article_id>/image")
+    api.add_resource(ArticlesBatchResource, "/api/articles/batch")
     api.add_resource(LoginResource, "/api/login")
     api.add_resource(LogoutResource, "/api/logout")
     api.add_resource(UserResource, "/api/user/<int:user_id>")
+    api.add_resource(UserAvatarResource, "/api/user/<int:user_id>/avatar")
     api.add_resource(UsersListResource, "/api/users")
+    api.add_resource(UsersBatchResource, "/api/users/batch")
     api.add_resource(CommentResource, "/api/comment/<int:comment_id>")
     api.add_resource(CommentsListResource, "/api/comments")
+    api.add_resource(CommentImageResource, "/api/comment/<int:comment_id>/image")
+    api.add_resource(CommentsBatchResource, "/api/comments/batch")
     api.add_resource(ArticleLikeResource, "/api/like/<int:article_id>")
+    api.add_resource(ArticleLikeToggleResource, "/api/like/<int:article_id>/toggle")
+    api.add_resource(ArticleLikesBatchResource, "/api/likes/batch")
     api.add_resource(ModeratorResource, "/api/moderator/<int:user_id>")
-    app.run()
+    api.add_resource(ImageResource, "/api/image/<string:kind>/<path:filename>")
+    api.add_resource(CacheStatsResource, "/api/cache_stats")
+    api.add_resource(SearchResource, "/api/search")
+
+
+def init_process(app):
+    """Подготовка текущего процесса к обслуживанию запросов приложения: подключение
+    к базе данных и время жизни записей в кэшах. В pre-fork сервере вызывается в каждом
+    воркере после fork (соединения SQLite нельзя передавать между процессами).
+    Подключение и кэши общие для процесса: база данных подключается один раз"""
+    db_session.global_init(app.config["DATABASE"],
+                           pool_size=app.config["DATABASE_POOL_SIZE"],
+                           max_overflow=app.config["DATABASE_MAX_OVERFLOW"],
+                           pool_timeout=app.config["DATABASE_POOL_TIMEOUT"],
+                           pool_recycle=app.config["DATABASE_POOL_RECYCLE"],
+                           pragmas=app.config["DATABASE_PRAGMAS"],
+                           write_coordinator=app.config["WRITE_COORDINATOR"])
+    if app.config["PROCESSES"] > 1:  # Изменения из других процессов кэши не видят
+        object_cache.backend.ttl = min(object_cache.backend.ttl, MULTIPROCESS_CACHE_TTL)
+        principal_cache.ttl = min(principal_cache.ttl, MULTIPROCESS_CACHE_TTL)
+
+
+def create_app(config=None, init_db=True):
+    """Создание приложения: config - словарь, дополняющий DEFAULT_CONFIG. Каждый вызов
+    создаёт новое приложение со своими настройками, страницами и ресурсами API.
+    При init_db=False процесс не подготавливается (например, при загрузке приложения
+    в главном процессе gunicorn до fork воркеров): init_process вызывается позже"""
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    app.teardown_appcontext(db_session.remove_session)
+    app.jinja_env.globals["image_static_url"] = image_static_url
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    register_resources(Api(app))
+    if init_db:
+        init_process(app)
+    return app
+
+
+if __name__ == '__main__':  # Сервер разработки (один процесс), см. wsgi.py
+    create_app().run()
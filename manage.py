@@ -1,13 +1,22 @@
 import argparse
 import sys
-from data import db_session
+from data import db_session, migrations
+from model_workers.article import ArticleModelWorker
+from model_workers.image import ImageModelWorker
+from model_workers.search import SearchModelWorker
 from model_workers.user import UserModelWorker
 from tools.errors import UserNotFoundError
 
 main_parser = argparse.ArgumentParser()
 main_parser.add_argument("command", choices=[
     "give_admin_rights",
-    "revoke_admin_rights"
+    "revoke_admin_rights",
+    "migrate",
+    "recount_counters",
+    "process_images",
+    "rebuild_search",
+    "reconcile_likes",
+    "decay_hot_scores"
 ])
 main_args = main_parser.parse_args(sys.argv[1:2])
 db_session.global_init("db/articles.db")
@@ -31,3 +40,26 @@ elif main_args.command == "revoke_admin_rights":  # Лишение прав ад
         print(f"User {args.user_id} not found")
     else:
         print("Success")
+elif main_args.command == "migrate":  # Применение миграций схемы базы данных
+    applied = migrations.migrate(db_session.get_engine())
+    if applied:
+        print(f"Success, database version {applied[-1]}")
+    else:
+        print(f"Database is up to date (version {migrations.LATEST_VERSION})")
+elif main_args.command == "recount_counters":  # Пересчёт счётчиков comments_count и articles_count
+    print(f"Articles fixed: {ArticleModelWorker.recount_comments_count()}")
+    print(f"Users fixed: {UserModelWorker.recount_articles_count()}")
+elif main_args.command == "process_images":  # Обработка изображений, оставшихся в очереди
+    print(f"Images processed: {ImageModelWorker.process_pending()}")
+elif main_args.command == "rebuild_search":  # Перестроение полнотекстовых индексов
+    indexed = SearchModelWorker.rebuild()
+    print(f"Articles indexed: {indexed['articles']}")
+    print(f"Comments indexed: {indexed['comments']}")
+    print(f"Users indexed: {indexed['users']}")
+elif main_args.command == "reconcile_likes":  # Пересчёт счётчиков likes_count по лайкам
+    # Изменения, ещё не записанные работающим сервером, будут добавлены после пересчёта,
+    # поэтому команду лучше выполнять при остановленном сервере
+    print(f"Articles fixed: {ArticleModelWorker.recount_likes_count()}")
+elif main_args.command == "decay_hot_scores":  # Пересчёт оценок ленты sorted_by=hot по времени
+    # Выполняется периодически (например, раз в 5-10 минут из cron)
+    print(f"Articles rescored: {ArticleModelWorker.decay_hot_scores()}")
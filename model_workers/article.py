@@ -1,15 +1,22 @@
-import os
-from io import BytesIO
-
-from PIL import Image
+import sqlalchemy
+from sqlalchemy import orm
 
 from data import db_session
+from data.article_scores import ArticleScore, refresh_scores, decay_scores
 from data.articles import Article
+from data.comments import Comment
+from data.likes import ArticleLike
 from data.users import User
-from model_workers.comment import CommentModelWorker
-from tools.constants import ARTICLES_IMAGES_DIR
+from model_workers.deletion import DeletionWorker
+from model_workers.image import ImageModelWorker
+from model_workers.search import SearchModelWorker
+from tools.constants import FEED_PREVIEW_LENGTH, EXPORT_BATCH_SIZE
+from tools.cursor import apply_cursor, paginate, page_limit
+from tools.cache import data_versions
+from tools.object_cache import object_cache
+from tools.likes_buffer import likes_buffer
+from tools.serializer import serializer_for
 from tools.errors import ArticleNotFoundError, ForbiddenToUserError, UserNotFoundError
-from tools.get_image_path import get_image_path
 
 
 class ArticleModelWorker:
@@ -19,98 +26,307 @@ class ArticleModelWorker:
         """Статья в JSON формате. Применяется в основном в API"""
         if not fields:  # Предотвращение ситуации, в которой вернулись бы значения всех полей модели
             fields = ("id",)
-        db_sess = db_session.create_session()
-        article = db_sess.query(Article).get(article_id)
-        if not article:
-            raise ArticleNotFoundError
-        return article.to_dict(only=fields)
+
+        def load():
+            columns, serialize = ArticleModelWorker._serializer(fields)
+            db_sess = db_session.create_session()
+            article = db_sess.query(*columns).filter(Article.id == article_id).first()
+            if not article:
+                raise ArticleNotFoundError
+            return serialize(article)
+
+        return object_cache.get("article", article_id, fields, load,
+                                ArticleModelWorker._cache_dependencies(fields))
 
     @staticmethod
-    def get_all_articles(fields=("id", "title"), author=None,
-                         sorted_by="create_date", limit=None, offset=None):
-        """Список статей в JSON формате. Применяется в основном в API"""
+    def get_articles(article_ids, fields=("id", "title")):
+        """Статьи в JSON формате по списку id ({id: статья}, несуществующие пропускаются).
+        Статьи, которых нет в кэше, загружаются одним запросом. Применяется в основном в API"""
         if not fields:
             fields = ("id",)
-        db_sess = db_session.create_session()
-        articles = db_sess.query(Article)
-        if author is not None:  # Фильтрация по автору
+
+        def load_many(ids):
+            columns, serialize = ArticleModelWorker._serializer(fields, (Article.id,))
+            db_sess = db_session.create_session()
+            return {article.id: serialize(article)
+                    for article in db_sess.query(*columns).filter(Article.id.in_(ids))}
+
+        return object_cache.get_many("article", article_ids, fields, load_many,
+                                     ArticleModelWorker._cache_dependencies(fields))
+
+    @staticmethod
+    def _cache_dependencies(fields):
+        """Дополнительные версии данных статьи в кэше объектов: изменения likes_count
+        увеличивают только версию "likes:<id>" (не "feed" и не "article:<id>"),
+        чтобы лайки не сбрасывали кэшированные страницы ленты и статьи"""
+        if "likes_count" not in fields:
+            return None
+        return lambda article_id: (f"likes:{article_id}",)
+
+    @staticmethod
+    def _serializer(fields, extra_columns=()):
+        """serializer_for для статей. К likes_count добавляются ещё не записанные
+        изменения (см. tools.likes_buffer), для этого выбирается и id статьи"""
+        if not fields or "likes_count" not in fields:
+            return serializer_for(Article, fields, extra_columns)
+        # Ключ сортировки sorted_by=hot уже содержит id статьи (ArticleScore.id)
+        if all(column.key != "id" for column in extra_columns):
+            extra_columns = tuple(extra_columns) + (Article.id,)
+        columns, serialize = serializer_for(Article, fields, extra_columns)
+
+        def serialize_with_pending(row):
+            article = serialize(row)
+            article["likes_count"] += likes_buffer.pending(row.id)
+            return article
+
+        return columns, serialize_with_pending
+
+    @staticmethod
+    def _sort_key(sorted_by):
+        """Столбцы, по которым (по убыванию) сортируются статьи. id делает ключ
+        уникальным, что необходимо для постраничного вывода по курсору"""
+        if sorted_by == "create_date":
+            return Article.create_date, Article.id
+        if sorted_by == "hot":  # Материализованная оценка (см. data.article_scores)
+            return ArticleScore.hot_score, ArticleScore.id
+        return Article.likes_count, Article.create_date, Article.id
+
+    @staticmethod
+    def _filter_articles(articles, author, sorted_by, offset, cursor):
+        """Фильтрация по автору, сортировка и пропуск статей (по OFFSET или курсору).
+        Общая часть запросов списка статей API и ленты"""
+        if sorted_by == "hot":  # Оценки и их индексы (в том числе по автору) в article_scores
+            articles = articles.join(ArticleScore, ArticleScore.id == Article.id)
+            if author is not None:
+                articles = articles.filter(ArticleScore.author == author)
+        elif author is not None:  # Фильтрация по автору
             articles = articles.filter(Article.author == author)
-        if sorted_by == "create_date":  # Сортировка
-            articles = articles.order_by(Article.create_date.desc())
-        else:
-            articles = articles.order_by(
-                Article.likes_count.desc()
-            ).order_by(Article.create_date.desc())
+        articles = apply_cursor(articles, ArticleModelWorker._sort_key(sorted_by), sorted_by,
+                                cursor, descending=True)
         if offset is not None:  # Пропуск заданного числа статей в начале
             articles = articles.offset(offset)
-        if limit is not None:  # Ограничение на количество записей в ответе
-            articles = articles.limit(limit)
-        return [article.to_dict(only=fields) for article in articles]
+        return articles
 
     @staticmethod
-    def new_article(article_data):
-        """Создание новой статьи"""
+    def get_all_articles(fields=("id", "title"), author=None,
+                         sorted_by="create_date", limit=None, offset=None, cursor=None):
+        """Список статей в JSON формате (не более limit, см. page_limit) и курсор
+        следующей страницы. Применяется в основном в API"""
+        sort_key = ArticleModelWorker._sort_key(sorted_by)
+        articles, serialize = ArticleModelWorker._list_query(fields, author, sorted_by,
+                                                             offset, cursor)
+        articles, next_cursor = paginate(articles, sort_key, sorted_by, page_limit(limit))
+        return [serialize(article) for article in articles], next_cursor
+
+    @staticmethod
+    def export_articles(fields=("id", "title"), author=None, sorted_by="create_date",
+                        offset=None, cursor=None):
+        """Генератор всех статей (после курсора) в JSON формате для выгрузки в NDJSON.
+        Строки читаются из базы порциями по EXPORT_BATCH_SIZE"""
+        articles, serialize = ArticleModelWorker._list_query(fields, author, sorted_by,
+                                                             offset, cursor)
+        return (serialize(article) for article in articles.yield_per(EXPORT_BATCH_SIZE))
+
+    @staticmethod
+    def _list_query(fields, author, sorted_by, offset, cursor):
+        """Запрос списка статей и функция преобразования строки в словарь. Выбираются
+        только запрошенные столбцы (и ключ сортировки для курсора)"""
+        columns, serialize = ArticleModelWorker._serializer(
+            fields, ArticleModelWorker._sort_key(sorted_by)
+        )
+        db_sess = db_session.create_session()
+        articles = ArticleModelWorker._filter_articles(db_sess.query(*columns), author, sorted_by,
+                                                       offset, cursor)
+        return articles, serialize
+
+    @staticmethod
+    def get_feed(viewer_id=None, author=None, sorted_by="create_date", limit=None, offset=None,
+                 cursor=None):
+        """Страница ленты статей для отрисовки шаблонов и курсор следующей страницы.
+        Автор статьи подгружается в том же запросе, а поле is_liked (поставил ли лайк
+        пользователь viewer_id) вычисляется подзапросом.
+        Вместо content загружается только его начало (content_preview)"""
+        db_sess = db_session.create_session()
+        articles = ArticleModelWorker._feed_query(db_sess, viewer_id)
+        if sorted_by == "hot":  # Оценка нужна курсору следующей страницы
+            articles = articles.options(orm.with_expression(Article.hot_score,
+                                                            ArticleScore.hot_score))
+        articles = ArticleModelWorker._filter_articles(articles, author, sorted_by, offset, cursor)
+        articles, next_cursor = paginate(articles, ArticleModelWorker._sort_key(sorted_by),
+                                         sorted_by, limit)
+        for article in articles:
+            likes_buffer.merge(article)
+        return articles, next_cursor
+
+    @staticmethod
+    def _feed_query(db_sess, viewer_id):
+        """Запрос статей для отрисовки карточек (общая часть ленты и поиска)"""
+        if viewer_id is None:  # Неавторизованный пользователь не может поставить лайк
+            is_liked = sqlalchemy.false()
+        else:
+            is_liked = sqlalchemy.exists().where(
+                ArticleLike.article_id == Article.id,
+                ArticleLike.user_id == viewer_id
+            )
+        return db_sess.query(Article).options(
+            orm.joinedload(Article.user),
+            orm.defer(Article.content),
+            orm.with_expression(Article.content_preview,
+                                sqlalchemy.func.substr(Article.content, 1, FEED_PREVIEW_LENGTH)),
+            orm.with_expression(Article.is_liked, is_liked)
+        )
+
+    @staticmethod
+    def search_articles(search_string, fields=("id", "title"), limit=None, offset=None):
+        """Найденные статьи в JSON формате (по релевантности) и смещение следующей
+        страницы. Применяется в основном в API"""
+        if not fields:
+            fields = ("id",)
+        columns, serialize = ArticleModelWorker._serializer(fields)
+        db_sess = db_session.create_session()
+        articles, next_offset = SearchModelWorker.search(
+            db_sess.query(*columns), "articles", search_string, limit, offset
+        )
+        return [serialize(article) for article in articles], next_offset
+
+    @staticmethod
+    def search_feed(search_string, viewer_id=None, limit=None, offset=None):
+        """Страница найденных статей (по релевантности) для отрисовки шаблонов
+        и смещение следующей страницы"""
         db_sess = db_session.create_session()
-        article = Article(
-            title=article_data["title"],
-            content=article_data["content"],
-            author=article_data["author"]
+        articles, next_offset = SearchModelWorker.search(
+            ArticleModelWorker._feed_query(db_sess, viewer_id), "articles", search_string,
+            limit, offset
         )
-        if article_data.get("image"):
-            image = Image.open(BytesIO(article_data["image"].read()))
-            filename = get_image_path(ARTICLES_IMAGES_DIR)
-            image.save(f"{ARTICLES_IMAGES_DIR}/{filename}")
-            article.image = filename
-        db_sess.add(article)
-        db_sess.commit()
+        for article in articles:
+            likes_buffer.merge(article)
+        return articles, next_offset
+
+    @staticmethod
+    def get_articles_count(author=None):
+        """Количество статей: одного автора - из счётчика users.articles_count, всех -
+        из кэша объектов (версия "articles:count" увеличивается при создании и удалении
+        статей), чтобы номера страниц ленты не требовали COUNT(*) на каждый просмотр"""
+        db_sess = db_session.create_session()
+        if author is not None:
+            return db_sess.query(User.articles_count).filter(User.id == author).scalar() or 0
+
+        def load():
+            return {"count": db_sess.query(sqlalchemy.func.count(Article.id)).scalar()}
+
+        return object_cache.get("articles", "count", ("count",), load)["count"]
+
+    @staticmethod
+    def new_article(article_data):
+        """Создание новой статьи. Возвращает id статьи"""
+        def operation(db_sess):
+            article = Article(
+                title=article_data["title"],
+                content=article_data["content"],
+                author=article_data["author"]
+            )
+            db_sess.add(article)
+            db_sess.flush()  # id нужен для изображения и полнотекстового индекса
+            if article_data.get("image"):
+                article.image = ImageModelWorker.set_image(db_sess, "articles", article.id,
+                                                           article_data["image"])
+            SearchModelWorker.index(db_sess, "articles", [article.id])
+            refresh_scores(db_sess, [article.id])
+            db_sess.execute(  # Счётчик статей автора изменяется в той же транзакции
+                sqlalchemy.update(User).where(User.id == article_data["author"]).values(
+                    articles_count=User.articles_count + 1
+                ).execution_options(synchronize_session=False)
+            )
+            data_versions.bump_after_commit(db_sess, "feed", "articles:count",
+                                            f"user:{article_data['author']}")
+            return article.id
+
+        return db_session.write(operation)
 
     @staticmethod
     def edit_article(article_id, user_id, article_data):
         """Изменение статьи"""
-        db_sess = db_session.create_session()
-        article = db_sess.query(Article).get(article_id)
-        if not article:
-            raise ArticleNotFoundError
-        if article.author != user_id:
-            raise ForbiddenToUserError
-        if article_data.get("title") is not None:
-            article.title = article_data["title"]
-        if article_data.get("content") is not None:
-            article.content = article_data["content"]
-        if article_data.get("image"):
-            image = Image.open(BytesIO(article_data["image"].read()))
-            filename = get_image_path(ARTICLES_IMAGES_DIR)
-            image.save(f"{ARTICLES_IMAGES_DIR}/{filename}")
-            if article.image:
-                os.remove(f"{ARTICLES_IMAGES_DIR}/{article.image}")
-            article.image = filename
-        db_sess.commit()
+        def operation(db_sess):
+            article = db_sess.query(Article).get(article_id)
+            if not article:
+                raise ArticleNotFoundError
+            if article.author != user_id:
+                raise ForbiddenToUserError
+            is_text_changed = article_data.get("title") is not None \
+                or article_data.get("content") is not None
+            if is_text_changed:  # Старый текст удаляется из индекса до изменения
+                SearchModelWorker.unindex(db_sess, "articles", [article_id])
+            if article_data.get("title") is not None:
+                article.title = article_data["title"]
+            if article_data.get("content") is not None:
+                article.content = article_data["content"]
+            if is_text_changed:
+                SearchModelWorker.index(db_sess, "articles", [article_id])
+            if article_data.get("image"):
+                article.image = ImageModelWorker.set_image(db_sess, "articles", article.id,
+                                                           article_data["image"])
+            data_versions.bump_after_commit(db_sess, "feed", f"article:{article_id}")
+
+        db_session.write(operation)
 
     @staticmethod
     def delete_article(article_id, user_id):
         """Удаление статьи"""
-        db_sess = db_session.create_session()
-        article = db_sess.query(Article).get(article_id)
-        if not article:
-            raise ArticleNotFoundError
-        user = db_sess.query(User).get(user_id)
-        if not user:
-            raise UserNotFoundError
-        if not article.user_can_delete(user):
-            raise ForbiddenToUserError
-        if article.image:
-            os.remove(f"{ARTICLES_IMAGES_DIR}/{article.image}")
-        for comment in article.comments:
-            CommentModelWorker.delete_comment(comment.id, comment.author)
-        db_sess.delete(article)
-        db_sess.commit()
-
-    @staticmethod
-    def update_likes_count(article_id, likes_delta):
-        """Обновление поля likes_count"""
-        db_sess = db_session.create_session()
-        article = db_sess.query(Article).get(article_id)
-        if not article:
-            raise ArticleNotFoundError
-        article.likes_count += likes_delta
-        db_sess.commit()
+        def operation(db_sess):
+            article = db_sess.query(Article).get(article_id)
+            if not article:
+                raise ArticleNotFoundError
+            user = db_sess.query(User).get(user_id)
+            if not user:
+                raise UserNotFoundError
+            if not article.user_can_delete(user):
+                raise ForbiddenToUserError
+            DeletionWorker.delete_article(db_sess, article_id)
+            data_versions.bump_after_commit(db_sess, "feed", f"article:{article_id}")
+
+        db_session.write(operation)
+
+    @staticmethod
+    def recount_comments_count():
+        """Пересчёт поля comments_count всех статей (исправление расхождений)
+        и оценок исправленных статей. Возвращает число исправленных статей"""
+        comments_count = sqlalchemy.select(
+            sqlalchemy.func.count(Comment.id)
+        ).where(Comment.article_id == Article.id).scalar_subquery()
+        return db_session.write(lambda db_sess: ArticleModelWorker._recount_counter(
+            db_sess, Article.comments_count, comments_count
+        ))
+
+    @staticmethod
+    def recount_likes_count():
+        """Пересчёт поля likes_count всех статей по записям articles_likes (источник
+        истины для счётчика, см. tools.likes_buffer) и оценок исправленных статей.
+        Возвращает число исправленных статей"""
+        likes_buffer.flush()
+        likes_count = sqlalchemy.select(
+            sqlalchemy.func.count(ArticleLike.id)
+        ).where(ArticleLike.article_id == Article.id).scalar_subquery()
+        return db_session.write(lambda db_sess: ArticleModelWorker._recount_counter(
+            db_sess, Article.likes_count, likes_count
+        ))
+
+    @staticmethod
+    def _recount_counter(db_sess, column, value):
+        """Запись значения value (подзапрос по статье) в счётчик column статей, где они
+        расходятся, и пересчёт оценок этих статей для ленты sorted_by=hot.
+        Возвращает число исправленных статей"""
+        changed = db_sess.execute(
+            sqlalchemy.select(Article.id).where(column != value)
+        ).scalars().all()
+        if changed:
+            db_sess.execute(sqlalchemy.update(Article).where(Article.id.in_(changed)).values(
+                {column: value}
+            ).execution_options(synchronize_session=False))
+            refresh_scores(db_sess, changed)
+        return len(changed)
+
+    @staticmethod
+    def decay_hot_scores():
+        """Пересчёт оценок ленты sorted_by=hot на текущий момент (оценки уменьшаются
+        с возрастом статей). Возвращает число пересчитанных статей"""
+        return db_session.write(decay_scores)
@@ -1,8 +1,12 @@
+import sqlalchemy
+from data.article_scores import refresh_scores
 from data.likes import ArticleLike
 from data.articles import Article
 from data import db_session
+from tools.cache import data_versions
+from tools.constants import LIKES_WRITE_BEHIND
+from tools.likes_buffer import likes_buffer
 from tools.errors import LikeAlreadyThereError, LikeNotFoundError, ArticleNotFoundError
-from model_workers.article import ArticleModelWorker
 
 
 class ArticleLikeModelWorker:
@@ -19,34 +23,143 @@ class ArticleLikeModelWorker:
         return False
 
     @staticmethod
-    def new_like(like_data):
-        """Пользователь ставит лайк"""
+    def likes_exist(user_id, article_ids):
+        """Поставил ли пользователь лайки на статьи из списка - одним запросом.
+        Возвращает {id статьи: bool}, несуществующие статьи пропускаются"""
         db_sess = db_session.create_session()
-        if db_sess.query(ArticleLike).filter(
-                ArticleLike.user_id == like_data["user_id"],
-                ArticleLike.article_id == like_data["article_id"]
-        ).first():
-            raise LikeAlreadyThereError
-        if not db_sess.query(Article).get(like_data["article_id"]):
-            raise ArticleNotFoundError
-        like = ArticleLike(
-            user_id=like_data["user_id"],
-            article_id=like_data["article_id"]
+        like_exist = sqlalchemy.exists().where(
+            ArticleLike.user_id == user_id,
+            ArticleLike.article_id == Article.id
+        )
+        return dict(db_sess.execute(
+            sqlalchemy.select(Article.id, like_exist).where(Article.id.in_(article_ids))
+        ).all())
+
+    @staticmethod
+    def _insert_like(db_sess, user_id, article_id):
+        """Добавление лайка одним запросом INSERT OR IGNORE ... SELECT.
+        Возвращает False, если лайк уже стоит или статьи не существует"""
+        like_exist = sqlalchemy.exists().where(
+            ArticleLike.user_id == user_id,
+            ArticleLike.article_id == article_id
+        )
+        article = sqlalchemy.select(
+            sqlalchemy.literal(user_id), Article.id
+        ).where(Article.id == article_id, ~like_exist)
+        result = db_sess.execute(
+            sqlalchemy.insert(ArticleLike).prefix_with("OR IGNORE").from_select(
+                ["user_id", "article_id"], article
+            )
+        )
+        return result.rowcount > 0
+
+    @staticmethod
+    def _remove_like(db_sess, user_id, article_id):
+        """Удаление лайка одним запросом. Возвращает число удалённых записей"""
+        result = db_sess.execute(
+            sqlalchemy.delete(ArticleLike).where(
+                ArticleLike.user_id == user_id,
+                ArticleLike.article_id == article_id
+            ).execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    @staticmethod
+    def _add_uncommitted_likes(db_sess, article_id, likes_delta):
+        """Учёт изменения счётчика лайков, которое попадёт в буфер только после коммита.
+        Операции одной группы координатора записи выполняются в общей транзакции,
+        поэтому каждая учитывает изменения предыдущих. Возвращает изменение счётчика
+        статьи предыдущими операциями транзакции"""
+        deltas = db_sess.info.get("likes_deltas")
+        if deltas is None:
+            deltas = db_sess.info["likes_deltas"] = {}
+
+            def clear():
+                db_sess.info.pop("likes_deltas", None)
+
+            db_session.after_commit(db_sess, clear)
+            db_session.after_rollback(db_sess, clear)
+        uncommitted = deltas.get(article_id, 0)
+        deltas[article_id] = uncommitted + likes_delta
+
+        def cancel():  # Операция отменена (в том числе только её точка сохранения)
+            deltas[article_id] = deltas.get(article_id, 0) - likes_delta
+
+        db_session.after_rollback(db_sess, cancel)
+        return uncommitted
+
+    @staticmethod
+    def _change_likes_count(db_sess, article_id, likes_delta):
+        """Изменение поля likes_count на likes_delta. При LIKES_WRITE_BEHIND изменение
+        добавляется в буфер после коммита (см. tools.likes_buffer), иначе записывается
+        атомарно (likes_count = likes_count + delta) вместе с оценкой статьи для ленты
+        sorted_by=hot. Возвращает новое значение поля"""
+        if LIKES_WRITE_BEHIND:
+            uncommitted = ArticleLikeModelWorker._add_uncommitted_likes(db_sess, article_id,
+                                                                        likes_delta)
+            db_session.after_commit(db_sess, lambda: likes_buffer.add(article_id, likes_delta))
+            likes_count = db_sess.execute(
+                sqlalchemy.select(Article.likes_count).where(Article.id == article_id)
+            ).scalar()
+            return likes_count + likes_buffer.pending(article_id) + uncommitted + likes_delta
+        db_sess.execute(
+            sqlalchemy.update(Article).where(Article.id == article_id).values(
+                likes_count=Article.likes_count + likes_delta
+            ).execution_options(synchronize_session=False)
         )
-        ArticleModelWorker.update_likes_count(like_data["article_id"], 1)
-        db_sess.add(like)
-        db_sess.commit()
+        refresh_scores(db_sess, [article_id])
+        return db_sess.execute(
+            sqlalchemy.select(Article.likes_count).where(Article.id == article_id)
+        ).scalar()
+
+    @staticmethod
+    def new_like(like_data):
+        """Пользователь ставит лайк"""
+        def operation(db_sess):
+            if not ArticleLikeModelWorker._insert_like(db_sess, like_data["user_id"],
+                                                       like_data["article_id"]):
+                if db_sess.query(ArticleLike).filter(
+                        ArticleLike.user_id == like_data["user_id"],
+                        ArticleLike.article_id == like_data["article_id"]
+                ).first():
+                    raise LikeAlreadyThereError
+                raise ArticleNotFoundError
+            ArticleLikeModelWorker._change_likes_count(db_sess, like_data["article_id"], 1)
+            data_versions.bump_after_commit(db_sess, f"likes:{like_data['article_id']}")
+
+        db_session.write(operation)
 
     @staticmethod
     def delete_like(like_data):
         """Пользователь убирает лайк"""
-        db_sess = db_session.create_session()
-        like = db_sess.query(ArticleLike).filter(
-            ArticleLike.user_id == like_data["user_id"],
-            ArticleLike.article_id == like_data["article_id"]
-        ).first()
-        if not like:
-            raise LikeNotFoundError
-        ArticleModelWorker.update_likes_count(like_data["article_id"], -1)
-        db_sess.delete(like)
-        db_sess.commit()
+        def operation(db_sess):
+            removed_count = ArticleLikeModelWorker._remove_like(db_sess, like_data["user_id"],
+                                                                like_data["article_id"])
+            if not removed_count:
+                raise LikeNotFoundError
+            ArticleLikeModelWorker._change_likes_count(db_sess, like_data["article_id"],
+                                                       -removed_count)
+            data_versions.bump_after_commit(db_sess, f"likes:{like_data['article_id']}")
+
+        db_session.write(operation)
+
+    @staticmethod
+    def toggle_like(like_data):
+        """Пользователь ставит лайк или убирает его, если лайк уже стоит.
+        Возвращает новое состояние лайка и количество лайков статьи"""
+        def operation(db_sess):
+            if ArticleLikeModelWorker._insert_like(db_sess, like_data["user_id"],
+                                                   like_data["article_id"]):
+                likes_delta = 1
+            else:
+                likes_delta = -ArticleLikeModelWorker._remove_like(db_sess, like_data["user_id"],
+                                                                   like_data["article_id"])
+                if not likes_delta:  # Лайк не добавился и не удалился - статьи не существует
+                    raise ArticleNotFoundError
+            likes_count = ArticleLikeModelWorker._change_likes_count(
+                db_sess, like_data["article_id"], likes_delta
+            )
+            data_versions.bump_after_commit(db_sess, f"likes:{like_data['article_id']}")
+            return {"like_exist": likes_delta > 0, "likes_count": likes_count}
+
+        return db_session.write(operation)
@@ -1,101 +1,187 @@
 from random import choices
 from string import ascii_letters, digits
-import os
-from io import BytesIO
-from PIL import Image
+from sqlalchemy import orm
+from data.article_scores import refresh_scores
 from data.comments import Comment
 from data.articles import Article
 from data.users import User
 from data import db_session
 from tools.errors import CommentNotFoundError, ArticleNotFoundError, \
     ForbiddenToUserError, UserNotFoundError
-from tools.get_image_path import get_image_path
-from tools.constants import COMMENTS_IMAGES_DIR
+from model_workers.image import ImageModelWorker
+from model_workers.search import SearchModelWorker
+from tools.cache import data_versions
+from tools.object_cache import object_cache
+from tools.constants import EXPORT_BATCH_SIZE
+from tools.cursor import apply_cursor, paginate, page_limit
+from tools.serializer import serializer_for
 
 
 class CommentModelWorker:
     """Класс для работы с моделью Comment"""
+    _sort_key = Comment.create_date, Comment.id  # Порядок списка комментариев
+
     @staticmethod
     def get_comment(comment_id, fields=("id", "author", "article_id")):
         """Комментарий в JSON формате. Применяется в основном в API"""
         if not fields:
             fields = ("id",)
-        db_sess = db_session.create_session()
-        comment = db_sess.query(Comment).get(comment_id)
-        if not comment:
-            raise CommentNotFoundError
-        return comment.to_dict(only=fields)
+
+        def load():
+            columns, serialize = serializer_for(Comment, fields)
+            db_sess = db_session.create_session()
+            comment = db_sess.query(*columns).filter(Comment.id == comment_id).first()
+            if not comment:
+                raise CommentNotFoundError
+            return serialize(comment)
+
+        return object_cache.get("comment", comment_id, fields, load)
 
     @staticmethod
-    def get_all_comments(fields=("id", "author", "article_id"), author=None, article=None,
-                         limit=None, offset=None):
-        """Список комментариев в JSON формате. Применяется в основном в API"""
+    def get_comments(comment_ids, fields=("id", "author", "article_id")):
+        """Комментарии в JSON формате по списку id ({id: комментарий}, несуществующие
+        пропускаются). Комментарии, которых нет в кэше, загружаются одним запросом.
+        Применяется в основном в API"""
         if not fields:
             fields = ("id",)
+
+        def load_many(ids):
+            columns, serialize = serializer_for(Comment, fields, (Comment.id,))
+            db_sess = db_session.create_session()
+            return {comment.id: serialize(comment)
+                    for comment in db_sess.query(*columns).filter(Comment.id.in_(ids))}
+
+        return object_cache.get_many("comment", comment_ids, fields, load_many)
+
+    @staticmethod
+    def get_all_comments(fields=("id", "author", "article_id"), author=None, article=None,
+                         limit=None, offset=None, cursor=None):
+        """Список комментариев в JSON формате (от новых к старым, не более limit,
+        см. page_limit) и курсор следующей страницы. Применяется в основном в API"""
+        comments, serialize = CommentModelWorker._list_query(fields, author, article,
+                                                             offset, cursor)
+        comments, next_cursor = paginate(comments, CommentModelWorker._sort_key,
+                                         "create_date", page_limit(limit))
+        return [serialize(comment) for comment in comments], next_cursor
+
+    @staticmethod
+    def export_comments(fields=("id", "author", "article_id"), author=None, article=None,
+                        offset=None, cursor=None):
+        """Генератор всех комментариев (после курсора) в JSON формате для выгрузки
+        в NDJSON. Строки читаются из базы порциями по EXPORT_BATCH_SIZE"""
+        comments, serialize = CommentModelWorker._list_query(fields, author, article,
+                                                             offset, cursor)
+        return (serialize(comment) for comment in comments.yield_per(EXPORT_BATCH_SIZE))
+
+    @staticmethod
+    def _list_query(fields, author, article, offset, cursor):
+        """Запрос списка комментариев и функция преобразования строки в словарь"""
+        sort_key = CommentModelWorker._sort_key
+        columns, serialize = serializer_for(Comment, fields, sort_key)
         db_sess = db_session.create_session()
-        comments = db_sess.query(Comment)
+        comments = db_sess.query(*columns)
         if author is not None:
             comments = comments.filter(Comment.author == author)
         if article is not None:
             comments = comments.filter(Comment.article_id == article)
+        comments = apply_cursor(comments, sort_key, "create_date", cursor, descending=True)
         if offset is not None:
             comments = comments.offset(offset)
-        if limit is not None:
-            comments = comments.limit(limit)
-        return [comment.to_dict(only=fields) for comment in comments]
+        return comments, serialize
 
     @staticmethod
-    def new_comment(comment_data):
-        """Создание нового комментария"""
+    def search_comments(search_string, fields=("id", "author", "article_id"), limit=None,
+                        offset=None):
+        """Найденные комментарии в JSON формате (по релевантности) и смещение следующей
+        страницы. Применяется в основном в API"""
+        if not fields:
+            fields = ("id",)
+        columns, serialize = serializer_for(Comment, fields)
         db_sess = db_session.create_session()
-        if not db_sess.query(Article).get(comment_data["article_id"]):
-            raise ArticleNotFoundError
-        comment = Comment(
-            author=comment_data["author"],
-            article_id=comment_data["article_id"],
-            text=comment_data["text"]
+        comments, next_offset = SearchModelWorker.search(
+            db_sess.query(*columns), "comments", search_string, limit, offset
         )
-        if comment_data.get("image"):
-            image = Image.open(BytesIO(comment_data["image"].read()))
-            filename = get_image_path(COMMENTS_IMAGES_DIR)
-            image.save(f"{COMMENTS_IMAGES_DIR}/{filename}")
-            comment.image = filename
-        db_sess.add(comment)
-        db_sess.commit()
+        return [serialize(comment) for comment in comments], next_offset
+
+    @staticmethod
+    def search_feed(search_string, limit=None, offset=None):
+        """Страница найденных комментариев (по релевантности) для отрисовки шаблонов
+        и смещение следующей страницы. Автор комментария подгружается в том же запросе"""
+        db_sess = db_session.create_session()
+        return SearchModelWorker.search(
+            db_sess.query(Comment).options(orm.joinedload(Comment.user)),
+            "comments", search_string, limit, offset
+        )
+
+    @staticmethod
+    def new_comment(comment_data):
+        """Создание нового комментария. Возвращает id комментария"""
+        def operation(db_sess):
+            article = db_sess.query(Article).get(comment_data["article_id"])
+            if not article:
+                raise ArticleNotFoundError
+            comment = Comment(
+                author=comment_data["author"],
+                article_id=comment_data["article_id"],
+                text=comment_data["text"]
+            )
+            db_sess.add(comment)
+            db_sess.flush()  # id нужен для изображения и полнотекстового индекса
+            if comment_data.get("image"):
+                comment.image = ImageModelWorker.set_image(db_sess, "comments", comment.id,
+                                                           comment_data["image"])
+            SearchModelWorker.index(db_sess, "comments", [comment.id])
+            # Счётчик изменяется выражением SQL в той же транзакции, без чтения значения в Python
+            article.comments_count = Article.comments_count + 1
+            refresh_scores(db_sess, [article.id])
+            data_versions.bump_after_commit(db_sess, "feed", f"article:{comment.article_id}")
+            return comment.id
+
+        return db_session.write(operation)
 
     @staticmethod
     def edit_comment(comment_id, user_id, comment_data):
         """Изменение комментария"""
-        db_sess = db_session.create_session()
-        comment = db_sess.query(Comment).get(comment_id)
-        if not comment:
-            raise CommentNotFoundError
-        if comment.author != user_id:
-            raise ForbiddenToUserError
-        if comment_data.get("text") is not None:
-            comment.text = comment_data["text"]
-        if comment_data.get("image"):
-            image = Image.open(BytesIO(comment_data["image"].read()))
-            filename = get_image_path(COMMENTS_IMAGES_DIR)
-            image.save(f"{COMMENTS_IMAGES_DIR}/{filename}")
-            if comment.image:
-                os.remove(f"{COMMENTS_IMAGES_DIR}/{comment.image}")
-            comment.image = filename
-        db_sess.commit()
+        def operation(db_sess):
+            comment = db_sess.query(Comment).get(comment_id)
+            if not comment:
+                raise CommentNotFoundError
+            if comment.author != user_id:
+                raise ForbiddenToUserError
+            if comment_data.get("text") is not None:
+                # Старый текст удаляется из индекса до изменения
+                SearchModelWorker.unindex(db_sess, "comments", [comment_id])
+                comment.text = comment_data["text"]
+                SearchModelWorker.index(db_sess, "comments", [comment_id])
+            if comment_data.get("image"):
+                comment.image = ImageModelWorker.set_image(db_sess, "comments", comment.id,
+                                                           comment_data["image"])
+            data_versions.bump_after_commit(db_sess, f"article:{comment.article_id}",
+                                            f"comment:{comment_id}")
+
+        db_session.write(operation)
 
     @staticmethod
     def delete_comment(comment_id, user_id):
-        """Удаление комментария"""
-        db_sess = db_session.create_session()
-        comment = db_sess.query(Comment).get(comment_id)
-        user = db_sess.query(User).get(user_id)
-        if not comment:
-            raise CommentNotFoundError
-        if not user:
-            raise UserNotFoundError
-        if not comment.user_can_delete(user):
-            raise ForbiddenToUserError
-        if comment.image:
-            os.remove(f"{COMMENTS_IMAGES_DIR}/{comment.image}")
-        db_sess.delete(comment)
-        db_sess.commit()
+        """Удаление комментария. Возвращает id статьи, к которой относился комментарий"""
+        def operation(db_sess):
+            comment = db_sess.query(Comment).get(comment_id)
+            user = db_sess.query(User).get(user_id)
+            if not comment:
+                raise CommentNotFoundError
+            if not user:
+                raise UserNotFoundError
+            if not comment.user_can_delete(user):
+                raise ForbiddenToUserError
+            ImageModelWorker.release_images(db_sess, "comments", [comment.id])
+            SearchModelWorker.unindex(db_sess, "comments", [comment.id])
+            if comment.article:
+                comment.article.comments_count = Article.comments_count - 1
+            db_sess.delete(comment)
+            article_id = comment.article_id
+            refresh_scores(db_sess, [article_id])
+            data_versions.bump_after_commit(db_sess, "feed", f"article:{article_id}",
+                                            f"comment:{comment_id}")
+            return article_id
+
+        return db_session.write(operation)
@@ -0,0 +1,96 @@
+import sqlalchemy
+from data.article_scores import ArticleScore, refresh_scores
+from data.articles import Article
+from data.comments import Comment
+from data.likes import ArticleLike
+from data.users import User
+from model_workers.image import ImageModelWorker
+from model_workers.search import SearchModelWorker
+from tools.cache import data_versions
+
+
+def _execute(db_sess, statement):
+    """Выполнение DELETE/UPDATE без синхронизации объектов сессии"""
+    return db_sess.execute(statement.execution_options(synchronize_session=False))
+
+
+class DeletionWorker:
+    """Класс для каскадного удаления статей и пользователей. Зависимые записи удаляются
+    несколькими запросами над множествами в одной транзакции, без загрузки объектов,
+    а файлы изображений удаляются после коммита"""
+    @staticmethod
+    def _delete_articles(db_sess, article_ids):
+        """Удаление статей (article_ids - подзапрос с id) вместе с комментариями, оценками,
+        лайками и изображениями"""
+        ImageModelWorker.release_images(db_sess, "articles", article_ids)
+        comment_ids = sqlalchemy.select(Comment.id).where(Comment.article_id.in_(article_ids))
+        ImageModelWorker.release_images(db_sess, "comments", comment_ids)
+        SearchModelWorker.unindex(db_sess, "articles", article_ids)
+        SearchModelWorker.unindex(db_sess, "comments", comment_ids)
+        deleted_articles_count = sqlalchemy.select(sqlalchemy.func.count(Article.id)).where(
+            Article.author == User.id, Article.id.in_(article_ids)
+        ).scalar_subquery()
+        _execute(db_sess, sqlalchemy.update(User).where(
+            User.id.in_(sqlalchemy.select(Article.author).where(Article.id.in_(article_ids)))
+        ).values(articles_count=User.articles_count - deleted_articles_count))
+        _execute(db_sess, sqlalchemy.delete(Comment).where(Comment.article_id.in_(article_ids)))
+        _execute(db_sess, sqlalchemy.delete(ArticleLike).where(
+            ArticleLike.article_id.in_(article_ids)
+        ))
+        _execute(db_sess, sqlalchemy.delete(ArticleScore).where(ArticleScore.id.in_(article_ids)))
+        _execute(db_sess, sqlalchemy.delete(Article).where(Article.id.in_(article_ids)))
+
+    @staticmethod
+    def delete_article(db_sess, article_id):
+        """Удаление статьи со всеми комментариями, лайками и изображениями.
+        Коммит выполняет вызывающий код"""
+        # Кэшированные объекты удаляемых комментариев, счётчики статей автора и всех статей
+        changed = ["articles:count"] + [f"comment:{comment_id}" for comment_id in db_sess.execute(
+            sqlalchemy.select(Comment.id).where(Comment.article_id == article_id)
+        ).scalars()] + [f"user:{author}" for author in db_sess.execute(
+            sqlalchemy.select(Article.author).where(Article.id == article_id)
+        ).scalars()]
+        DeletionWorker._delete_articles(
+            db_sess, sqlalchemy.select(Article.id).where(Article.id == article_id)
+        )
+        data_versions.bump_after_commit(db_sess, *changed)
+
+    @staticmethod
+    def delete_user(db_sess, user_id):
+        """Удаление пользователя со всеми его статьями, комментариями, лайками
+        и изображениями. Коммит выполняет вызывающий код"""
+        DeletionWorker._delete_articles(
+            db_sess, sqlalchemy.select(Article.id).where(Article.author == user_id)
+        )
+        # Комментарии под чужими статьями
+        comment_ids = sqlalchemy.select(Comment.id).where(Comment.author == user_id)
+        ImageModelWorker.release_images(db_sess, "comments", comment_ids)
+        SearchModelWorker.unindex(db_sess, "comments", comment_ids)
+        user_comments_count = sqlalchemy.select(sqlalchemy.func.count(Comment.id)).where(
+            Comment.article_id == Article.id, Comment.author == user_id
+        ).scalar_subquery()
+        _execute(db_sess, sqlalchemy.update(Article).where(
+            Article.id.in_(sqlalchemy.select(Comment.article_id).where(Comment.author == user_id))
+        ).values(comments_count=Article.comments_count - user_comments_count))
+        refresh_scores(db_sess, sqlalchemy.select(Comment.article_id).where(
+            Comment.author == user_id
+        ))
+        _execute(db_sess, sqlalchemy.delete(Comment).where(Comment.author == user_id))
+        # Лайки под чужими статьями
+        user_likes_count = sqlalchemy.select(sqlalchemy.func.count(ArticleLike.id)).where(
+            ArticleLike.article_id == Article.id, ArticleLike.user_id == user_id
+        ).scalar_subquery()
+        _execute(db_sess, sqlalchemy.update(Article).where(
+            Article.id.in_(
+                sqlalchemy.select(ArticleLike.article_id).where(ArticleLike.user_id == user_id)
+            )
+        ).values(likes_count=Article.likes_count - user_likes_count))
+        refresh_scores(db_sess, sqlalchemy.select(ArticleLike.article_id).where(
+            ArticleLike.user_id == user_id
+        ))
+        _execute(db_sess, sqlalchemy.delete(ArticleLike).where(ArticleLike.user_id == user_id))
+        ImageModelWorker.release_images(db_sess, "avatars", [user_id])
+        SearchModelWorker.unindex(db_sess, "users", [user_id])
+        _execute(db_sess, sqlalchemy.delete(User).where(User.id == user_id))
+        # Изменились счётчики и объекты многих статей и комментариев
+        data_versions.bump_after_commit(db_sess, "cascade")
@@ -0,0 +1,210 @@
+import os
+import sqlalchemy
+from data import db_session
+from data.images import Image, image_to_article, image_to_comment, image_to_user
+from tools import image_pipeline
+from tools.constants import IMAGES_DIRS, IMAGES_INCOMING_DIR, IMAGES_RENDITIONS, \
+    IMAGES_CROPPED, IMAGES_EXTENSION
+from tools.image_processing import process_image, rendition_filename
+from tools.upload import SpooledImage, spool_image
+
+IMAGES_LINKS = {  # Таблица связей и столбец владельца изображения для каждого раздела
+    "articles": (image_to_article, "article"),
+    "comments": (image_to_comment, "comment"),
+    "avatars": (image_to_user, "user")
+}
+
+
+def remove_files(paths):
+    """Удаление файлов изображений (уже удалённые файлы пропускаются)"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def store_filename(file_hash):
+    """Путь файла в хранилище относительно каталога раздела. Два уровня каталогов
+    по первым символам хэша ограничивают количество файлов в одном каталоге"""
+    return f"{file_hash[:2]}/{file_hash[2:4]}/{file_hash}.{IMAGES_EXTENSION}"
+
+
+def _source_path(kind, filename):
+    """Путь к загруженному файлу, ожидающему обработки"""
+    return f"{IMAGES_INCOMING_DIR}/{kind}_{os.path.basename(filename)}"
+
+
+def _image_files(kind, filename):
+    """Пути ко всем файлам изображения: вариантам и необработанному исходному файлу"""
+    return [
+        f"{IMAGES_DIRS[kind]}/{rendition_filename(filename, rendition)}"
+        for rendition in IMAGES_RENDITIONS[kind]
+    ] + [_source_path(kind, filename)]
+
+
+def _execute(db_sess, statement):
+    """Выполнение INSERT/UPDATE/DELETE без синхронизации объектов сессии"""
+    return db_sess.execute(statement.execution_options(synchronize_session=False))
+
+
+class ImageModelWorker:
+    """Класс для работы с моделью Image. Изображения хранятся по хэшу содержимого:
+    одинаковые загрузки используют один набор файлов, а файлы удаляются, когда
+    на изображение не остаётся ссылок. Загруженное изображение только проверяется
+    в запросе, декодирование и сохранение вариантов выполняется пулом процессов"""
+    @staticmethod
+    def set_image(db_sess, kind, owner_id, image):
+        """Замена изображения владельца (статьи, комментария или пользователя) загруженным
+        (image - SpooledImage или FileStorage, который записывается во временный файл).
+        Новое содержимое сохраняется со статусом pending и обрабатывается после коммита
+        вызывающего кода. Возвращает путь основного файла изображения"""
+        if not isinstance(image, SpooledImage):
+            image = spool_image(image.stream)
+        is_new = False
+        try:
+            filename = store_filename(image.hash)
+            is_new = _execute(db_sess, sqlalchemy.insert(Image).prefix_with("OR IGNORE").values(
+                kind=kind, hash=image.hash, filename=filename, status="pending"
+            )).rowcount
+            # Изображение, которое не удалось обработать раньше, обрабатывается заново
+            is_new = is_new or _execute(db_sess, sqlalchemy.update(Image).where(
+                Image.kind == kind, Image.hash == image.hash, Image.status == "failed"
+            ).values(status="pending")).rowcount
+            if is_new:  # Временный файл становится исходным файлом для обработки
+                # только после коммита: при отмене транзакции он удаляется
+                db_session.after_commit(
+                    db_sess, lambda: ImageModelWorker._accept_upload(image, kind, filename)
+                )
+                db_session.after_rollback(db_sess, image.discard)
+        finally:
+            if not is_new:
+                image.discard()
+        image_id = db_sess.execute(
+            sqlalchemy.select(Image.id).where(Image.kind == kind, Image.hash == image.hash)
+        ).scalar()
+        # Ссылка на новое изображение добавляется до освобождения старого,
+        # чтобы повторная загрузка того же файла не удалила его
+        _execute(db_sess, sqlalchemy.update(Image).where(Image.id == image_id).values(
+            ref_count=Image.ref_count + 1
+        ))
+        ImageModelWorker.release_images(db_sess, kind, [owner_id])
+        link, owner = IMAGES_LINKS[kind]
+        db_sess.execute(sqlalchemy.insert(link).values({owner: owner_id, "image": image_id}))
+        return filename
+
+    @staticmethod
+    def _accept_upload(image, kind, filename):
+        """Перемещение загруженного файла в исходные файлы для обработки и постановка
+        изображения в очередь (после коммита записи изображения)"""
+        os.replace(image.path, _source_path(kind, filename))
+        ImageModelWorker._enqueue(kind, filename)
+
+    @staticmethod
+    def release_images(db_sess, kind, owner_ids):
+        """Удаление ссылок владельцев (owner_ids - список или подзапрос с id) на изображения.
+        Изображения без ссылок удаляются, их файлы - после коммита вызывающего кода"""
+        link, owner = IMAGES_LINKS[kind]
+        owner_filter = link.c[owner].in_(owner_ids)
+        image_ids = db_sess.execute(
+            sqlalchemy.select(link.c.image).where(owner_filter).distinct()
+        ).scalars().all()
+        if not image_ids:
+            return
+        links_count = sqlalchemy.select(sqlalchemy.func.count()).select_from(link).where(
+            link.c.image == Image.id, owner_filter
+        ).scalar_subquery()
+        _execute(db_sess, sqlalchemy.update(Image).where(Image.id.in_(image_ids)).values(
+            ref_count=Image.ref_count - links_count
+        ))
+        _execute(db_sess, sqlalchemy.delete(link).where(owner_filter))
+        unused = db_sess.execute(sqlalchemy.select(Image.filename).where(
+            Image.id.in_(image_ids), Image.ref_count <= 0
+        )).scalars().all()
+        if unused:
+            _execute(db_sess, sqlalchemy.delete(Image).where(
+                Image.id.in_(image_ids), Image.ref_count <= 0
+            ))
+            db_session.after_commit(
+                db_sess, lambda: ImageModelWorker._remove_unused(kind, unused)
+            )
+
+    @staticmethod
+    def _remove_unused(kind, filenames):
+        """Удаление файлов изображений, если их не загрузили заново после коммита"""
+        with db_session.get_engine().connect() as connection:
+            used = set(connection.execute(sqlalchemy.select(Image.filename).where(
+                Image.kind == kind, Image.filename.in_(filenames)
+            )).scalars())
+        remove_files([
+            path for filename in filenames if filename not in used
+            for path in _image_files(kind, filename)
+        ])
+
+    @staticmethod
+    def _arguments(kind, filename):
+        """Аргументы задачи обработки изображения"""
+        return (_source_path(kind, filename), IMAGES_DIRS[kind], filename,
+                IMAGES_RENDITIONS[kind], kind in IMAGES_CROPPED)
+
+    @staticmethod
+    def _enqueue(kind, filename):
+        """Постановка изображения в очередь обработки. Если очередь заполнена, изображение
+        остаётся в статусе pending до manage.py process_images: обработка в текущем потоке
+        задержала бы запрос (или, с координатором записи, все операции записи)"""
+        if not image_pipeline.submit(
+                process_image, ImageModelWorker._arguments(kind, filename),
+                lambda error: ImageModelWorker._finish(kind, filename, error)
+        ):
+            print(f"Очередь обработки изображений заполнена, {kind}/{filename} "
+                  "будет обработано командой manage.py process_images")
+
+    @staticmethod
+    def _process(kind, filename):
+        """Обработка изображения в текущем потоке"""
+        try:
+            process_image(*ImageModelWorker._arguments(kind, filename))
+        except Exception as error:
+            ImageModelWorker._finish(kind, filename, error)
+        else:
+            ImageModelWorker._finish(kind, filename, None)
+
+    @staticmethod
+    def _finish(kind, filename, error):
+        """Запись результата обработки (вызывается потоком пула процессов обработки
+        или manage.py, вне контекста запроса). Лишние файлы удаляются после коммита"""
+        def operation(db_sess):
+            updated = _execute(db_sess, sqlalchemy.update(Image).where(
+                Image.kind == kind, Image.filename == filename, Image.status == "pending"
+            ).values(status="failed" if error else "ready")).rowcount
+            if error or not updated:  # Обработка не удалась или изображение уже удалено
+                paths = _image_files(kind, filename)
+            else:
+                paths = [_source_path(kind, filename)]
+            db_session.after_commit(db_sess, lambda: remove_files(paths))
+
+        db_session.write(operation)
+
+    @staticmethod
+    def get_status(kind, filename):
+        """Состояние обработки изображения (None, если изображения нет)"""
+        db_sess = db_session.create_session()
+        return db_sess.execute(
+            sqlalchemy.select(Image.status).where(Image.kind == kind, Image.filename == filename)
+        ).scalar()
+
+    @staticmethod
+    def process_pending():
+        """Обработка изображений, оставшихся в статусе pending (например, после
+        перезапуска сервера), в текущем процессе. Возвращает количество изображений"""
+        db_sess = db_session.create_session()
+        pending = db_sess.execute(
+            sqlalchemy.select(Image.kind, Image.filename).where(Image.status == "pending")
+        ).all()
+        db_sess.close()
+        for kind, filename in pending:
+            if os.path.exists(_source_path(kind, filename)):
+                ImageModelWorker._process(kind, filename)
+            else:
+                ImageModelWorker._finish(kind, filename, FileNotFoundError(filename))
+        return len(pending)
@@ -0,0 +1,115 @@
+import re
+import sqlalchemy
+from data import db_session
+from data.articles import Article
+from data.comments import Comment
+from data.search import articles_fts, comments_fts, users_nickname_fts
+from data.users import User
+from tools.constants import SEARCH_MAX_TERMS, SEARCH_PAGE_SIZE, SEARCH_WEIGHTS, \
+    API_MAX_PAGE_SIZE
+
+SEARCH_INDEXES = {  # Индекс, модель и индексируемые столбцы для каждого раздела поиска
+    "articles": (articles_fts, Article, ("title", "content")),
+    "comments": (comments_fts, Comment, ("text",)),
+    "users": (users_nickname_fts, User, ("nickname",))  # Индекс триграмм
+}
+
+
+def match_expression(search_string):
+    """Запрос FTS5 из строки поиска: все слова должны встречаться в тексте, последнее
+    слово может быть недописанным. Слова берутся в кавычки, поэтому операторы
+    и спецсимволы FTS5 в строке поиска не интерпретируются. None, если слов нет"""
+    terms = re.findall(r"\w+", search_string)[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+
+
+class SearchModelWorker:
+    """Класс для работы с полнотекстовыми индексами статей, комментариев и никнеймов.
+    Индексы обновляются в транзакции, изменяющей записи"""
+    @staticmethod
+    def index(db_sess, kind, ids):
+        """Добавление записей (ids - список или подзапрос с id) в индекс.
+        Вызывается после записи нового текста в сессию (id новых записей уже получены)"""
+        index, model, columns = SEARCH_INDEXES[kind]
+        db_sess.flush()
+        db_sess.execute(sqlalchemy.insert(index).from_select(
+            ("rowid",) + columns,
+            sqlalchemy.select(model.id, *[getattr(model, column) for column in columns]).where(
+                model.id.in_(ids)
+            )
+        ))
+
+    @staticmethod
+    def unindex(db_sess, kind, ids):
+        """Удаление записей (ids - список или подзапрос с id) из индекса.
+        Вызывается до изменения или удаления текста: FTS5 удаляет токены по старому тексту"""
+        index, model, columns = SEARCH_INDEXES[kind]
+        command = index.c[index.name]
+        db_sess.execute(sqlalchemy.insert(index).from_select(
+            (command.name, "rowid") + columns,
+            sqlalchemy.select(
+                sqlalchemy.literal("delete"), model.id,
+                *[getattr(model, column) for column in columns]
+            ).where(model.id.in_(ids))
+        ))
+
+    @staticmethod
+    def hits(kind, search_string, limit, offset=None):
+        """Подзапрос с id и рангом (чем меньше, тем лучше) найденных записей раздела
+        в порядке релевантности (BM25). None, если в строке поиска нет слов"""
+        match = match_expression(search_string)
+        if match is None:
+            return None
+        index = SEARCH_INDEXES[kind][0]
+        weights = ", ".join(map(str, SEARCH_WEIGHTS[kind]))
+        rank = sqlalchemy.literal_column(f"bm25({index.name}, {weights})")
+        hits = sqlalchemy.select(index.c.rowid.label("id"), rank.label("rank")).where(
+            sqlalchemy.literal_column(index.name).op("MATCH")(match)
+        ).order_by(rank).limit(limit)
+        if offset:
+            hits = hits.offset(offset)
+        return hits.subquery()
+
+    @staticmethod
+    def substring_ids(kind, substring):
+        """Подзапрос с id записей, текст которых содержит подстроку без учёта регистра
+        (только для индексов триграмм, подстрока не короче 3 символов)"""
+        index = SEARCH_INDEXES[kind][0]
+        phrase = '"{}"'.format(substring.replace('"', '""'))
+        return sqlalchemy.select(index.c.rowid).where(
+            sqlalchemy.literal_column(index.name).op("MATCH")(phrase)
+        )
+
+    @staticmethod
+    def search(query, kind, search_string, limit=None, offset=None):
+        """Выполнение запроса query к модели раздела для найденных записей в порядке
+        релевантности. Возвращает записи (не более limit) и смещение следующей
+        страницы (None, если следующей страницы нет)"""
+        if limit is None or limit < 1:
+            limit = SEARCH_PAGE_SIZE
+        limit = min(limit, API_MAX_PAGE_SIZE)
+        hits = SearchModelWorker.hits(kind, search_string, limit + 1, offset)
+        if hits is None:
+            return [], None
+        model = SEARCH_INDEXES[kind][1]
+        records = query.join(hits, model.id == hits.c.id).order_by(hits.c.rank).all()
+        if len(records) > limit:
+            return records[:limit], (offset or 0) + limit
+        return records, None
+
+    @staticmethod
+    def rebuild():
+        """Перестроение индексов по таблицам статей, комментариев и пользователей
+        (после изменения данных в обход приложения)"""
+        def operation(write_sess):
+            for index, model, columns in SEARCH_INDEXES.values():
+                write_sess.execute(sqlalchemy.insert(index).values({index.name: "rebuild"}))
+
+        db_session.write(operation)
+        db_sess = db_session.create_session()
+        return {
+            kind: db_sess.query(sqlalchemy.func.count(model.id)).scalar()
+            for kind, (index, model, columns) in SEARCH_INDEXES.items()
+        }
@@ -1,11 +1,10 @@
 from random import choices
 from string import ascii_letters, digits
-import os
-from io import BytesIO
 from datetime import datetime
 from re import fullmatch
-from PIL import Image
+import sqlalchemy
 from flask_login import login_user, current_user, logout_user
+from data.articles import Article
 from data.users import User
 from data import db_session
 from tools.errors import PasswordMismatchError, EmailAlreadyUseError, \
@@ -13,9 +12,16 @@ from tools.errors import PasswordMismatchError, EmailAlreadyUseError, \
     UnknownFilterError, IncorrectNicknameLengthError, NicknameContainsInvalidCharactersError, \
     IncorrectPasswordLengthError, NotSecurePasswordError, IncorrectEmailFormatError, \
     ForbiddenToUserError
-from tools.get_image_path import get_image_path
-from tools.constants import USERS_AVATARS_DIR, AVATAR_SIZE
-from model_workers.article_like import ArticleLikeModelWorker
+from tools.cache import data_versions
+from tools.constants import NICKNAME_MAX_CHARACTER, EXPORT_BATCH_SIZE
+from tools import password_hashing
+from tools.object_cache import object_cache
+from tools.principal import Principal, principal_cache
+from tools.cursor import apply_cursor, paginate, page_limit
+from tools.serializer import serializer_for
+from model_workers.deletion import DeletionWorker
+from model_workers.image import ImageModelWorker
+from model_workers.search import SearchModelWorker
 
 
 def check_nickname(nickname):
@@ -49,41 +55,134 @@ class UserModelWorker:
         """Пользователь в JSON формате. Применяется в основном в API"""
         if not fields:
             fields = ("id",)
-        db_sess = db_session.create_session()
-        user = db_sess.query(User).get(user_id)
-        if not user:
-            raise UserNotFoundError
-        return user.to_dict(only=fields)
+
+        def load():
+            columns, serialize = serializer_for(User, fields)
+            db_sess = db_session.create_session()
+            user = db_sess.query(*columns).filter(User.id == user_id).first()
+            if not user:
+                raise UserNotFoundError
+            return serialize(user)
+
+        return object_cache.get("user", user_id, fields, load)
 
     @staticmethod
-    def get_all_users(fields=("id", "nickname"), limit=None, offset=None,
-                      nickname_search_string=None, nickname_filter="equals",
-                      sorted_by="nickname"):
-        """Список пользователей в JSON формате. Применяется в основном в API"""
+    def get_users(user_ids, fields=("id", "nickname")):
+        """Пользователи в JSON формате по списку id ({id: пользователь}, несуществующие
+        пропускаются). Пользователи, которых нет в кэше, загружаются одним запросом.
+        Применяется в основном в API"""
         if not fields:
             fields = ("id",)
+
+        def load_many(ids):
+            columns, serialize = serializer_for(User, fields, (User.id,))
+            db_sess = db_session.create_session()
+            return {user.id: serialize(user)
+                    for user in db_sess.query(*columns).filter(User.id.in_(ids))}
+
+        return object_cache.get_many("user", user_ids, fields, load_many)
+
+    @staticmethod
+    def get_principal(user_id):
+        """Данные пользователя для Flask-Login (None, если пользователь не существует).
+        Кэшируются до изменения пользователя (версия "user:<id>") или истечения времени жизни"""
+        key = (user_id, data_versions.get(f"user:{user_id}"))
+        principal = principal_cache.get(key)
+        if principal is None:
+            db_sess = db_session.create_session()
+            user = db_sess.execute(sqlalchemy.select(
+                User.id, User.nickname, User.avatar, User.is_moderator, User.is_admin
+            ).where(User.id == user_id)).first()
+            if not user:
+                return None
+            principal = Principal(*user)
+            principal_cache.set(key, principal)
+        return principal
+
+    @staticmethod
+    def get_all_users(fields=("id", "nickname"), limit=None, offset=None,
+                      nickname_search_string=None, nickname_filter="equals",
+                      sorted_by="nickname", cursor=None):
+        """Список пользователей в JSON формате (не более limit, см. page_limit)
+        и курсор следующей страницы. Применяется в основном в API"""
+        users, serialize = UserModelWorker._list_query(fields, offset, nickname_search_string,
+                                                       nickname_filter, sorted_by, cursor)
+        users, next_cursor = paginate(users, UserModelWorker._sort_key(sorted_by), sorted_by,
+                                      page_limit(limit))
+        return [serialize(user) for user in users], next_cursor
+
+    @staticmethod
+    def export_users(fields=("id", "nickname"), offset=None, nickname_search_string=None,
+                     nickname_filter="equals", sorted_by="nickname", cursor=None):
+        """Генератор всех пользователей (после курсора) в JSON формате для выгрузки
+        в NDJSON. Строки читаются из базы порциями по EXPORT_BATCH_SIZE"""
+        users, serialize = UserModelWorker._list_query(fields, offset, nickname_search_string,
+                                                       nickname_filter, sorted_by, cursor)
+        return (serialize(user) for user in users.yield_per(EXPORT_BATCH_SIZE))
+
+    @staticmethod
+    def _sort_key(sorted_by):
+        if sorted_by == "nickname":
+            return User.nickname, User.id
+        return (User.id,)
+
+    @staticmethod
+    def _list_query(fields, offset, nickname_search_string, nickname_filter, sorted_by, cursor):
+        """Запрос списка пользователей и функция преобразования строки в словарь"""
+        sort_key = UserModelWorker._sort_key(sorted_by)
+        columns, serialize = serializer_for(User, fields, sort_key)
         db_sess = db_session.create_session()
-        users = db_sess.query(User)
+        users = db_sess.query(*columns)
         if nickname_search_string is not None:
-            if nickname_filter == "equals":
-                users = users.filter(User.nickname == nickname_search_string)
-            elif nickname_filter == "equals_case_insensitive":
-                users = users.filter(User.nickname.like(nickname_search_string))
-            elif nickname_filter == "starts":
-                users = users.filter(User.nickname.like(f"{nickname_search_string}%"))
-            elif nickname_filter == "ends":
-                users = users.filter(User.nickname.like(f"%{nickname_search_string}"))
-            elif nickname_filter == "contains":
-                users = users.filter(User.nickname.like(f"%{nickname_search_string}%"))
-            else:
-                raise UnknownFilterError(f"Unknown filter: {nickname_filter}")
-        if sorted_by == "nickname":
-            users = users.order_by(User.nickname)
+            users = users.filter(
+                UserModelWorker._nickname_condition(nickname_search_string, nickname_filter)
+            )
+        users = apply_cursor(users, sort_key, sorted_by, cursor, descending=False)
         if offset is not None:
             users = users.offset(offset)
-        if limit is not None:
-            users = users.limit(limit)
-        return [user.to_dict(only=fields) for user in users]
+        return users, serialize
+
+    @staticmethod
+    def _nickname_condition(search_string, nickname_filter):
+        """Условие поиска по никнейму. Все фильтры, кроме equals, не учитывают регистр.
+        Равенство и начало никнейма ищутся по индексу ix_users_nickname_nocase,
+        окончание и подстрока - по индексу триграмм users_nickname_fts"""
+        nickname = User.nickname.collate("NOCASE")
+        if nickname_filter == "equals":
+            return User.nickname == search_string
+        if nickname_filter == "equals_case_insensitive":
+            return nickname == search_string
+        if nickname_filter not in ("starts", "ends", "contains"):
+            raise UnknownFilterError(f"Unknown filter: {nickname_filter}")
+        if not search_string:
+            return sqlalchemy.true()
+        if nickname_filter == "starts":  # Диапазон индекса: строка поиска и её продолжения
+            return sqlalchemy.and_(nickname >= search_string,
+                                   nickname < search_string + NICKNAME_MAX_CHARACTER)
+        if len(search_string) >= 3:
+            condition = User.id.in_(SearchModelWorker.substring_ids("users", search_string))
+        else:  # Индекс триграмм не находит подстроки короче 3 символов
+            condition = sqlalchemy.func.instr(sqlalchemy.func.lower(User.nickname),
+                                              search_string.lower()) > 0
+        if nickname_filter == "ends":
+            condition = sqlalchemy.and_(condition, sqlalchemy.func.substr(
+                User.nickname, -len(search_string)
+            ).collate("NOCASE") == search_string)
+        return condition
+
+    @staticmethod
+    def find_users(search_string, limit):
+        """Пользователи, никнейм которых начинается со строки поиска (без учёта регистра),
+        для страницы поиска: один запрос по индексу ix_users_nickname_nocase.
+        Пользователь с точно совпадающим никнеймом выводится первым"""
+        db_sess = db_session.create_session()
+        users = db_sess.query(User).filter(
+            UserModelWorker._nickname_condition(search_string, "starts")
+        ).order_by(User.nickname.collate("NOCASE"), User.id).limit(limit).all()
+        # Совпадающие без учёта регистра никнеймы идут первыми в порядке индекса,
+        # поэтому точное совпадение всегда попадает в выборку
+        users.sort(key=lambda user: user.nickname != search_string)
+        return users
 
     @staticmethod
     def login(user_data):
@@ -94,144 +193,201 @@ class UserModelWorker:
             raise UserNotFoundError
         if not user.check_password(user_data["password"]):
             raise IncorrectPasswordError
+        if password_hashing.needs_rehash(user.hashed_password):  # Параметры хэширования
+            # изменились: пароль известен только при входе. Хэш вычисляется до записи
+            password_hash = password_hashing.hash_password(user_data["password"])
+
+            def operation(write_sess):
+                write_sess.execute(
+                    sqlalchemy.update(User).where(User.id == user.id).values(
+                        hashed_password=password_hash
+                    ).execution_options(synchronize_session=False)
+                )
+
+            db_session.write(operation)
         login_user(user, remember=user_data["remember_me"])
 
+    @staticmethod
+    def _check_unique(db_sess, email, nickname, user_id=None):
+        """Проверка, что почта и никнейм не заняты другими пользователями"""
+        if db_sess.query(User.id).filter(User.email == email, User.id != user_id).first():
+            raise EmailAlreadyUseError
+        if db_sess.query(User.id).filter(User.nickname == nickname, User.id != user_id).first():
+            raise UserAlreadyExistError
+
     @staticmethod
     def new_user(user_data):
-        """Регистрация нового пользователя"""
+        """Регистрация нового пользователя. Возвращает id пользователя.
+        Пароль хэшируется до записи, чтобы хэширование не занимало транзакцию"""
         if user_data["password"] != user_data["password_again"]:
             raise PasswordMismatchError
         check_password(user_data["password"])
         check_nickname(user_data["nickname"])
         check_email(user_data["email"])
-        db_sess = db_session.create_session()
-        if db_sess.query(User).filter(User.email == user_data["email"]).first():
-            raise EmailAlreadyUseError
-        if db_sess.query(User).filter(User.nickname == user_data["nickname"]).first():
-            raise UserAlreadyExistError
+        UserModelWorker._check_unique(db_session.create_session(), user_data["email"],
+                                      user_data["nickname"])
         user = User(name=user_data["name"],
                     surname=user_data["surname"],
                     nickname=user_data["nickname"],
                     email=user_data["email"])
         user.set_password(user_data["password"])
-        if user_data.get("avatar"):
-            image = Image.open(BytesIO(user_data["avatar"].read())).resize(AVATAR_SIZE)
-            filename = get_image_path(USERS_AVATARS_DIR)
-            image.save(f"{USERS_AVATARS_DIR}/{filename}")
-            user.avatar = filename
         if user_data.get("description") is not None:
             user.description = user_data["description"]
-        db_sess.add(user)
-        db_sess.commit()
+
+        def operation(db_sess):
+            # Повторная проверка: почту или никнейм могли занять во время хэширования
+            UserModelWorker._check_unique(db_sess, user_data["email"], user_data["nickname"])
+            db_sess.add(user)
+            db_sess.flush()  # id нужен для аватара и индекса никнеймов
+            SearchModelWorker.index(db_sess, "users", [user.id])
+            if user_data.get("avatar"):
+                user.avatar = ImageModelWorker.set_image(db_sess, "avatars", user.id,
+                                                         user_data["avatar"])
+            return user.id
+
+        return db_session.write(operation)
 
     @staticmethod
     def edit_user(user_id, user_data):
-        """Изменение пользователя"""
-        db_sess = db_session.create_session()
-        user = db_sess.query(User).get(user_id)
+        """Изменение пользователя. Пароль проверяется и новый пароль хэшируется до записи"""
+        user = db_session.create_session().query(User).get(user_id)
         if not user.check_password(user_data["password"]):  # Проверка пароля для
             # подтверждения изменений
             raise IncorrectPasswordError
-        if db_sess.query(User).filter(
-                User.email == user_data["email"], User.id != user_id
-        ).first():
-            raise EmailAlreadyUseError
-        if db_sess.query(User).filter(
-                User.nickname == user_data["nickname"], User.id != user_id
-        ).first():
-            raise UserAlreadyExistError
         if user_data.get("nickname") is not None:
             check_nickname(user_data["nickname"])
         if user_data.get("email") is not None:
             check_email(user_data["email"])
+        new_password_hash = None
         if user_data.get("new_password"):
             check_password(user_data["new_password"])
             if user_data["new_password"] != user_data.get("new_password_again"):
                 raise PasswordMismatchError
-            user.set_password(user_data["new_password"])
-        if user_data.get("name") is not None:
-            user.name = user_data.get("name", user.name)
-        if user_data.get("surname") is not None:
-            user.surname = user_data.get("surname", user.surname)
-        if user_data.get("nickname") is not None:
-            user.nickname = user_data.get("nickname", user.nickname)
-        if user_data.get("email") is not None:
-            user.email = user_data.get("email", user.email)
-        if user_data.get("description") is not None:
-            user.description = user_data.get("description", user.description)
-        user.modified_date = datetime.now()
-        if user_data.get("avatar"):
-            image = Image.open(BytesIO(user_data["avatar"].read())).resize(AVATAR_SIZE)
-            filename = get_image_path(USERS_AVATARS_DIR)
-            if user.avatar:
-                os.remove(f"{USERS_AVATARS_DIR}/{user.avatar}")
-            user.avatar = filename
-            image.save(f"{USERS_AVATARS_DIR}/{user.avatar}")
-        db_sess.commit()
+            new_password_hash = password_hashing.hash_password(user_data["new_password"])
+
+        def operation(db_sess):
+            UserModelWorker._check_unique(db_sess, user_data["email"], user_data["nickname"],
+                                          user_id)
+            user = db_sess.query(User).get(user_id)
+            if new_password_hash is not None:
+                user.hashed_password = new_password_hash
+            if user_data.get("name") is not None:
+                user.name = user_data.get("name", user.name)
+            if user_data.get("surname") is not None:
+                user.surname = user_data.get("surname", user.surname)
+            if user_data.get("nickname") is not None and user_data["nickname"] != user.nickname:
+                # Старый никнейм удаляется из индекса до изменения
+                SearchModelWorker.unindex(db_sess, "users", [user_id])
+                user.nickname = user_data["nickname"]
+                SearchModelWorker.index(db_sess, "users", [user_id])
+            if user_data.get("email") is not None:
+                user.email = user_data.get("email", user.email)
+            if user_data.get("description") is not None:
+                user.description = user_data.get("description", user.description)
+            user.modified_date = datetime.now()
+            if user_data.get("avatar"):
+                user.avatar = ImageModelWorker.set_image(db_sess, "avatars", user.id,
+                                                         user_data["avatar"])
+            data_versions.bump_after_commit(db_sess, "users", f"user:{user_id}")
+
+        db_session.write(operation)
+
+    @staticmethod
+    def set_avatar(user_id, avatar):
+        """Замена аватара пользователя (avatar - SpooledImage или FileStorage)"""
+        def operation(db_sess):
+            user = db_sess.query(User).get(user_id)
+            if not user:
+                raise UserNotFoundError
+            user.avatar = ImageModelWorker.set_image(db_sess, "avatars", user.id, avatar)
+            user.modified_date = datetime.now()
+            data_versions.bump_after_commit(db_sess, "users", f"user:{user_id}")
+
+        db_session.write(operation)
 
     @staticmethod
     def delete_user(user_id, user_password):
         """Удаление аккаунта пользователя"""
-        db_sess = db_session.create_session()
-        user = db_sess.query(User).get(user_id)
+        user = db_session.create_session().query(User).get(user_id)
         if not user:
             raise UserNotFoundError
         if not user.check_password(user_password):  # Проверка пароля для подтверждения удаления
             raise IncorrectPasswordError
-        if user.avatar is not None:
-            os.remove(f"{USERS_AVATARS_DIR}/{user.avatar}")
+
+        def operation(db_sess):
+            DeletionWorker.delete_user(db_sess, user_id)
+            data_versions.bump_after_commit(db_sess, "users", f"user:{user_id}", "feed")
+
+        db_session.write(operation)
         if current_user.id == user_id:
             logout_user()
-        for like in user.likes:
-            ArticleLikeModelWorker.delete_like({
-                "user_id": user_id,
-                "article_id": like.article_id
-            })
-        db_sess.delete(user)
-        db_sess.commit()
 
     @staticmethod
     def make_moderator(user_id, admin_id):
         """Назначение пользователя модератором"""
-        db_sess = db_session.create_session()
-        user = db_sess.query(User).get(user_id)
-        admin = db_sess.query(User).get(admin_id)
-        if not user or not admin:
-            raise UserNotFoundError
-        if user.is_admin or not admin.is_admin:  # Проверка на обладание полномочиями для повышения
-            raise ForbiddenToUserError
-        user.is_moderator = True
-        db_sess.commit()
+        def operation(db_sess):
+            user = db_sess.query(User).get(user_id)
+            admin = db_sess.query(User).get(admin_id)
+            if not user or not admin:
+                raise UserNotFoundError
+            # Проверка на обладание полномочиями для повышения
+            if user.is_admin or not admin.is_admin:
+                raise ForbiddenToUserError
+            user.is_moderator = True
+            data_versions.bump_after_commit(db_sess, "users", f"user:{user_id}")
+
+        db_session.write(operation)
 
     @staticmethod
     def make_simple_user(user_id, admin_id):
         """Лишение модераторских прав"""
-        db_sess = db_session.create_session()
-        user = db_sess.query(User).get(user_id)
-        admin = db_sess.query(User).get(admin_id)
-        if not user or not admin:
-            raise UserNotFoundError
-        if user.is_admin or not admin.is_admin:  # Проверка на обладание полномочиями для понижения
-            raise ForbiddenToUserError
-        user.is_moderator = False
-        db_sess.commit()
+        def operation(db_sess):
+            user = db_sess.query(User).get(user_id)
+            admin = db_sess.query(User).get(admin_id)
+            if not user or not admin:
+                raise UserNotFoundError
+            # Проверка на обладание полномочиями для понижения
+            if user.is_admin or not admin.is_admin:
+                raise ForbiddenToUserError
+            user.is_moderator = False
+            data_versions.bump_after_commit(db_sess, "users", f"user:{user_id}")
+
+        db_session.write(operation)
 
     @staticmethod
     def give_admin_rights(user_id):
         """Назначение пользователя администратором"""
-        db_sess = db_session.create_session()
-        user = db_sess.query(User).get(user_id)
-        if not user:
-            raise UserNotFoundError
-        user.is_admin = True
-        db_sess.commit()
+        UserModelWorker._set_admin(user_id, True)
 
     @staticmethod
     def revoke_admin_rights(user_id):
         """Лишение администраторских прав"""
-        db_sess = db_session.create_session()
-        user = db_sess.query(User).get(user_id)
-        if not user:
-            raise UserNotFoundError
-        user.is_admin = False
-        db_sess.commit()
+        UserModelWorker._set_admin(user_id, False)
+
+    @staticmethod
+    def _set_admin(user_id, is_admin):
+        """Изменение прав администратора пользователя"""
+        def operation(db_sess):
+            user = db_sess.query(User).get(user_id)
+            if not user:
+                raise UserNotFoundError
+            user.is_admin = is_admin
+            data_versions.bump_after_commit(db_sess, "users", f"user:{user_id}")
+
+        db_session.write(operation)
+
+    @staticmethod
+    def recount_articles_count():
+        """Пересчёт поля articles_count всех пользователей (исправление расхождений).
+        Возвращает число исправленных пользователей"""
+        def operation(db_sess):
+            articles_count = sqlalchemy.select(
+                sqlalchemy.func.count(Article.id)
+            ).where(Article.author == User.id).scalar_subquery()
+            return db_sess.execute(
+                sqlalchemy.update(User).where(User.articles_count != articles_count).values(
+                    articles_count=articles_count
+                ).execution_options(synchronize_session=False)
+            ).rowcount
+
+        return db_session.write(operation)
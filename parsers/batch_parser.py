@@ -0,0 +1,9 @@
+"""Парсер списка id для пакетного получения через API"""
+
+from flask_restful import reqparse
+
+# Список id, общий для всех пакетных запросов (добавляется в их парсеры)
+ids_argument = reqparse.Argument("ids", type=int, action="append", required=True)
+
+parser = reqparse.RequestParser()
+parser.add_argument(ids_argument)
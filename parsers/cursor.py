@@ -0,0 +1,6 @@
+"""Парсер курсора постраничного вывода статей (вместо номера страницы)"""
+
+from flask_restful import reqparse
+
+parser = reqparse.RequestParser()
+parser.add_argument("cursor", location="args", type=str)
@@ -1,14 +1,21 @@
 """Парсер получения статьи/статей через API"""
 
 from parsers.sorted_by import parser
+from parsers.batch_parser import ids_argument
 
 get_article_parser = parser.copy()
 get_article_parser.add_argument("get_field", action="append",
                                 choices=["id", "title", "content", "image",
-                                         "author", "likes_count", "create_date"],
+                                         "author", "likes_count", "comments_count",
+                                         "create_date"],
                                 default=["id", "title"])
 get_article_parser.add_argument("author", type=int)
+get_article_parser.add_argument("image_mode", choices=["url", "hex"], default="url")
 
 range_parser = get_article_parser.copy()
 range_parser.add_argument("limit", type=int)
 range_parser.add_argument("offset", type=int)
+range_parser.add_argument("cursor", type=str)
+
+batch_parser = get_article_parser.copy()
+batch_parser.add_argument(ids_argument)
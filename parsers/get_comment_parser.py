@@ -1,16 +1,22 @@
 """Парсер получения комментария/комментариев через API"""
 
 from flask_restful import reqparse
+from parsers.batch_parser import ids_argument
 
 parser = reqparse.RequestParser()
 parser.add_argument("get_field", action="append",
                     choices=["id", "author", "article_id", "text", "image", "create_date"],
                     default=["id", "author", "article_id"])
+parser.add_argument("image_mode", choices=["url", "hex"], default="url")
 
 range_parser = parser.copy()
 range_parser.add_argument("limit", type=int)
 range_parser.add_argument("offset", type=int)
+range_parser.add_argument("cursor", type=str)
 
 find_parser = range_parser.copy()
 find_parser.add_argument("author", type=int)
 find_parser.add_argument("article", type=int)
+
+batch_parser = parser.copy()
+batch_parser.add_argument(ids_argument)
@@ -1,6 +1,7 @@
 """Парсер получения пользователя/пользователей через API"""
 
 from flask_restful import reqparse
+from parsers.batch_parser import ids_argument
 
 parser = reqparse.RequestParser()
 parser.add_argument("get_field", action="append",
@@ -8,6 +9,7 @@ parser.add_argument("get_field", action="append",
                              "description", "avatar", "modified_date",
                              "is_moderator", "is_admin"],
                     default=["id", "nickname"])
+parser.add_argument("image_mode", choices=["url", "hex"], default="url")
 
 sorted_by_parser = parser.copy()
 sorted_by_parser.add_argument("sorted_by", choices=["id", "nickname"], default="id")
@@ -15,9 +17,13 @@ sorted_by_parser.add_argument("sorted_by", choices=["id", "nickname"], default="
 range_parser = sorted_by_parser.copy()
 range_parser.add_argument("limit", type=int)
 range_parser.add_argument("offset", type=int)
+range_parser.add_argument("cursor", type=str)
 
 find_parser = range_parser.copy()
 find_parser.add_argument("nickname_search_string", type=str)
 find_parser.add_argument("nickname_filter",
                          choices=["equals", "starts", "ends", "contains", "equals_case_insensitive"],
                          default="equals")
+
+batch_parser = parser.copy()
+batch_parser.add_argument(ids_argument)
@@ -0,0 +1,29 @@
+"""Парсер полнотекстового поиска статей и комментариев"""
+
+from flask_restful import reqparse
+
+parser = reqparse.RequestParser()
+parser.add_argument("q", type=str, required=True)
+parser.add_argument("type", choices=["articles", "comments"], default="articles")
+parser.add_argument("image_mode", choices=["url", "hex"], default="url")
+parser.add_argument("limit", type=int)
+parser.add_argument("offset", type=int)
+
+articles_parser = parser.copy()
+articles_parser.add_argument("get_field", action="append",
+                             choices=["id", "title", "content", "image",
+                                      "author", "likes_count", "comments_count",
+                                      "create_date"],
+                             default=["id", "title"])
+
+comments_parser = parser.copy()
+comments_parser.add_argument("get_field", action="append",
+                             choices=["id", "author", "article_id", "text", "image",
+                                      "create_date"],
+                             default=["id", "author", "article_id"])
+
+page_parser = reqparse.RequestParser()  # Страница поиска на сайте
+page_parser.add_argument("q", location="args", type=str, default="")
+page_parser.add_argument("type", location="args", choices=["articles", "comments"],
+                         default="articles")
+page_parser.add_argument("offset", location="args", type=int, default=0)
@@ -4,5 +4,5 @@ from flask_restful import reqparse
 
 parser = reqparse.RequestParser()
 parser.add_argument("sorted_by", location="args",
-                    choices=["create_date", "likes_count"],
+                    choices=["create_date", "likes_count", "hot"],
                     required=False, default="create_date")
@@ -3,7 +3,9 @@ from flask_restful import abort as fr_abort, Resource
 from flask_login import current_user
 from model_workers.article_like import ArticleLikeModelWorker
 from tools.errors import ArticleNotFoundError, LikeNotFoundError, LikeAlreadyThereError
+from parsers import batch_parser
 from tools.check_authorization import check_authorization
+from tools.batch import check_batch_ids, batch_response
 
 
 class ArticleLikeResource(Resource):
@@ -45,3 +47,29 @@ class ArticleLikeResource(Resource):
             fr_abort(404, message="Like not found")
         else:
             return jsonify({"success": "ok"})
+
+
+class ArticleLikeToggleResource(Resource):
+    """Ресурс для переключения лайка одним запросом через API"""
+    def post(self, article_id):
+        """Поставить лайк или убрать его, если он уже стоит"""
+        check_authorization()
+        try:
+            like = ArticleLikeModelWorker.toggle_like({
+                "article_id": article_id,
+                "user_id": current_user.id
+            })
+        except ArticleNotFoundError:
+            fr_abort(404, message="Article not found")
+        else:
+            return jsonify(like)
+
+
+class ArticleLikesBatchResource(Resource):
+    """Ресурс для проверки лайков под несколькими статьями одним запросом через API"""
+    def get(self):
+        """Проверить, поставил ли пользователь лайки под статьями из списка (ids)"""
+        check_authorization()
+        article_ids = check_batch_ids(batch_parser.parser.parse_args()["ids"])
+        likes = ArticleLikeModelWorker.likes_exist(current_user.id, article_ids)
+        return jsonify(batch_response("like_exist", article_ids, likes, "Article not found"))
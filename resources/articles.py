@@ -5,28 +5,28 @@ from flask_login import current_user
 from werkzeug.datastructures import FileStorage
 from parsers import add_article_parser, get_article_parser, put_article_parser
 from model_workers.article import ArticleModelWorker
-from tools.errors import ArticleNotFoundError, ForbiddenToUserError, IncorrectImageError
-from tools.image_to_byte_array import image_to_byte_array
+from tools.errors import ArticleNotFoundError, ForbiddenToUserError, IncorrectImageError, \
+    IncorrectCursorError, ImageTooLargeError
+from tools.image_url import image_field
 from tools.hex_image_to_file_storage import hex_image_to_file_storage
-from tools.constants import ARTICLES_IMAGES_DIR
 from tools.check_authorization import check_authorization
+from tools.batch import check_batch_ids, batch_response
+from tools.ndjson import wants_ndjson, ndjson_response
+from tools.upload import spool_request_image
 
 
 class ArticleResource(Resource):
     """Ресурс для взаимодействия со статьями через API"""
     def get(self, article_id):
         """Получение статьи"""
-        args = get_article_parser.parser.parse_args()
+        args = get_article_parser.get_article_parser.parse_args()
         try:
             article = ArticleModelWorker.get_article(article_id, args["get_field"])
         except ArticleNotFoundError:
-            fr_abort(404, message=f"Article not found")
+            fr_abort(404, message="Article not found")
         else:
             if "image" in article:
-                if article["image"] is not None:
-                    article["image"] = image_to_byte_array(
-                        f"{ARTICLES_IMAGES_DIR}/{article['image']}"
-                    ).hex()
+                article["image"] = image_field("articles", article["image"], args["image_mode"])
             return jsonify({"article": article})
 
     def put(self, article_id):
@@ -43,9 +43,11 @@ class ArticleResource(Resource):
                 article_data["image"] = hex_image_to_file_storage(args["image"])
             ArticleModelWorker.edit_article(article_id, current_user.id, article_data)
         except ArticleNotFoundError:
-            fr_abort(404, message=f"Article not found")
+            fr_abort(404, message="Article not found")
         except ForbiddenToUserError:
-            fr_abort(403, message=f"Forbidden")
+            fr_abort(403, message="Forbidden")
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
         except IncorrectImageError:
             fr_abort(400, message="Incorrect image")
         else:
@@ -57,9 +59,9 @@ class ArticleResource(Resource):
         try:
             ArticleModelWorker.delete_article(article_id, current_user.id)
         except ArticleNotFoundError:
-            fr_abort(404, message=f"Article not found")
+            fr_abort(404, message="Article not found")
         except ForbiddenToUserError:
-            fr_abort(403, message=f"Forbidden")
+            fr_abort(403, message="Forbidden")
         else:
             return jsonify({"success": "ok"})
 
@@ -78,21 +80,66 @@ class ArticlesListResource(Resource):
         try:
             if args.get("image") is not None:
                 article_data["image"] = hex_image_to_file_storage(args["image"])
-            ArticleModelWorker.new_article(article_data)
+            article_id = ArticleModelWorker.new_article(article_data)
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
         except IncorrectImageError:
             fr_abort(400, message="Incorrect image")
-        return jsonify({"success": "ok"})
+        return jsonify({"success": "ok", "id": article_id})
 
     def get(self):
-        """Получение списка статей"""
+        """Получение списка статей (не более limit на странице) или всех статей
+        потоком NDJSON (Accept: application/x-ndjson)"""
         args = get_article_parser.range_parser.parse_args()
-        articles = ArticleModelWorker.get_all_articles(args["get_field"], args["author"],
-                                                       args["sorted_by"],
-                                                       args["limit"], args["offset"])
+        try:
+            if wants_ndjson():
+                return ndjson_response(ArticleModelWorker.export_articles(
+                    args["get_field"], args["author"], args["sorted_by"],
+                    args["offset"], args["cursor"]
+                ), "articles")
+            articles, next_cursor = ArticleModelWorker.get_all_articles(
+                args["get_field"], args["author"], args["sorted_by"],
+                args["limit"], args["offset"], args["cursor"]
+            )
+        except IncorrectCursorError:
+            fr_abort(400, message="Incorrect cursor")
         if "image" in args["get_field"]:
             for article in articles:
-                if article["image"] is not None:
-                    article["image"] = image_to_byte_array(
-                        f"{ARTICLES_IMAGES_DIR}/{article['image']}"
-                    ).hex()
-        return jsonify({"articles": articles})
+                article["image"] = image_field("articles", article["image"], args["image_mode"])
+        return jsonify({"articles": articles, "next_cursor": next_cursor})
+
+
+class ArticleImageResource(Resource):
+    """Ресурс для загрузки изображения статьи файлом через API"""
+    def put(self, article_id):
+        """Замена изображения статьи. Тело запроса - файл изображения
+        (application/octet-stream) или форма с файлом в поле image (multipart/form-data)"""
+        check_authorization()
+        try:
+            image = spool_request_image()
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
+        except IncorrectImageError:
+            fr_abort(400, message="Incorrect image")
+        try:
+            ArticleModelWorker.edit_article(article_id, current_user.id, {"image": image})
+        except ArticleNotFoundError:
+            fr_abort(404, message="Article not found")
+        except ForbiddenToUserError:
+            fr_abort(403, message="Forbidden")
+        finally:
+            image.discard()
+        return jsonify({"success": "ok"})
+
+
+class ArticlesBatchResource(Resource):
+    """Ресурс для получения нескольких статей одним запросом через API"""
+    def get(self):
+        """Получение статей по списку id (ids) одним запросом к базе данных"""
+        args = get_article_parser.batch_parser.parse_args()
+        article_ids = check_batch_ids(args["ids"])
+        articles = ArticleModelWorker.get_articles(article_ids, args["get_field"])
+        if "image" in args["get_field"]:
+            for article in articles.values():
+                article["image"] = image_field("articles", article["image"], args["image_mode"])
+        return jsonify(batch_response("articles", article_ids, articles, "Article not found"))
@@ -0,0 +1,24 @@
+from flask import jsonify
+from flask_restful import abort as fr_abort, Resource
+from flask_login import current_user
+from data import db_session
+from tools import password_hashing
+from tools.check_authorization import check_authorization
+from tools.likes_buffer import likes_buffer
+from tools.object_cache import object_cache
+from tools.page_cache import page_cache
+
+
+class CacheStatsResource(Resource):
+    """Ресурс для получения статистики кэшей, хэширования паролей и координатора записи
+    текущего процесса через API"""
+    def get(self):
+        """Статистика кэша объектов, кэша страниц, времени хэширования паролей
+        групповых коммитов и отложенной записи лайков (только для администраторов)"""
+        check_authorization()
+        if not current_user.is_admin:
+            fr_abort(403, message="Forbidden")
+        return jsonify({"object_cache": object_cache.stats(), "page_cache": page_cache.stats(),
+                        "password_hashing": password_hashing.stats(),
+                        "write_coordinator": db_session.write_stats(),
+                        "likes_buffer": likes_buffer.stats()})
@@ -2,12 +2,14 @@ from flask import jsonify
 from flask_restful import abort as fr_abort, Resource
 from flask_login import current_user
 from parsers import get_comment_parser, add_comment_parser, put_comment_parser
-from tools.image_to_byte_array import image_to_byte_array
+from tools.image_url import image_field
 from tools.hex_image_to_file_storage import hex_image_to_file_storage
-from tools.constants import COMMENTS_IMAGES_DIR
 from tools.errors import CommentNotFoundError, ArticleNotFoundError, \
-    ForbiddenToUserError, IncorrectImageError
+    ForbiddenToUserError, IncorrectImageError, IncorrectCursorError, ImageTooLargeError
 from tools.check_authorization import check_authorization
+from tools.batch import check_batch_ids, batch_response
+from tools.ndjson import wants_ndjson, ndjson_response
+from tools.upload import spool_request_image
 from model_workers.comment import CommentModelWorker
 
 
@@ -22,10 +24,7 @@ class CommentResource(Resource):
             fr_abort(404, message="Comment not found")
         else:
             if "image" in comment:
-                if comment["image"] is not None:
-                    comment["image"] = image_to_byte_array(
-                        f"{COMMENTS_IMAGES_DIR}/{comment['image']}"
-                    ).hex()
+                comment["image"] = image_field("comments", comment["image"], args["image_mode"])
             return jsonify({"comment": comment})
 
     def put(self, comment_id):
@@ -41,6 +40,8 @@ class CommentResource(Resource):
             fr_abort(404, message="Comment not found")
         except ForbiddenToUserError:
             fr_abort(403, message="Forbidden")
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
         except IncorrectImageError:
             fr_abort(400, message="Incorrect image")
         else:
@@ -62,18 +63,25 @@ class CommentResource(Resource):
 class CommentsListResource(Resource):
     """Ресурс для взаимодействия с комментариями через API"""
     def get(self):
-        """Получение списка комментариев"""
+        """Получение списка комментариев (не более limit на странице) или всех
+        комментариев потоком NDJSON (Accept: application/x-ndjson)"""
         args = get_comment_parser.find_parser.parse_args()
-        comments = CommentModelWorker.get_all_comments(args["get_field"], args["author"],
-                                                       args["article"], args["limit"],
-                                                       args["offset"])
+        try:
+            if wants_ndjson():
+                return ndjson_response(CommentModelWorker.export_comments(
+                    args["get_field"], args["author"], args["article"],
+                    args["offset"], args["cursor"]
+                ), "comments")
+            comments, next_cursor = CommentModelWorker.get_all_comments(
+                args["get_field"], args["author"], args["article"],
+                args["limit"], args["offset"], args["cursor"]
+            )
+        except IncorrectCursorError:
+            fr_abort(400, message="Incorrect cursor")
         if "image" in args["get_field"]:
             for comment in comments:
-                if comment["image"] is not None:
-                    comment["image"] = image_to_byte_array(
-                        f"{COMMENTS_IMAGES_DIR}/{comment['image']}"
-                    ).hex()
-        return jsonify({"comments": comments})
+                comment["image"] = image_field("comments", comment["image"], args["image_mode"])
+        return jsonify({"comments": comments, "next_cursor": next_cursor})
 
     def post(self):
         """Добавление комментария"""
@@ -87,10 +95,48 @@ class CommentsListResource(Resource):
         try:
             if args["image"] is not None:
                 comment_data["image"] = hex_image_to_file_storage(args["image"])
-            CommentModelWorker.new_comment(comment_data)
+            comment_id = CommentModelWorker.new_comment(comment_data)
         except ArticleNotFoundError:
-            fr_abort(404, message=f"Article not found")
+            fr_abort(404, message="Article not found")
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
         except IncorrectImageError:
             fr_abort(400, message="Incorrect image")
         else:
-            return jsonify({"success": "ok"})
+            return jsonify({"success": "ok", "id": comment_id})
+
+
+class CommentImageResource(Resource):
+    """Ресурс для загрузки изображения комментария файлом через API"""
+    def put(self, comment_id):
+        """Замена изображения комментария. Тело запроса - файл изображения
+        (application/octet-stream) или форма с файлом в поле image (multipart/form-data)"""
+        check_authorization()
+        try:
+            image = spool_request_image()
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
+        except IncorrectImageError:
+            fr_abort(400, message="Incorrect image")
+        try:
+            CommentModelWorker.edit_comment(comment_id, current_user.id, {"image": image})
+        except CommentNotFoundError:
+            fr_abort(404, message="Comment not found")
+        except ForbiddenToUserError:
+            fr_abort(403, message="Forbidden")
+        finally:
+            image.discard()
+        return jsonify({"success": "ok"})
+
+
+class CommentsBatchResource(Resource):
+    """Ресурс для получения нескольких комментариев одним запросом через API"""
+    def get(self):
+        """Получение комментариев по списку id (ids) одним запросом к базе данных"""
+        args = get_comment_parser.batch_parser.parse_args()
+        comment_ids = check_batch_ids(args["ids"])
+        comments = CommentModelWorker.get_comments(comment_ids, args["get_field"])
+        if "image" in args["get_field"]:
+            for comment in comments.values():
+                comment["image"] = image_field("comments", comment["image"], args["image_mode"])
+        return jsonify(batch_response("comments", comment_ids, comments, "Comment not found"))
@@ -0,0 +1,30 @@
+from flask import request, send_file, jsonify
+from flask_restful import abort as fr_abort, Resource
+from model_workers.image import ImageModelWorker
+from tools.constants import IMAGES_MAX_AGE
+from tools.image_url import image_path, image_hash
+
+
+class ImageResource(Resource):
+    """Ресурс для получения изображений через API"""
+    def get(self, kind, filename):
+        """Получение файла изображения. Поддерживаются ETag/If-None-Match и Range,
+        файл отдаётся через wsgi.file_wrapper (или X-Sendfile, если он включён).
+        Пока изображение обрабатывается, возвращается статус 202"""
+        path = image_path(kind, filename)
+        file_hash = image_hash(path) if path is not None else None
+        if file_hash is None:
+            if path is not None and ImageModelWorker.get_status(kind, filename) == "pending":
+                response = jsonify({"status": "pending"})
+                response.status_code = 202
+                response.headers["Retry-After"] = "1"
+                return response
+            fr_abort(404, message="Image not found")
+        # Ссылка с актуальным хэшем никогда не изменится, её можно кэшировать надолго
+        max_age = IMAGES_MAX_AGE if request.args.get("v") == file_hash else 0
+        response = send_file(path, conditional=True, etag=file_hash, max_age=max_age)
+        if max_age:
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
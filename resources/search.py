@@ -0,0 +1,28 @@
+from flask import jsonify
+from flask_restful import Resource
+from parsers import search_parser
+from model_workers.article import ArticleModelWorker
+from model_workers.comment import CommentModelWorker
+from tools.image_url import image_field
+
+
+class SearchResource(Resource):
+    """Ресурс для полнотекстового поиска статей и комментариев через API"""
+    def get(self):
+        """Найденные статьи или комментарии (type) в порядке релевантности.
+        Следующая страница запрашивается со смещением next_offset"""
+        search_type = search_parser.parser.parse_args()["type"]
+        if search_type == "articles":
+            args = search_parser.articles_parser.parse_args()
+            results, next_offset = ArticleModelWorker.search_articles(
+                args["q"], args["get_field"], args["limit"], args["offset"]
+            )
+        else:
+            args = search_parser.comments_parser.parse_args()
+            results, next_offset = CommentModelWorker.search_comments(
+                args["q"], args["get_field"], args["limit"], args["offset"]
+            )
+        if "image" in args["get_field"]:
+            for result in results:
+                result["image"] = image_field(search_type, result["image"], args["image_mode"])
+        return jsonify({search_type: results, "next_offset": next_offset})
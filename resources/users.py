@@ -1,4 +1,4 @@
-from flask import jsonify
+from flask import jsonify, make_response
 from flask_restful import abort as fr_abort, Resource
 from flask_login import current_user, logout_user
 from model_workers.user import UserModelWorker
@@ -7,11 +7,35 @@ from parsers import login_parser, register_parser, get_user_parser, \
 from tools.errors import UserNotFoundError, IncorrectPasswordError, PasswordMismatchError, \
     UserAlreadyExistError, EmailAlreadyUseError, IncorrectNicknameLengthError, \
     NicknameContainsInvalidCharactersError, IncorrectPasswordLengthError, \
-    NotSecurePasswordError, IncorrectImageError, IncorrectEmailFormatError, ForbiddenToUserError
+    NotSecurePasswordError, IncorrectImageError, IncorrectEmailFormatError, ForbiddenToUserError, \
+    IncorrectCursorError, PasswordHashingBusyError, ImageTooLargeError
+from tools.constants import PASSWORD_HASHING_RETRY_AFTER
 from tools.hex_image_to_file_storage import hex_image_to_file_storage
-from tools.image_to_byte_array import image_to_byte_array
-from tools.constants import USERS_AVATARS_DIR
+from tools.image_url import image_field
 from tools.check_authorization import check_authorization
+from tools.batch import check_batch_ids, batch_response
+from tools.ndjson import wants_ndjson, ndjson_response
+from tools.upload import spool_request_image
+
+
+def busy_response():
+    """Ответ 503 с заголовком Retry-After, если очередь хэширования паролей заполнена.
+    Возвращается, а не вызывается через abort, чтобы отказы при нагрузке
+    не записывались в журнал как ошибки сервера"""
+    return make_response(jsonify({"message": "Too many requests, retry later"}), 503,
+                         {"Retry-After": str(PASSWORD_HASHING_RETRY_AFTER)})
+
+
+def allowed_fields(user_id, requested_fields):
+    """Запрошенные поля пользователя, доступные текущему пользователю"""
+    if current_user.is_authenticated and current_user.id == user_id:
+        fields = ("id", "name", "surname", "nickname", "email",
+                  "description", "avatar", "modified_date",
+                  "is_moderator", "is_admin")
+    else:  # Фильтрация полей по доступу к информации для сторонних пользователей
+        fields = ("id", "nickname", "description", "avatar",
+                  "is_moderator", "is_admin")
+    return tuple(field for field in fields if field in requested_fields)
 
 
 class LoginResource(Resource):
@@ -25,6 +49,8 @@ class LoginResource(Resource):
                 "password": args["password"],
                 "remember_me": args["remember_me"]
             })
+        except PasswordHashingBusyError:
+            return busy_response()
         except UserNotFoundError:
             fr_abort(404, message="Incorrect email or password")
         except IncorrectPasswordError:
@@ -47,24 +73,14 @@ class UserResource(Resource):
     def get(self, user_id):
         """Получение пользователя"""
         args = get_user_parser.parser.parse_args()
-        if current_user.is_authenticated and current_user.id == user_id:
-            fields = ("id", "name", "surname", "nickname", "email",
-                      "description", "avatar", "modified_date",
-                      "is_moderator", "is_admin")
-        else:  # Фильтрация полей по доступу к информации для сторонних пользователей
-            fields = ("id", "nickname", "description", "avatar",
-                      "is_moderator", "is_admin")
-        fields = tuple(field for field in fields if field in args["get_field"])
+        fields = allowed_fields(user_id, args["get_field"])
         try:
             user = UserModelWorker.get_user(user_id, fields)
         except UserNotFoundError:
             fr_abort(404, message="User not found")
         else:
             if "avatar" in fields:
-                if user["avatar"] is not None:
-                    user["avatar"] = image_to_byte_array(
-                        f"{USERS_AVATARS_DIR}/{user['avatar']}"
-                    ).hex()
+                user["avatar"] = image_field("avatars", user["avatar"], args["image_mode"])
             return jsonify({"user": user})
 
     def put(self, user_id):
@@ -72,7 +88,7 @@ class UserResource(Resource):
         args = put_user_parser.parser.parse_args()
         check_authorization()
         if current_user.id != user_id:
-            fr_abort(403, message=f"Forbidden")
+            fr_abort(403, message="Forbidden")
         user_data = {
                 "name": args["name"],
                 "surname": args["surname"],
@@ -87,14 +103,16 @@ class UserResource(Resource):
             if args.get("avatar") is not None:
                 user_data["avatar"] = hex_image_to_file_storage(args["avatar"])
             UserModelWorker.edit_user(user_id, user_data)
+        except PasswordHashingBusyError:
+            return busy_response()
         except IncorrectPasswordError:
             fr_abort(400, message="Incorrect password")
         except PasswordMismatchError:
             fr_abort(400, message="Password mismatch")
         except UserAlreadyExistError:
-            fr_abort(400, message=f"User already exist")
+            fr_abort(400, message="User already exist")
         except EmailAlreadyUseError:
-            fr_abort(400, message=f"Email already use")
+            fr_abort(400, message="Email already use")
         except IncorrectNicknameLengthError:
             fr_abort(400, message="Length of the nickname must be between 3 and 32")
         except NicknameContainsInvalidCharactersError:
@@ -103,6 +121,8 @@ class UserResource(Resource):
             fr_abort(400, message="Length of password must be between 8 and 512")
         except NotSecurePasswordError:
             fr_abort(400, message="Password must contain at least 1 non-whitespace character")
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
         except IncorrectImageError:
             fr_abort(400, message="Incorrect image")
         except IncorrectEmailFormatError:
@@ -115,16 +135,41 @@ class UserResource(Resource):
         args = delete_user_parser.parser.parse_args()
         check_authorization()
         if current_user.id != user_id:
-            fr_abort(403, message=f"Forbidden")
+            fr_abort(403, message="Forbidden")
         try:
             UserModelWorker.delete_user(user_id, args["password"])
+        except PasswordHashingBusyError:
+            return busy_response()
         except UserNotFoundError:
-            fr_abort(404, message=f"User not found")
+            fr_abort(404, message="User not found")
         except IncorrectPasswordError:
             fr_abort(400, message="Incorrect password")
         return jsonify({"success": "ok"})
 
 
+class UserAvatarResource(Resource):
+    """Ресурс для загрузки аватара файлом через API"""
+    def put(self, user_id):
+        """Замена аватара. Тело запроса - файл изображения (application/octet-stream)
+        или форма с файлом в поле avatar (multipart/form-data)"""
+        check_authorization()
+        if current_user.id != user_id:
+            fr_abort(403, message="Forbidden")
+        try:
+            avatar = spool_request_image("avatar")
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
+        except IncorrectImageError:
+            fr_abort(400, message="Incorrect image")
+        try:
+            UserModelWorker.set_avatar(user_id, avatar)
+        except UserNotFoundError:
+            fr_abort(404, message="User not found")
+        finally:
+            avatar.discard()
+        return jsonify({"success": "ok"})
+
+
 class UsersListResource(Resource):
     """Ресурс для взаимодействия с пользователями через API"""
     def post(self):
@@ -142,7 +187,9 @@ class UsersListResource(Resource):
         try:
             if args.get("avatar") is not None:
                 user_data["avatar"] = hex_image_to_file_storage(args["avatar"])
-            UserModelWorker.new_user(user_data)
+            user_id = UserModelWorker.new_user(user_data)
+        except PasswordHashingBusyError:
+            return busy_response()
         except PasswordMismatchError:
             fr_abort(400, message="Password mismatch")
         except UserAlreadyExistError:
@@ -157,30 +204,38 @@ class UsersListResource(Resource):
             fr_abort(400, message="Length of password must be between 8 and 512")
         except NotSecurePasswordError:
             fr_abort(400, message="Password must contain at least 1 non-whitespace character")
+        except ImageTooLargeError:
+            fr_abort(413, message="Image too large")
         except IncorrectImageError:
             fr_abort(400, message="Incorrect image")
         except IncorrectEmailFormatError:
             fr_abort(400, message="Incorrect email format")
         else:
-            return jsonify({"success": "ok"})
+            return jsonify({"success": "ok", "id": user_id})
 
     def get(self):
-        """Получение списка пользователей"""
+        """Получение списка пользователей (не более limit на странице) или всех
+        пользователей потоком NDJSON (Accept: application/x-ndjson)"""
         args = get_user_parser.find_parser.parse_args()
         fields = tuple(field for field in ("id", "nickname", "description",
                                            "avatar", "is_moderator", "is_admin")
                        if field in args["get_field"])
-        users = UserModelWorker.get_all_users(fields,
-                                              args["limit"], args["offset"],
-                                              args["nickname_search_string"],
-                                              args["nickname_filter"], args["sorted_by"])
+        try:
+            if wants_ndjson():
+                return ndjson_response(UserModelWorker.export_users(
+                    fields, args["offset"], args["nickname_search_string"],
+                    args["nickname_filter"], args["sorted_by"], args["cursor"]
+                ), "avatars", "avatar")
+            users, next_cursor = UserModelWorker.get_all_users(
+                fields, args["limit"], args["offset"], args["nickname_search_string"],
+                args["nickname_filter"], args["sorted_by"], args["cursor"]
+            )
+        except IncorrectCursorError:
+            fr_abort(400, message="Incorrect cursor")
         if "avatar" in fields:
             for user in users:
-                if user["avatar"] is not None:
-                    user["avatar"] = image_to_byte_array(
-                        f"{USERS_AVATARS_DIR}/{user['avatar']}"
-                    ).hex()
-        return jsonify({"users": users})
+                user["avatar"] = image_field("avatars", user["avatar"], args["image_mode"])
+        return jsonify({"users": users, "next_cursor": next_cursor})
 
 
 class ModeratorResource(Resource):
@@ -205,3 +260,26 @@ class ModeratorResource(Resource):
             fr_abort(403, message="Forbidden")
         else:
             return jsonify({"success": "ok"})
+
+
+class UsersBatchResource(Resource):
+    """Ресурс для получения нескольких пользователей одним запросом через API"""
+    def get(self):
+        """Получение пользователей по списку id (ids) одним запросом к базе данных.
+        Поля фильтруются по доступу так же, как при получении одного пользователя"""
+        args = get_user_parser.batch_parser.parse_args()
+        user_ids = check_batch_ids(args["ids"])
+        own_id = current_user.id if current_user.is_authenticated else None
+        users = UserModelWorker.get_users([user_id for user_id in user_ids if user_id != own_id],
+                                          allowed_fields(None, args["get_field"]))
+        if own_id in user_ids:  # Свой аккаунт - с закрытыми для остальных полями
+            try:
+                users[own_id] = UserModelWorker.get_user(
+                    own_id, allowed_fields(own_id, args["get_field"])
+                )
+            except UserNotFoundError:
+                pass
+        for user in users.values():
+            if "avatar" in user:
+                user["avatar"] = image_field("avatars", user["avatar"], args["image_mode"])
+        return jsonify(batch_response("users", user_ids, users, "User not found"))
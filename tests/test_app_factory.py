@@ -0,0 +1,20 @@
+from main import create_app
+
+
+def _rules(app):
+    return {rule.rule for rule in app.url_map.iter_rules()}
+
+
+def test_each_call_creates_separate_app():
+    first = create_app({"SECRET_KEY": "first", "PROCESSES": 4}, init_db=False)
+    second = create_app({"TESTING": True}, init_db=False)
+    assert first is not second
+    # Настройки одного приложения не меняют настройки другого и значения по умолчанию
+    assert first.config["SECRET_KEY"] == "first" and first.config["PROCESSES"] == 4
+    assert second.config["SECRET_KEY"] == "cyberjournal" and second.config["PROCESSES"] == 1
+    assert second.testing and not first.testing
+    # Страницы и ресурсы API регистрируются в каждом приложении
+    for app in (first, second):
+        assert {"/", "/article/<int:article_id>", "/api/articles",
+                "/api/like/<int:article_id>/toggle"} <= _rules(app)
+        assert "image_static_url" in app.jinja_env.globals
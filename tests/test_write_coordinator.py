@@ -0,0 +1,97 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+import pytest
+
+from data import db_session
+from data.write_coordinator import WriteCoordinator
+
+metadata = sa.MetaData()
+items = sa.Table("items", metadata, sa.Column("id", sa.Integer, primary_key=True))
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Файловая база (для проверки видимости из другого соединения) и фабрика
+    сессий с теми же обработчиками транзакций, что и в db_session.global_init"""
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'test.db'}?check_same_thread=False")
+    metadata.create_all(engine)
+    factory = orm.sessionmaker(bind=engine)
+    sa.event.listen(factory, "after_commit", db_session._run_after_commit)
+    sa.event.listen(factory, "after_rollback", db_session._run_after_rollback)
+    yield engine, factory
+    engine.dispose()
+
+
+def _visible(engine, item_id):
+    """Видна ли запись из другого соединения (то есть закоммичена ли транзакция)"""
+    with engine.connect() as connection:
+        return connection.execute(
+            sa.select(items.c.id).where(items.c.id == item_id)
+        ).first() is not None
+
+
+def _insert(item_id, events, engine=None):
+    def operation(db_sess):
+        db_sess.execute(items.insert().values(id=item_id))
+        db_session.after_commit(db_sess, lambda: events.append(
+            (item_id, engine is None or _visible(engine, item_id))
+        ))
+        return item_id
+    return operation
+
+
+def _fail(events):
+    def operation(db_sess):
+        db_session.after_commit(db_sess, lambda: events.append(("failed", True)))
+        db_session.after_rollback(db_sess, lambda: events.append(("rolled back", True)))
+        raise ValueError("operation failed")
+    return operation
+
+
+def test_callbacks_run_after_group_commit(database):
+    engine, factory = database
+    coordinator = WriteCoordinator(factory, max_batch_size=16, max_delay=0.2)
+    events = []
+    futures = [coordinator.submit(_insert(item_id, events, engine)) for item_id in (1, 2, 3)]
+    assert [future.result(timeout=5) for future in futures] == [1, 2, 3]
+    # Все действия выполнены, и каждое - когда записи группы уже видны другим соединениям
+    assert events == [(1, True), (2, True), (3, True)]
+    assert coordinator.stats()["max_batch"] == 3
+
+
+def test_failed_operation_discards_only_its_callbacks(database):
+    engine, factory = database
+    coordinator = WriteCoordinator(factory, max_batch_size=16, max_delay=0.2)
+    events = []
+    futures = [coordinator.submit(_insert(1, events)), coordinator.submit(_fail(events)),
+               coordinator.submit(_insert(2, events))]
+    assert futures[0].result(timeout=5) == 1
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 2
+    # Действие отмены выполнено сразу при откате операции, остальные - после коммита
+    assert events == [("rolled back", True), (1, True), (2, True)]
+    assert _visible(engine, 1) and _visible(engine, 2)
+    assert coordinator.stats()["failed"] == 1
+
+
+def test_commit_failure_fails_group_with_rollback_callbacks(database):
+    engine, factory = database
+    coordinator = WriteCoordinator(factory, max_batch_size=16, max_delay=0.2)
+    events = []
+
+    @sa.event.listens_for(factory, "before_commit")
+    def fail_commit(db_sess):
+        if not db_sess.in_nested_transaction():
+            raise RuntimeError("commit failed")
+
+    def operation(db_sess):
+        _insert(2, events)(db_sess)
+        db_session.after_rollback(db_sess, lambda: events.append(("rolled back", 2)))
+
+    futures = [coordinator.submit(_insert(1, events)), coordinator.submit(operation)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    assert events == [("rolled back", 2)]
+    assert not _visible(engine, 1) and not _visible(engine, 2)
@@ -0,0 +1,21 @@
+from flask_restful import abort
+from tools.constants import BATCH_MAX_IDS
+
+
+def check_batch_ids(ids):
+    """Список id пакетного запроса без повторов (в исходном порядке).
+    Слишком длинный список отклоняется с кодом 400"""
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > BATCH_MAX_IDS:
+        abort(400, message=f"No more than {BATCH_MAX_IDS} ids per request")
+    return ids
+
+
+def batch_response(name, ids, found, not_found_message):
+    """Ответ пакетного запроса: найденные объекты по id (ключи - строки, так как
+    запрошенные поля могут не содержать id) и ошибки для отсутствующих id"""
+    return {
+        name: {str(entity_id): found[entity_id] for entity_id in ids if entity_id in found},
+        "errors": {str(entity_id): not_found_message for entity_id in ids
+                   if entity_id not in found}
+    }
@@ -0,0 +1,148 @@
+import sys
+import threading
+from collections import OrderedDict
+from time import monotonic
+from data import db_session
+
+
+class LRUCache:
+    """Потокобезопасный кэш в памяти процесса с вытеснением давно не использованных
+    записей (LRU). Суммарный вес записей ограничен max_weight (по умолчанию вес записи - 1).
+    Запись свежая ttl секунд, после этого ещё stale_ttl секунд она может отдаваться
+    устаревшей, пока её обновляет один из запросов (stale-while-revalidate)"""
+    def __init__(self, max_weight, ttl, stale_ttl=0, weigher=None):
+        self.max_weight = max_weight
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._weigher = weigher or (lambda value: 1)
+        self._entries = OrderedDict()  # key: [value, weight, fresh_until, stale_until, refreshing]
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def lookup(self, key):
+        """Поиск записи. Возвращает (value, refresh): value - None, если записи нет;
+        refresh - True, если вызывающий код должен вычислить значение и вызвать set
+        (при отсутствии записи или первому обратившемуся к устаревшей записи)"""
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, True
+            value, weight, fresh_until, stale_until, refreshing = entry
+            if now < fresh_until:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value, False
+            if now < stale_until:
+                entry[4] = True
+                if refreshing:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                return value, not refreshing
+            self.misses += 1
+            self._pop(key)
+            return None, True
+
+    def get(self, key, default=None):
+        """Свежее значение записи (устаревшие записи не возвращаются)"""
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now >= entry[2]:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        """Добавление или обновление записи с вытеснением давно не использованных"""
+        weight = self._weigher(value)
+        if weight > self.max_weight:
+            return
+        now = monotonic()
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = [value, weight, now + self.ttl,
+                                  now + self.ttl + self.stale_ttl, False]
+            self._weight += weight
+            while self._weight > self.max_weight:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        """Удаление записи"""
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        """Удаление всех записей"""
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def stats(self):
+        """Статистика кэша: попадания, промахи, вытеснения, количество и вес записей"""
+        with self._lock:
+            requests_count = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / requests_count, 4) if requests_count else None,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "weight": self._weight,
+                "max_weight": self.max_weight
+            }
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._weight -= entry[1]
+        return entry
+
+
+class Versions:
+    """Счётчики версий именованных наборов данных (например, "feed" или "article:1").
+    Версии входят в ключи кэша, поэтому увеличение версии делает недействительными
+    все записи, построенные по старым данным, без их поиска и удаления"""
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, *names):
+        """Текущие версии наборов данных"""
+        return tuple(self._versions.get(name, 0) for name in names)
+
+    def bump(self, *names):
+        """Увеличение версий наборов данных"""
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def bump_after_commit(self, db_sess, *names):
+        """Увеличение версий после коммита транзакции сессии (до коммита кэш
+        мог бы заполниться ещё не изменёнными данными под новой версией)"""
+        db_session.after_commit(db_sess, lambda: self.bump(*names))
+
+
+def approximate_size(value):
+    """Приблизительный размер (в байтах) словаря или списка простых значений"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        return size + sum(sys.getsizeof(key) + approximate_size(item)
+                          for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return size + sum(approximate_size(item) for item in value)
+    return size
+
+
+# Версии данных, общие для кэшей страниц и объектов: "feed", "users", "cascade"
+# (каскадное удаление), "article:<id>", "comment:<id>", "user:<id>". Изменения
+# likes_count увеличивают только "likes:<id>", от которой зависят лишь объекты статей
+# с полем likes_count: на страницах счётчики и порядок по лайкам обновляются по
+# истечении PAGE_CACHE_TTL, поэтому поток лайков не вызывает перерисовку на каждый лайк
+data_versions = Versions()
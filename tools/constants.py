@@ -6,3 +6,95 @@ ARTICLES_IMAGES_DIR = "static/img/articles_images"
 COMMENTS_IMAGES_DIR = "static/img/comments_images"
 
 AVATAR_SIZE = 48, 48
+
+FEED_PREVIEW_LENGTH = 300  # Длина начала статьи, загружаемого для ленты (больше, чем обрезает шаблон)
+
+IMAGES_DIRS = {  # Разделы изображений, доступные через /api/image/<kind>/<filename>
+    "articles": ARTICLES_IMAGES_DIR,
+    "comments": COMMENTS_IMAGES_DIR,
+    "avatars": USERS_AVATARS_DIR
+}
+IMAGES_URL_PREFIX = "/api/image"
+IMAGES_MAX_AGE = 365 * 24 * 60 * 60  # Время кэширования изображения по ссылке с хэшем (в секундах)
+IMAGES_HASH_CACHE_SIZE = 65536  # Количество хранимых в памяти хэшей файлов изображений
+
+IMAGES_INCOMING_DIR = "db/incoming_images"  # Загруженные файлы, ожидающие обработки (вне static)
+IMAGES_FORMATS = {"PNG", "JPEG", "GIF", "WEBP", "BMP"}  # Принимаемые форматы загружаемых изображений
+IMAGES_MAX_PIXELS = 40_000_000  # Максимальное количество пикселей загружаемого изображения
+IMAGES_RENDITIONS = {  # Варианты изображения (наибольший размер) для каждого раздела
+    "articles": {"orig": (2048, 2048), "feed": (800, 800), "thumb": (320, 320)},
+    "comments": {"orig": (2048, 2048), "thumb": (320, 320)},
+    "avatars": {"orig": AVATAR_SIZE}
+}
+IMAGES_CROPPED = {"avatars"}  # Разделы, изображения которых обрезаются точно до заданного размера
+IMAGES_EXTENSION = "webp"
+IMAGES_QUALITY = 85
+IMAGES_MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # Максимальный размер файла загружаемого изображения
+IMAGES_UPLOAD_CHUNK_SIZE = 64 * 1024  # Размер блока, которым загрузка записывается во временный файл
+# Максимальный размер тела запроса: изображение в hex строке JSON занимает вдвое больше места
+REQUEST_MAX_SIZE = 2 * IMAGES_MAX_UPLOAD_SIZE + 1024 * 1024
+IMAGES_PIPELINE_WORKERS = 2  # Количество процессов обработки изображений
+IMAGES_PIPELINE_QUEUE_SIZE = 32  # При большем количестве задач изображение обрабатывается в запросе
+
+PAGE_CACHE_TTL = 1  # Время (в секундах), в течение которого страница для гостей не обновляется
+PAGE_CACHE_STALE_TTL = 30  # Время, в течение которого отдаётся устаревшая страница при обновлении
+PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Суммарный размер страниц в кэше процесса
+
+OBJECT_CACHE_TTL = 60  # Время жизни (в секундах) объекта в кэше (изменения в других процессах)
+OBJECT_CACHE_MAX_BYTES = 32 * 1024 * 1024  # Приблизительный суммарный размер объектов в кэше
+
+PRINCIPAL_CACHE_TTL = 30  # Время жизни (в секундах) данных авторизованного пользователя в кэше
+PRINCIPAL_CACHE_SIZE = 10000  # Количество пользователей в кэше
+# Время жизни объектов и пользователей в кэше при нескольких процессах сервера: кэш
+# и версии данных у каждого процесса свои, изменение, сделанное другим процессом,
+# видно не позже чем через это время
+MULTIPROCESS_CACHE_TTL = 1
+
+SEARCH_PAGE_SIZE = 10  # Количество результатов поиска на странице (по умолчанию в API)
+SEARCH_MAX_TERMS = 16  # Учитываемое количество слов строки поиска
+SEARCH_WEIGHTS = {  # Веса столбцов индекса в ранжировании BM25 (совпадение в заголовке важнее)
+    "articles": (10.0, 1.0),
+    "comments": (1.0,)
+}
+
+FIND_USERS_PAGE_SIZE = 20  # Количество пользователей на странице поиска
+# Символ больше любого символа никнейма: верхняя граница диапазона никнеймов с заданным началом
+NICKNAME_MAX_CHARACTER = "\U0010ffff"
+
+# Параметры хэширования паролей (werkzeug). При их изменении хэш пароля
+# пересоздаётся при следующем входе пользователя
+PASSWORD_HASH_METHOD = "pbkdf2:sha256:260000"
+PASSWORD_SALT_LENGTH = 16
+PASSWORD_HASHING_WORKERS = 2  # Количество потоков хэширования паролей в процессе
+PASSWORD_HASHING_QUEUE_SIZE = 16  # При большем количестве ожидающих запросов - ответ 503
+PASSWORD_HASHING_RETRY_AFTER = 1  # Время (в секундах), через которое запрос можно повторить
+
+# Пул соединений с базой данных (data.db_session.global_init)
+DB_POOL_SIZE = 5  # Количество постоянно открытых соединений
+DB_MAX_OVERFLOW = 10  # Количество дополнительных соединений при нагрузке
+DB_POOL_TIMEOUT = 30  # Время (в секундах) ожидания свободного соединения
+DB_POOL_RECYCLE = -1  # Время (в секундах) жизни соединения (-1 - без ограничения)
+
+# Координатор записи: запись одним потоком с групповыми коммитами (data.write_coordinator)
+WRITE_COORDINATOR = False
+WRITE_BATCH_MAX_SIZE = 64  # Максимальное количество операций в одной транзакции
+WRITE_BATCH_MAX_DELAY = 0.002  # Время (в секундах) ожидания операций для группы
+
+# Отложенная запись likes_count (tools.likes_buffer): изменения счётчиков записываются
+# раз в LIKES_FLUSH_INTERVAL секунд или после LIKES_FLUSH_THRESHOLD изменений
+LIKES_WRITE_BEHIND = True
+LIKES_FLUSH_INTERVAL = 1.0
+LIKES_FLUSH_THRESHOLD = 1000
+
+# Лента sorted_by=hot (data.article_scores): оценка статьи (лайки + HOT_COMMENT_WEIGHT *
+# комментарии + 1) / (возраст в часах + 2) ** HOT_GRAVITY. Статьи старше HOT_WINDOW_DAYS
+# дней получают оценку 0 и идут после остальных по убыванию id
+HOT_COMMENT_WEIGHT = 2
+HOT_GRAVITY = 1.8
+HOT_WINDOW_DAYS = 7
+
+BATCH_MAX_IDS = 100  # Максимальное количество id в одном запросе пакетного получения через API
+
+API_PAGE_SIZE = 20  # Количество записей на странице списка в API (если limit не указан)
+API_MAX_PAGE_SIZE = 100  # Максимальное количество записей на странице списка в API
+EXPORT_BATCH_SIZE = 500  # Количество строк, читаемых из базы за раз при выгрузке в NDJSON
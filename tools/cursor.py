@@ -0,0 +1,63 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+import sqlalchemy
+from tools.constants import API_PAGE_SIZE, API_MAX_PAGE_SIZE
+from tools.errors import IncorrectCursorError
+
+
+def page_limit(limit):
+    """Размер страницы списка: API_PAGE_SIZE, если limit не указан (или не положителен),
+    и не более API_MAX_PAGE_SIZE. Весь список можно получить только выгрузкой в NDJSON"""
+    if limit is None or limit < 1:
+        return API_PAGE_SIZE
+    return min(limit, API_MAX_PAGE_SIZE)
+
+
+def encode_cursor(sorted_by, values):
+    """Непрозрачный курсор из метода сортировки и значений ключа сортировки последней записи"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    payload = json.dumps({"s": sorted_by, "k": values}, separators=(",", ":"))
+    return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sorted_by, sort_key):
+    """Значения ключа сортировки из курсора. sort_key - столбцы, по которым
+    отсортирована выдача (значения дат восстанавливаются по типу столбца)"""
+    try:
+        payload = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload["s"] != sorted_by or len(payload["k"]) != len(sort_key):
+            raise IncorrectCursorError
+        return [
+            datetime.fromisoformat(value)
+            if isinstance(column.type, sqlalchemy.DateTime) else value
+            for column, value in zip(sort_key, payload["k"])
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise IncorrectCursorError
+
+
+def apply_cursor(query, sort_key, sorted_by, cursor, descending):
+    """Сортировка запроса по sort_key и фильтрация записей, идущих после курсора
+    (сравнение кортежей (a, b, id) < (?, ?, ?) выполняется по индексу без OFFSET)"""
+    if descending:
+        query = query.order_by(*(column.desc() for column in sort_key))
+    else:
+        query = query.order_by(*sort_key)
+    if cursor is None:
+        return query
+    key = sqlalchemy.tuple_(*sort_key)
+    values = sqlalchemy.tuple_(*decode_cursor(cursor, sorted_by, sort_key))
+    return query.filter(key < values if descending else key > values)
+
+
+def paginate(query, sort_key, sorted_by, limit):
+    """Выполнение запроса: записи (не более limit) и курсор следующей страницы
+    (None, если следующей страницы нет)"""
+    if limit is None:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sorted_by, [getattr(rows[-1], column.key) for column in sort_key])
@@ -79,6 +79,21 @@ class IncorrectImageError(Exception):
     pass
 
 
+class ImageTooLargeError(IncorrectImageError):
+    """Размер загруженного изображения больше IMAGES_MAX_UPLOAD_SIZE"""
+    pass
+
+
 class IncorrectEmailFormatError(Exception):
     """Некорректный адрес электронной почты"""
     pass
+
+
+class IncorrectCursorError(Exception):
+    """Некорректный курсор постраничного вывода (повреждён или получен для другой сортировки)"""
+    pass
+
+
+class PasswordHashingBusyError(Exception):
+    """Очередь хэширования паролей заполнена (запрос нужно повторить позже)"""
+    pass
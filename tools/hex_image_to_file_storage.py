@@ -1,10 +1,14 @@
 from io import BytesIO
 from werkzeug.datastructures import FileStorage
-from tools.errors import IncorrectImageError
+from tools.constants import IMAGES_MAX_UPLOAD_SIZE
+from tools.errors import IncorrectImageError, ImageTooLargeError
 
 
 def hex_image_to_file_storage(hex_image):
-    """Преобразование hex строки в объект FileStorage для обработки при помощи PIL"""
+    """Преобразование hex строки в объект FileStorage для обработки при помощи PIL.
+    Большие изображения лучше загружать файлом (см. tools.upload)"""
+    if len(hex_image) > 2 * IMAGES_MAX_UPLOAD_SIZE:
+        raise ImageTooLargeError
     try:
         return FileStorage(BytesIO(bytes.fromhex(hex_image)), "qq.png")
     except Exception:
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from tools.constants import IMAGES_PIPELINE_WORKERS, IMAGES_PIPELINE_QUEUE_SIZE
+
+
+class _Pipeline:
+    """Пул процессов обработки изображений текущего процесса приложения"""
+    executor = None
+    pid = None
+    slots = None
+    lock = threading.Lock()
+
+
+def _get_executor():
+    """Пул процессов создаётся при первой задаче. После fork (например, в воркерах
+    сервера приложений) пул родительского процесса не используется, создаётся новый"""
+    with _Pipeline.lock:
+        if _Pipeline.executor is None or _Pipeline.pid != os.getpid():
+            # Процессы порождаются отдельным сервером с заранее импортированным модулем
+            # обработки. __main__ родительского процесса импортируется в них заново,
+            # поэтому точки входа (скрипты, импортирующие приложение) должны выполнять
+            # свой код только под if __name__ == "__main__"
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["tools.image_processing"])
+            _Pipeline.executor = ProcessPoolExecutor(IMAGES_PIPELINE_WORKERS, mp_context=context)
+            _Pipeline.pid = os.getpid()
+            _Pipeline.slots = threading.BoundedSemaphore(IMAGES_PIPELINE_QUEUE_SIZE)
+        return _Pipeline.executor, _Pipeline.slots
+
+
+def submit(function, args, callback):
+    """Постановка задачи в очередь пула процессов. По завершении задачи в фоновом потоке
+    вызывается callback(error) (error - исключение задачи или None).
+    Возвращает False, если очередь заполнена или пул недоступен (задача не поставлена)"""
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        return False
+    try:
+        future = executor.submit(function, *args)
+    except (RuntimeError, OSError):  # Пул остановлен или один из процессов аварийно завершился
+        slots.release()
+        with _Pipeline.lock:
+            if _Pipeline.executor is executor:
+                _Pipeline.executor = None
+        return False
+
+    def done(future):
+        slots.release()
+        callback(future.exception())
+
+    future.add_done_callback(done)
+    return True
+
+
+def shutdown(wait=True):
+    """Остановка пула процессов (с ожиданием поставленных задач при wait=True)"""
+    with _Pipeline.lock:
+        executor, _Pipeline.executor = _Pipeline.executor, None
+    if executor is not None and _Pipeline.pid == os.getpid():
+        executor.shutdown(wait=wait)
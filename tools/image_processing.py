@@ -0,0 +1,81 @@
+import os
+from PIL import Image, ImageOps, UnidentifiedImageError
+from tools.constants import IMAGES_FORMATS, IMAGES_MAX_PIXELS, IMAGES_QUALITY
+from tools.errors import IncorrectImageError
+
+
+# Сигнатуры в начале файла для каждого принимаемого формата (WEBP: RIFF....WEBP)
+IMAGES_SIGNATURES = {
+    "PNG": (b"\x89PNG\r\n\x1a\n",),
+    "JPEG": (b"\xff\xd8\xff",),
+    "GIF": (b"GIF87a", b"GIF89a"),
+    "BMP": (b"BM",)
+}
+IMAGE_HEADER_SIZE = 12  # Количество байт, достаточное для определения формата
+
+
+def sniff_image_format(header):
+    """Формат изображения по первым IMAGE_HEADER_SIZE байтам файла
+    (None, если формат не входит в IMAGES_FORMATS)"""
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        image_format = "WEBP"
+    else:
+        image_format = next((
+            image_format for image_format, signatures in IMAGES_SIGNATURES.items()
+            if header.startswith(signatures)
+        ), None)
+    return image_format if image_format in IMAGES_FORMATS else None
+
+
+def check_image(source):
+    """Быстрая проверка загруженного файла (source - путь или файловый объект):
+    формат и размеры читаются из заголовка, само изображение не декодируется"""
+    try:
+        with Image.open(source) as image:
+            image_format = image.format
+            width, height = image.size
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        raise IncorrectImageError
+    if image_format not in IMAGES_FORMATS or not width or not height \
+            or width * height > IMAGES_MAX_PIXELS:
+        raise IncorrectImageError
+
+
+def rendition_filename(filename, rendition):
+    """Имя файла варианта изображения ("orig" - основной файл, имя которого хранится в базе)"""
+    if rendition == "orig":
+        return filename
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}_{rendition}{extension}"
+
+
+def _save(image, path):
+    """Сохранение без метаданных. Файл появляется под итоговым именем только целиком"""
+    temp_path = f"{path}.tmp"
+    image.save(temp_path, format="WEBP", quality=IMAGES_QUALITY, method=4)
+    os.replace(temp_path, path)
+
+
+def process_image(source_path, dir_path, filename, renditions, crop=False):
+    """Обработка загруженного изображения (выполняется в процессе обработки изображений):
+    декодирование, поворот по EXIF, удаление метаданных и сохранение вариантов изображения.
+    Основной вариант сохраняется последним, его наличие означает готовность всех вариантов.
+    При crop=True изображение обрезается точно до заданного размера (аватары)"""
+    Image.MAX_IMAGE_PIXELS = IMAGES_MAX_PIXELS
+    try:
+        with Image.open(source_path) as source:
+            image = ImageOps.exif_transpose(source)
+            has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        raise IncorrectImageError
+    image.info = {}
+    os.makedirs(os.path.dirname(os.path.join(dir_path, filename)), exist_ok=True)
+    for rendition in sorted(renditions, key=lambda name: name == "orig"):
+        size = renditions[rendition]
+        if crop:
+            resized = ImageOps.fit(image, size)
+        else:
+            resized = image.copy()
+            resized.thumbnail(size)
+        _save(resized, os.path.join(dir_path, rendition_filename(filename, rendition)))
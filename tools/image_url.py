@@ -0,0 +1,73 @@
+import os
+from functools import lru_cache
+from hashlib import sha256
+from flask import url_for
+from werkzeug.utils import safe_join
+from tools.constants import IMAGES_DIRS, IMAGES_URL_PREFIX, IMAGES_HASH_CACHE_SIZE
+from tools.image_processing import rendition_filename
+from tools.image_to_byte_array import image_to_byte_array
+
+
+@lru_cache(maxsize=IMAGES_HASH_CACHE_SIZE)
+def _file_hash(path, mtime_ns, size):
+    """Хэш содержимого файла. Время изменения и размер входят в ключ кэша,
+    поэтому при перезаписи файла хэш будет вычислен заново"""
+    digest = sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def image_path(kind, filename):
+    """Путь к файлу изображения (None, если раздел или имя файла некорректны)"""
+    if kind not in IMAGES_DIRS:
+        return None
+    return safe_join(IMAGES_DIRS[kind], filename)
+
+
+def image_hash(path):
+    """Хэш содержимого файла изображения (None, если файл не существует)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+def image_url(kind, filename):
+    """Постоянная ссылка на изображение с хэшем содержимого. Пока изображение
+    обрабатывается, возвращается ссылка без хэша (по ней отдаётся статус 202)"""
+    path = image_path(kind, filename)
+    if path is None:
+        return None
+    file_hash = image_hash(path)
+    if file_hash is None:
+        return f"{IMAGES_URL_PREFIX}/{kind}/{filename}"
+    return f"{IMAGES_URL_PREFIX}/{kind}/{filename}?v={file_hash}"
+
+
+def image_static_url(kind, filename, rendition="orig"):
+    """Ссылка на вариант изображения в static для шаблонов. Для изображений без вариантов
+    (загруженных до появления обработки) используется основной файл.
+    None, если изображения нет или оно ещё обрабатывается"""
+    if not filename:
+        return None
+    for name in (rendition_filename(filename, rendition), filename):
+        path = image_path(kind, name)
+        if path is not None and os.path.exists(path):
+            return url_for("static", filename=os.path.relpath(path, "static"))
+    return None
+
+
+def image_field(kind, filename, image_mode="url"):
+    """Значение поля изображения в ответе API: ссылка (по умолчанию)
+    или hex строка (устаревший формат)"""
+    if filename is None:
+        return None
+    if image_mode == "hex":
+        path = image_path(kind, filename)
+        if path is None or not os.path.exists(path):  # Изображение ещё обрабатывается
+            return None
+        return image_to_byte_array(path).hex()
+    return image_url(kind, filename)
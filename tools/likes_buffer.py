@@ -0,0 +1,135 @@
+import atexit
+import os
+import threading
+import sqlalchemy
+from sqlalchemy.orm.attributes import set_committed_value
+from data import db_session
+from data.article_scores import refresh_scores
+from data.articles import Article
+from tools.cache import data_versions
+from tools.constants import LIKES_FLUSH_INTERVAL, LIKES_FLUSH_THRESHOLD
+
+_articles = Article.__table__
+# Одно выражение для всех статей группы (executemany)
+_ADD_LIKES = sqlalchemy.update(_articles).where(
+    _articles.c.id == sqlalchemy.bindparam("article_id")
+).values(likes_count=_articles.c.likes_count + sqlalchemy.bindparam("delta"))
+
+
+class LikesCountBuffer:
+    """Отложенная запись изменений likes_count. Изменения счётчика каждой статьи
+    суммируются в памяти процесса и записываются одним UPDATE на статью раз в interval
+    секунд, после threshold изменений или при завершении процесса (вместе с оценками
+    статей для ленты sorted_by=hot). Источник истины -
+    записи articles_likes: если изменения потеряны (например, процесс завершился
+    аварийно), счётчики пересчитываются командой manage.py reconcile_likes"""
+    def __init__(self, interval, threshold):
+        self.interval = interval
+        self.threshold = threshold
+        self._deltas = {}  # article_id: ещё не записанное изменение
+        self._flushing = {}  # Изменения, которые записываются сейчас
+        self._count = 0  # Количество изменений с последней записи
+        self._pid = None
+        self._wakeup = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.flushes = self.updates = 0
+
+    def _start(self):
+        """Запуск потока записи в текущем процессе (заново после fork: изменения
+        родительского процесса записывает он сам). Вызывается под self._lock"""
+        if self._pid == os.getpid():
+            return
+        self._deltas, self._flushing, self._count = {}, {}, 0
+        self._pid = os.getpid()
+        self._wakeup = threading.Event()
+        threading.Thread(target=self._run, args=(self._wakeup,), name="likes_flush",
+                         daemon=True).start()
+
+    def add(self, article_id, delta):
+        """Добавление изменения счётчика лайков статьи (после коммита лайка)"""
+        with self._lock:
+            self._start()
+            self._deltas[article_id] = self._deltas.get(article_id, 0) + delta
+            self._count += 1
+            if self._count >= self.threshold:
+                self._wakeup.set()
+
+    def pending(self, article_id):
+        """Ещё не записанное в базу изменение счётчика лайков статьи"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return 0
+            return self._deltas.get(article_id, 0) + self._flushing.get(article_id, 0)
+
+    def merge(self, article):
+        """Учёт ещё не записанных изменений в likes_count объекта Article.
+        Значение устанавливается как загруженное из базы, поэтому при коммите
+        сессии запроса оно не будет записано"""
+        delta = self.pending(article.id)
+        if delta:
+            set_committed_value(article, "likes_count", article.likes_count + delta)
+
+    def _run(self, wakeup):
+        while True:
+            wakeup.wait(self.interval)
+            wakeup.clear()
+            try:
+                self.flush()
+            except Exception as error:  # Изменения остались в буфере до следующей записи
+                print(f"Не удалось записать счётчики лайков: {error!r}")
+
+    def flush(self):
+        """Запись накопленных изменений. Пока запись не завершена, изменения
+        учитываются в pending. Возвращает количество изменённых статей"""
+        with self._flush_lock:
+            with self._lock:
+                if self._pid != os.getpid() or not self._deltas:
+                    return 0
+                self._flushing = {article_id: delta for article_id, delta
+                                  in self._deltas.items() if delta}
+                self._deltas, self._count = {}, 0
+            flushing = self._flushing
+            if flushing:
+                try:
+                    db_session.write(lambda db_sess: self._write(db_sess, flushing))
+                except BaseException:
+                    with self._lock:  # Изменения возвращаются в буфер
+                        for article_id, delta in flushing.items():
+                            self._deltas[article_id] = self._deltas.get(article_id, 0) + delta
+                        self._flushing = {}
+                    raise
+            with self._lock:
+                self.flushes += 1
+                self.updates += len(flushing)
+            return len(flushing)
+
+    def _write(self, db_sess, flushing):
+        db_sess.execute(_ADD_LIKES, [
+            {"article_id": article_id, "delta": delta} for article_id, delta in flushing.items()
+        ])
+        refresh_scores(db_sess, list(flushing))
+        # После коммита изменения убираются из pending раньше, чем сбрасываются
+        # объекты в кэше, заполненные во время записи
+        db_session.after_commit(db_sess, self._clear_flushing)
+        data_versions.bump_after_commit(db_sess, *[
+            f"likes:{article_id}" for article_id in flushing
+        ])
+
+    def _clear_flushing(self):
+        with self._lock:
+            self._flushing = {}
+
+    def stats(self):
+        """Количество статей и изменений, ожидающих записи, и выполненные записи"""
+        with self._lock:
+            return {
+                "pending_articles": len(self._deltas),
+                "pending_changes": self._count,
+                "flushes": self.flushes,
+                "updates": self.updates
+            }
+
+
+likes_buffer = LikesCountBuffer(LIKES_FLUSH_INTERVAL, LIKES_FLUSH_THRESHOLD)
+atexit.register(likes_buffer.flush)  # Запись оставшихся изменений при завершении процесса
@@ -0,0 +1,26 @@
+import json
+from flask import request, Response, stream_with_context
+from tools.image_url import image_field
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def wants_ndjson():
+    """Запрошена ли выгрузка в NDJSON (заголовок Accept: application/x-ndjson).
+    При Accept: */* и без заголовка ответ остаётся в JSON"""
+    return request.accept_mimetypes.best_match(
+        ["application/json", NDJSON_MIMETYPE]
+    ) == NDJSON_MIMETYPE
+
+
+def ndjson_response(records, image_kind=None, image_key="image"):
+    """Потоковый ответ: по одной записи (словарю) в строке. records - генератор,
+    поэтому записи читаются из базы и отправляются клиенту порциями, не накапливаясь
+    в памяти. Изображения (image_key раздела image_kind) выгружаются только ссылками"""
+    def generate():
+        for record in records:
+            if image_kind is not None and image_key in record:
+                record[image_key] = image_field(image_kind, record[image_key], "url")
+            yield json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
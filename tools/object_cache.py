@@ -0,0 +1,56 @@
+from tools.cache import LRUCache, approximate_size, data_versions
+from tools.constants import OBJECT_CACHE_TTL, OBJECT_CACHE_MAX_BYTES
+
+
+class ObjectCache:
+    """Кэш объектов моделей в виде словарей (результатов сериализации) перед методами get_*
+    ModelWorker. Хранилище подключаемое: подходит любой объект с методами get(key),
+    set(key, value) и stats() (по умолчанию - LRUCache в памяти процесса)"""
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(entity, entity_id, fields, dependencies=None):
+        """Ключ содержит версии объекта ("<entity>:<id>"), каскадного удаления
+        и дополнительных наборов данных (dependencies(id) - имена, например "likes:<id>"),
+        поэтому изменённый объект из кэша не вернётся"""
+        names = (f"{entity}:{entity_id}", "cascade")
+        if dependencies is not None:
+            names += tuple(dependencies(entity_id))
+        return entity, entity_id, tuple(fields), data_versions.get(*names)
+
+    def get(self, entity, entity_id, fields, load, dependencies=None):
+        """Словарь с полями fields объекта entity ("article", "comment" или "user").
+        При промахе значение вычисляется функцией load"""
+        key = self._key(entity, entity_id, fields, dependencies)
+        value = self.backend.get(key)
+        if value is None:
+            value = load()
+            self.backend.set(key, value)
+        return dict(value)  # Вызывающий код может изменять словарь (например, поле image)
+
+    def get_many(self, entity, entity_ids, fields, load_many, dependencies=None):
+        """Словари с полями fields объектов entity по списку id ({id: словарь},
+        несуществующие объекты пропускаются). Объекты, которых нет в кэше,
+        загружаются одним вызовом load_many(ids), возвращающим такой же словарь"""
+        keys = {entity_id: self._key(entity, entity_id, fields, dependencies)
+                for entity_id in entity_ids}
+        values = {}
+        for entity_id, key in keys.items():
+            value = self.backend.get(key)
+            if value is not None:
+                values[entity_id] = value
+        missing = [entity_id for entity_id in keys if entity_id not in values]
+        if missing:
+            for entity_id, value in load_many(missing).items():
+                self.backend.set(keys[entity_id], value)
+                values[entity_id] = value
+        return {entity_id: dict(value) for entity_id, value in values.items()}
+
+    def stats(self):
+        """Статистика хранилища кэша"""
+        return self.backend.stats()
+
+
+object_cache = ObjectCache(LRUCache(OBJECT_CACHE_MAX_BYTES, OBJECT_CACHE_TTL,
+                                    weigher=approximate_size))
@@ -0,0 +1,52 @@
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+from tools.cache import LRUCache, data_versions
+from tools.constants import PAGE_CACHE_TTL, PAGE_CACHE_STALE_TTL, PAGE_CACHE_MAX_BYTES
+
+PAGE_CACHE_ARGS = ("sorted_by", "cursor")  # Параметры запроса, от которых зависит страница
+
+page_cache = LRUCache(PAGE_CACHE_MAX_BYTES, PAGE_CACHE_TTL, PAGE_CACHE_STALE_TTL,
+                      weigher=lambda page: len(page[0]))
+
+
+def cached_page(dependencies, session_keys=()):
+    """Декоратор кэширования отрисованной страницы для неавторизованных пользователей.
+    dependencies(**view_args) возвращает имена наборов данных страницы из data_versions
+    ("feed" - списки статей, "users" - данные пользователей, "article:<id>" - статья
+    с комментариями),
+    session_keys - значения сессии, которые читает представление.
+    Изменения сессии, сделанные представлением (например, sorted_by), повторяются
+    при выдаче страницы из кэша"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            if current_user.is_authenticated or request.method != "GET":
+                return view(**view_args)
+            key = (
+                request.endpoint, tuple(sorted(view_args.items())),
+                tuple(request.args.get(name) for name in PAGE_CACHE_ARGS),
+                tuple(session.get(name) for name in session_keys),
+                data_versions.get(*dependencies(**view_args))
+            )
+            page, refresh = page_cache.lookup(key)
+            if not refresh:
+                body, content_type, session_changes = page
+                session.update(session_changes)
+                return make_response(body, 200, {"Content-Type": content_type})
+            session_before = dict(session)
+            try:
+                response = make_response(view(**view_args))
+            except Exception:  # Например, abort(404) для удалённой статьи
+                page_cache.delete(key)
+                raise
+            if response.status_code != 200 or response.is_streamed:
+                page_cache.delete(key)
+            else:
+                session_changes = {name: value for name, value in session.items()
+                                   if session_before.get(name) != value}
+                page_cache.set(key, (response.get_data(), response.content_type,
+                                     session_changes))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,99 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from werkzeug.security import generate_password_hash, check_password_hash
+from tools.constants import PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH, \
+    PASSWORD_HASHING_WORKERS, PASSWORD_HASHING_QUEUE_SIZE
+from tools.errors import PasswordHashingBusyError
+
+
+class _Hasher:
+    """Пул потоков хэширования паролей текущего процесса и его статистика.
+    PBKDF2 (hashlib) отпускает GIL, поэтому хэширование в пуле не останавливает
+    остальные потоки запросов, а размер пула ограничивает занимаемое им время процессора"""
+    executor = None
+    pid = None
+    slots = None
+    lock = threading.Lock()
+    metrics = {}  # operation: [count, rejected, wait_seconds, work_seconds, max_seconds]
+
+
+def _get_executor():
+    """Пул создаётся при первом хэшировании (заново после fork)"""
+    with _Hasher.lock:
+        if _Hasher.executor is None or _Hasher.pid != os.getpid():
+            _Hasher.executor = ThreadPoolExecutor(PASSWORD_HASHING_WORKERS,
+                                                  thread_name_prefix="password_hashing")
+            _Hasher.pid = os.getpid()
+            # Выполняющиеся и ожидающие в очереди задачи
+            _Hasher.slots = threading.BoundedSemaphore(
+                PASSWORD_HASHING_WORKERS + PASSWORD_HASHING_QUEUE_SIZE
+            )
+        return _Hasher.executor, _Hasher.slots
+
+
+def _record(operation, rejected=False, wait_seconds=0.0, work_seconds=0.0):
+    with _Hasher.lock:
+        metrics = _Hasher.metrics.setdefault(operation, [0, 0, 0.0, 0.0, 0.0])
+        if rejected:
+            metrics[1] += 1
+            return
+        metrics[0] += 1
+        metrics[2] += wait_seconds
+        metrics[3] += work_seconds
+        metrics[4] = max(metrics[4], wait_seconds + work_seconds)
+
+
+def _run(operation, function, *args):
+    """Выполнение функции в пуле с ожиданием результата. Если пул и очередь заполнены,
+    сразу вызывается PasswordHashingBusyError (запрос отклоняется с кодом 503)"""
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        _record(operation, rejected=True)
+        raise PasswordHashingBusyError
+    submitted = perf_counter()
+
+    def timed():
+        started = perf_counter()
+        return function(*args), started, perf_counter()
+
+    try:
+        result, started, finished = executor.submit(timed).result()
+    finally:
+        slots.release()
+    _record(operation, wait_seconds=started - submitted, work_seconds=finished - started)
+    return result
+
+
+def hash_password(password):
+    """Хэш пароля с текущими параметрами (PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH)"""
+    return _run("hash", generate_password_hash, password, PASSWORD_HASH_METHOD,
+                PASSWORD_SALT_LENGTH)
+
+
+def verify_password(password_hash, password):
+    """Проверка пароля по хэшу (с параметрами, с которыми хэш был создан)"""
+    return _run("verify", check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Создан ли хэш с устаревшими параметрами (хэш имеет вид "метод$соль$значение")"""
+    method, _, rest = password_hash.partition("$")
+    return method != PASSWORD_HASH_METHOD or len(rest.partition("$")[0]) != PASSWORD_SALT_LENGTH
+
+
+def stats():
+    """Статистика по операциям: количество, отклонённые при заполненной очереди,
+    среднее время ожидания в очереди и выполнения, максимальное общее время (в мс)"""
+    with _Hasher.lock:
+        return {
+            operation: {
+                "count": count,
+                "rejected": rejected,
+                "avg_wait_ms": round(wait_seconds / count * 1000, 2) if count else None,
+                "avg_work_ms": round(work_seconds / count * 1000, 2) if count else None,
+                "max_ms": round(max_seconds * 1000, 2)
+            } for operation, (count, rejected, wait_seconds, work_seconds, max_seconds)
+            in _Hasher.metrics.items()
+        }
@@ -0,0 +1,21 @@
+from flask_login import UserMixin
+from tools.cache import LRUCache
+from tools.constants import PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_SIZE
+
+
+class Principal(UserMixin):
+    """Авторизованный пользователь (current_user) без загрузки модели User: только поля,
+    которые нужны шаблонам (base.html) и проверкам прав (user_can_delete).
+    Сравнивается с User по id (UserMixin.__eq__)"""
+    def __init__(self, id, nickname, avatar, is_moderator, is_admin):
+        self.id = id
+        self.nickname = nickname
+        self.avatar = avatar
+        self.is_moderator = bool(is_moderator)
+        self.is_admin = bool(is_admin)
+
+    def __repr__(self):
+        return f"<Principal #{self.id}> @{self.nickname}"
+
+
+principal_cache = LRUCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
@@ -0,0 +1,53 @@
+from functools import lru_cache
+import sqlalchemy
+
+# Форматы SerializerMixin.to_dict, чтобы ответы API не изменились
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def _converter(column):
+    """Преобразование значения столбца в JSON-совместимое (None, если не требуется)"""
+    column_type = column.expression.type
+    if isinstance(column_type, sqlalchemy.DateTime):
+        return lambda value: value.strftime(DATETIME_FORMAT)
+    if isinstance(column_type, sqlalchemy.Date):
+        return lambda value: value.strftime(DATE_FORMAT)
+    return None
+
+
+@lru_cache(maxsize=256)
+def compile_serializer(model, fields, extra_columns=()):
+    """Столбцы запроса и функция преобразования строки результата в словарь
+    для набора полей модели (fields - кортеж имён столбцов). Кэшируется по набору полей.
+    extra_columns - столбцы, которые нужны запросу (например, ключ сортировки для курсора),
+    но не попадают в словарь: они выбираются после полей"""
+    fields = tuple(dict.fromkeys(fields))  # Без повторов с сохранением порядка
+    columns = tuple(getattr(model, field) for field in fields) + tuple(
+        column for column in extra_columns if column.key not in fields
+    )
+    converters = tuple(
+        (field, converter) for field, converter in
+        ((field, _converter(column)) for field, column in zip(fields, columns))
+        if converter is not None
+    )
+
+    if not converters:
+        def serialize(row):
+            return dict(zip(fields, row))  # Лишние столбцы в конце строки отбрасываются
+    else:
+        def serialize(row):
+            result = dict(zip(fields, row))
+            for field, converter in converters:
+                if result[field] is not None:
+                    result[field] = converter(result[field])
+            return result
+
+    return columns, serialize
+
+
+def serializer_for(model, fields, extra_columns=()):
+    """compile_serializer для полей, полученных из запроса (список или кортеж)"""
+    if not fields:  # Предотвращение ситуации, в которой вернулись бы значения всех полей
+        fields = ("id",)
+    return compile_serializer(model, tuple(fields), tuple(extra_columns))
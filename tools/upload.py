@@ -0,0 +1,73 @@
+import os
+from hashlib import sha256
+from tempfile import mkstemp
+from flask import request
+from tools.constants import IMAGES_INCOMING_DIR, IMAGES_MAX_UPLOAD_SIZE, IMAGES_UPLOAD_CHUNK_SIZE
+from tools.errors import IncorrectImageError, ImageTooLargeError
+from tools.image_processing import IMAGE_HEADER_SIZE, check_image, sniff_image_format
+
+# Допустимый размер полей и заголовков multipart/form-data сверх размера изображения
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class SpooledImage:
+    """Загруженное изображение во временном файле (в каталоге IMAGES_INCOMING_DIR,
+    чтобы файл можно было переместить к ожидающим обработки без копирования)"""
+    def __init__(self, path, file_hash, size):
+        self.path = path
+        self.hash = file_hash
+        self.size = size
+
+    def discard(self):
+        """Удаление временного файла (если он ещё не перемещён)"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def spool_image(stream, max_size=IMAGES_MAX_UPLOAD_SIZE):
+    """Запись потока во временный файл блоками по IMAGES_UPLOAD_CHUNK_SIZE с подсчётом хэша.
+    Формат проверяется по первым байтам, размер - по мере чтения, поэтому неподходящий
+    файл отклоняется, не дочитываясь (IncorrectImageError, ImageTooLargeError).
+    После записи размеры изображения проверяются по заголовку файла"""
+    os.makedirs(IMAGES_INCOMING_DIR, exist_ok=True)
+    descriptor, path = mkstemp(suffix=".upload", dir=IMAGES_INCOMING_DIR)
+    digest = sha256()
+    header = b""
+    size = 0
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            for chunk in iter(lambda: stream.read(IMAGES_UPLOAD_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if size > max_size:
+                    raise ImageTooLargeError
+                if len(header) < IMAGE_HEADER_SIZE:
+                    header += chunk[:IMAGE_HEADER_SIZE - len(header)]
+                    if len(header) == IMAGE_HEADER_SIZE and sniff_image_format(header) is None:
+                        raise IncorrectImageError
+                digest.update(chunk)
+                file.write(chunk)
+        if len(header) < IMAGE_HEADER_SIZE:
+            raise IncorrectImageError
+        check_image(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return SpooledImage(path, digest.hexdigest(), size)
+
+
+def spool_request_image(field="image"):
+    """Изображение из тела текущего запроса: application/octet-stream (тело запроса -
+    файл) или multipart/form-data (файл в поле field). Запрос с заголовком
+    Content-Length больше допустимого отклоняется до чтения тела"""
+    is_multipart = request.mimetype == "multipart/form-data"
+    max_length = IMAGES_MAX_UPLOAD_SIZE + (MULTIPART_OVERHEAD if is_multipart else 0)
+    if request.content_length is not None and request.content_length > max_length:
+        raise ImageTooLargeError
+    if not is_multipart:
+        return spool_image(request.stream)
+    file_storage = request.files.get(field)
+    if file_storage is None:
+        raise IncorrectImageError
+    return spool_image(file_storage.stream)
@@ -0,0 +1,8 @@
+"""Точка входа WSGI для production-сервера (несколько процессов с потоками):
+gunicorn -c gunicorn.conf.py wsgi:app
+Приложение загружается без подключения к базе данных, подключение создаётся в каждом
+воркере после fork (post_fork в gunicorn.conf.py)"""
+
+from main import create_app
+
+app = create_app(init_db=False)